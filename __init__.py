@@ -35,16 +35,23 @@ bl_info = {
 }
 
 import bpy
+import os
+import time
+import traceback
 
 try:
     from . import mixamoroot
+    from . import export
 except SystemError:
     import mixamoroot
+    import export
 
 if "bpy" in locals():
     from importlib import reload
     if "mixamoroot" in locals():
         reload(mixamoroot)
+    if "export" in locals():
+        reload(export)
 
 class MixamoPropertyGroup(bpy.types.PropertyGroup):
     '''Property container for options and paths of Mixamo Root'''
@@ -66,12 +73,47 @@ class MixamoPropertyGroup(bpy.types.PropertyGroup):
         maxlen = 256,
         default = "mixamorig:",
         subtype='NONE')
+    target_prefix: bpy.props.StringProperty(
+        name="Target Prefix",
+        description="Prefix that replaces the Name Prefix when Remove Prefix is set, empty to just remove it",
+        maxlen = 256,
+        default = "",
+        subtype='NONE')
     source_directory: bpy.props.StringProperty(
         name="Source Directory",
         description="Path to directory containing mixamo animation files (.fbx)",
         maxlen = 256,
         default = "",
         subtype='DIR_PATH')
+    recursive: bpy.props.BoolProperty(
+        name="Include Sub Folders",
+        description="Also imports the matching files in sub folders of the source directory",
+        default=False)
+    file_pattern: bpy.props.StringProperty(
+        name="File Pattern",
+        description="Only files matching this pattern are imported (case insensitive)",
+        maxlen = 256,
+        default = "*.fbx")
+    file_order: bpy.props.EnumProperty(
+        name="Order",
+        description="Order in which the files are imported",
+        items=[('name', "Name", "By path"),
+               ('size', "Smallest First", "By file size, smallest first"),
+               ('size_desc', "Largest First", "By file size, largest first"),
+               ('manifest', "Manifest", "In the order listed in the manifest file, unlisted files follow by name")],
+        default='name')
+    manifest: bpy.props.StringProperty(
+        name="Manifest",
+        description="Text file listing the files to import first, one path relative to the source directory per line",
+        maxlen = 1024,
+        default = "",
+        subtype='FILE_PATH')
+    prefetch: bpy.props.IntProperty(
+        name="Prefetch",
+        description="Number of files read ahead in the background while the current one is imported (0 to turn off). Helps on network drives and cold disks",
+        default=4,
+        min=0,
+        max=64)
     remove_prefix: bpy.props.BoolProperty(
         name="Remove Prefix",
         description="Remove prefix from armature component names",
@@ -80,6 +122,131 @@ class MixamoPropertyGroup(bpy.types.PropertyGroup):
         name="Insert Root",
         description="Inserts a root bone at the base of the model aligned with the hip's horizontal plane coordinates",
         default=False)
+    root_ground: bpy.props.BoolProperty(
+        name="Ground Root",
+        description="The root bone only follows the hips along the ground plane, the height stays on the hips",
+        default=False)
+    root_clamp_floor: bpy.props.BoolProperty(
+        name="Clamp To Floor",
+        description="The root bone never goes below the floor, the hips keep whatever is cut off",
+        default=False)
+    root_yaw: bpy.props.BoolProperty(
+        name="Root Heading",
+        description="The root bone also follows the heading (rotation around the up axis) of the hips",
+        default=False)
+    root_world: bpy.props.BoolProperty(
+        name="World Space Hips",
+        description="Takes the root motion from where the hips actually are, evaluated through the armature's rest pose, instead of their raw location keys. Needed when the hips are oriented differently from the root",
+        default=False)
+    reduce_keys: bpy.props.BoolProperty(
+        name="Reduce Keyframes",
+        description="Removes keyframes that can be interpolated from their neighbours within the tolerances below",
+        default=False)
+    reduce_location: bpy.props.FloatProperty(
+        name="Location Tolerance",
+        description="Largest allowed location error when removing keyframes, in the action's units",
+        default=0.0005,
+        min=0.0,
+        precision=5)
+    reduce_rotation: bpy.props.FloatProperty(
+        name="Rotation Tolerance",
+        description="Largest allowed rotation error (quaternion component or radians) when removing keyframes",
+        default=0.0005,
+        min=0.0,
+        precision=5)
+    reduce_scale: bpy.props.FloatProperty(
+        name="Scale Tolerance",
+        description="Largest allowed scale error when removing keyframes",
+        default=0.0005,
+        min=0.0,
+        precision=5)
+    compute_threads: bpy.props.IntProperty(
+        name="Threads",
+        description="Threads processing the keyframes of many actions at once (root motion, resampling, key reduction), for 'Animation Only' imports and 'Add Root'. 0 processes every file right after reading it",
+        default=0,
+        min=0,
+        max=64)
+    resample: bpy.props.BoolProperty(
+        name="Resample",
+        description="Resamples every imported action to one key per frame at the target frame rate and moves it to start at the start frame. Also sets the scene to that frame rate",
+        default=False)
+    resample_fps: bpy.props.FloatProperty(
+        name="Frame Rate",
+        description="Frame rate the actions are resampled to (0 keeps each clip's keys and only moves them)",
+        default=30.0,
+        min=0.0,
+        max=240.0)
+    resample_start: bpy.props.IntProperty(
+        name="Start Frame",
+        description="Frame every resampled action starts at",
+        default=0)
+    unit_scale: bpy.props.FloatProperty(
+        name="Unit Scale",
+        description="Scale applied to imported location keyframes, the default converts mixamo's centimeters to meters",
+        default=0.01,
+        min=0.0,
+        precision=4)
+    animation_only: bpy.props.BoolProperty(
+        name="Animation Only",
+        description="Fully imports only the first file (or uses the selected armature) and reads just the animation curves of every other file onto it, matched by bone name. No objects, meshes or materials are created for them and the armature is left selected. For animation only downloads of the same character",
+        default=False)
+    use_cache: bpy.props.BoolProperty(
+        name="Use Cache",
+        description="Keeps processed clips in a cache directory and only re-imports files that changed since the last import. Cached clips are restored as actions only",
+        default=False)
+    cache_directory: bpy.props.StringProperty(
+        name="Cache Directory",
+        description="Directory for processed clips, defaults to a .mixamoroot_cache folder in the source directory",
+        maxlen = 256,
+        default = "",
+        subtype='DIR_PATH')
+    cache_size: bpy.props.IntProperty(
+        name="Cache Size (MB)",
+        description="Least recently used clips are removed from the cache above this size",
+        default=512,
+        min=1)
+    use_journal: bpy.props.BoolProperty(
+        name="Journal",
+        description="Records the outcome of every file in a .mixamoroot_journal.jsonl file in the source directory, so an interrupted or partially failed import can be resumed",
+        default=False)
+    resume: bpy.props.BoolProperty(
+        name="Resume",
+        description="Skips the files the journal has as completed. Their actions are taken from this file, or appended from the Resume File if they are missing here",
+        default=False)
+    resume_blend: bpy.props.StringProperty(
+        name="Resume File",
+        description="Saved output .blend of the interrupted import, used to reload the actions of completed files",
+        maxlen = 1024,
+        default = "",
+        subtype='FILE_PATH')
+    continue_on_error: bpy.props.BoolProperty(
+        name="Continue On Error",
+        description="Records files that fail to import in the journal and carries on with the next file instead of stopping",
+        default=False)
+    checkpoint_every: bpy.props.IntProperty(
+        name="Save Every",
+        description="Saves the blend file after this many imported files (0 to never), so a crash loses at most that many. Needs the file to be saved once",
+        default=0,
+        min=0)
+    batch_session: bpy.props.BoolProperty(
+        name="Low Memory",
+        description="Turns undo off during the import and removes the meshes, materials and images each file leaves behind right after it. Memory use is printed per file",
+        default=False)
+    memory_budget: bpy.props.IntProperty(
+        name="Memory Budget (MB)",
+        description="When Blender gets close to this much memory, imported actions no object uses are written to a library file in a .mixamoroot_session folder of the source directory and removed (0 to never)",
+        default=0,
+        min=0)
+    profile: bpy.props.BoolProperty(
+        name="Profile",
+        description="Times every stage of the import and writes a JSON and CSV report",
+        default=False)
+    profile_directory: bpy.props.StringProperty(
+        name="Report Directory",
+        description="Directory for the profile reports, defaults to a .mixamoroot_profile folder in the source directory",
+        maxlen = 256,
+        default = "",
+        subtype='DIR_PATH')
     delete_armatures: bpy.props.BoolProperty(
         name="Delete Armatures",
         description="Deletes all but one imported armature in the blend file. This assumes you've imported mixamo armatures for animations all applied to the same model",
@@ -88,46 +255,225 @@ class MixamoPropertyGroup(bpy.types.PropertyGroup):
         name="Delete Armatures",
         description="Deletes all armatures for applied animations after the process is complete",
         default=False)
+    library_path: bpy.props.StringProperty(
+        name="Library File",
+        description="Animation library file (.mxlib) holding processed actions, loads much faster than importing the fbx files again",
+        maxlen = 1024,
+        default = "",
+        subtype='FILE_PATH')
+    library_filter: bpy.props.StringProperty(
+        name="Clips",
+        description="Only clips whose name matches this pattern are loaded from the library",
+        maxlen = 256,
+        default = "*")
+    similar_count: bpy.props.IntProperty(
+        name="Matches",
+        description="Number of similar clips listed by Find Similar Clips",
+        default=5,
+        min=1,
+        max=50)
+    export_directory: bpy.props.StringProperty(
+        name="Export Directory",
+        description="Directory the glTF files are written to",
+        maxlen = 1024,
+        default = "",
+        subtype='DIR_PATH')
+    export_format: bpy.props.EnumProperty(
+        name="Format",
+        description="glTF file format",
+        items=[('GLB', "glTF Binary (.glb)", "Single binary file"),
+               ('GLTF_SEPARATE', "glTF Separate (.gltf + .bin)", "JSON with a separate binary buffer")],
+        default='GLB')
+    export_per_action: bpy.props.BoolProperty(
+        name="File Per Action",
+        description="Writes one file per action instead of one file with every action, actions unchanged since the last export are skipped",
+        default=False)
+    export_workers: bpy.props.IntProperty(
+        name="Workers",
+        description="Background blender processes exporting actions in parallel (1 exports in this blender)",
+        default=4,
+        min=1,
+        max=64)
     push_nla: bpy.props.BoolProperty(
         name="Push To NLA",
         description="Pushes all the actions created for the control rig to the NLA",
         default=False)
+    nla_layout: bpy.props.EnumProperty(
+        name="NLA Layout",
+        description="How pushed actions are placed on the NLA",
+        items=[('TRACK', "Track Per Clip", "Every action on a new track of its own"),
+               ('PACK', "Pack", "Actions one after another on at most [Tracks] tracks"),
+               ('CATEGORY', "By Category", "Actions one after another on one track per category, the first word of the clip name")],
+        default='TRACK')
+    nla_tracks: bpy.props.IntProperty(
+        name="Tracks",
+        description="Number of tracks the actions are packed on",
+        default=4,
+        min=1,
+        max=64)
+    nla_gap: bpy.props.IntProperty(
+        name="Gap",
+        description="Frames left empty between two strips on a track",
+        default=10,
+        min=0)
+    nla_manifest: bpy.props.BoolProperty(
+        name="Write Manifest",
+        description="Writes a JSON manifest of clip name to track and frame range after pushing",
+        default=False)
+    nla_manifest_path: bpy.props.StringProperty(
+        name="Manifest File",
+        description="Manifest of the NLA layout, defaults to a .nla.json file next to the blend file",
+        maxlen = 1024,
+        default = "",
+        subtype='FILE_PATH')
+    fast_retarget: bpy.props.BoolProperty(
+        name="Fast Retarget",
+        description="Bakes the animations onto the control rig directly, matching bones by name (without prefixes). Does not drive IK controls, only bones that exist on both rigs",
+        default=False)
+
+# Status line of the running (or last) import, drawn in the panel
+import_status = ""
 
 class OBJECT_OT_ImportAnimations(bpy.types.Operator):
     '''Operator for importing animations and inserting root bones'''
     bl_idname = "mixamo.importanim"
     bl_label = "Import Animations"
-    bl_description = "Imports all mixamo animations from the [Source Directory], insert root bones, and merges into a single armature"
+    bl_description = "Imports all mixamo animations from the [Source Directory], insert root bones, and merges into a single armature. Press ESC to stop after the current file"
 
-    def execute(self, context):
+    # Seconds of importing per timer tick before the UI gets a chance to redraw and handle ESC
+    TIME_BUDGET = 0.25
+    running = False
+
+    def import_settings(self, context):
+        # Keyword arguments for get_all_anims/iter_all_anims, None if the settings are not valid
         mixamo = context.scene.mixamo
         source_directory = mixamo.source_directory
         hip_name = mixamo.hip_name
         root_name = mixamo.root_name
         name_prefix = mixamo.name_prefix
+        target_prefix = mixamo.target_prefix
         remove_prefix = mixamo.remove_prefix
         insert_root = mixamo.insert_root
         delete_armatures = mixamo.delete_armatures
+        unit_scale = mixamo.unit_scale
+        animation_only = mixamo.animation_only
+        root_motion = {'project_ground': mixamo.root_ground, 'clamp_floor': mixamo.root_clamp_floor, 'use_yaw': mixamo.root_yaw,
+                       'world_space': mixamo.root_world}
+        key_reduction = None
+        if mixamo.reduce_keys:
+            key_reduction = {'location': mixamo.reduce_location, 'rotation': mixamo.reduce_rotation, 'scale': mixamo.reduce_scale}
+        resampling = None
+        if mixamo.resample:
+            resampling = {'fps': mixamo.resample_fps, 'start_frame': float(mixamo.resample_start)}
+        use_cache = mixamo.use_cache
+        cache_directory = bpy.path.abspath(mixamo.cache_directory) if mixamo.cache_directory else ""
+        cache_size = mixamo.cache_size
         if source_directory == '':
             self.report({'ERROR_INVALID_INPUT'}, "Error: no Source Directory set.")
-            return{ 'CANCELLED'}
+            return None
         if hip_name == '':
             self.report({'ERROR_INVALID_INPUT'}, "Error: no Hip Bone Name set.")
-            return{ 'CANCELLED'}
+            return None
         if root_name == '':
             self.report({'ERROR_INVALID_INPUT'}, "Error: no Root Bone Name set.")
-            return{ 'CANCELLED'}
+            return None
         if remove_prefix == True:
             self.report({'WARNING'}, "Remove Prefix set to true, armature components will have their mixamo prefix removed.")
         if delete_armatures == True:
             self.report({'WARNING'}, "Delete Armatures set to true, imported animation armatures will be removed.")
-        mixamoroot.get_all_anims(
-            bpy.path.abspath(source_directory),
+        return dict(
+            source_dir=bpy.path.abspath(source_directory),
             root_bone_name=root_name,
             hip_bone_name=hip_name,
-            remove_prefix=remove_prefix, name_prefix=name_prefix, insert_root=insert_root, delete_armatures=delete_armatures)
+            remove_prefix=remove_prefix, name_prefix=name_prefix, insert_root=insert_root, delete_armatures=delete_armatures, unit_scale=unit_scale, animation_only=animation_only,
+            use_cache=use_cache, cache_directory=cache_directory, cache_size=cache_size, root_motion=root_motion, key_reduction=key_reduction,
+            target_prefix=target_prefix,
+            profile=mixamo.profile, profile_directory=bpy.path.abspath(mixamo.profile_directory) if mixamo.profile_directory else "",
+            profile_info={'addon_version': ".".join(str(x) for x in bl_info['version'])},
+            use_journal=mixamo.use_journal, resume=mixamo.use_journal and mixamo.resume, continue_on_error=mixamo.continue_on_error,
+            resume_blend=bpy.path.abspath(mixamo.resume_blend) if mixamo.resume_blend else "",
+            checkpoint_every=mixamo.checkpoint_every if mixamo.use_journal else 0,
+            recursive=mixamo.recursive, pattern=mixamo.file_pattern or "*.fbx", order=mixamo.file_order,
+            manifest=bpy.path.abspath(mixamo.manifest) if mixamo.file_order == 'manifest' and mixamo.manifest else "",
+            prefetch=mixamo.prefetch,
+            batch_session=mixamo.batch_session, memory_budget=mixamo.memory_budget if mixamo.batch_session else 0,
+            resampling=resampling, workers=mixamo.compute_threads)
+
+    def execute(self, context):
+        settings = self.import_settings(context)
+        if settings is None:
+            return{ 'CANCELLED'}
+        mixamoroot.get_all_anims(**settings)
         return{ 'FINISHED'}
 
+    def invoke(self, context, event):
+        # From the UI the import runs modal, a time slice per timer tick, so blender stays responsive
+        if OBJECT_OT_ImportAnimations.running:
+            self.report({'WARNING'}, "An import is already running")
+            return{ 'CANCELLED'}
+        settings = self.import_settings(context)
+        if settings is None:
+            return{ 'CANCELLED'}
+        self._anims = mixamoroot.iter_all_anims(**settings)
+        try:
+            self._done, self._total, self._file = next(self._anims)
+        except StopIteration:
+            self.report({'INFO'}, "No files in the Source Directory")
+            return{ 'CANCELLED'}
+        except Exception as e:
+            traceback.print_exc()
+            self._anims.close()
+            self.report({'ERROR'}, "Import failed: %s, see the console" % e)
+            return{ 'CANCELLED'}
+        OBJECT_OT_ImportAnimations.running = True
+        wm = context.window_manager
+        wm.progress_begin(0, self._total)
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        self.set_status(context, "Importing %d of %d: %s" % (1, self._total, self._file))
+        return{ 'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            # The file in progress already finished in the last tick
+            self._anims.close()
+            return self.finish(context, "Cancelled after %d of %d files" % (self._done, self._total), {'CANCELLED'})
+        if event.type != 'TIMER' or event.timer is not self._timer:
+            return{ 'PASS_THROUGH'}
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.TIME_BUDGET:
+            try:
+                self._done, self._total, self._file = next(self._anims)
+            except StopIteration as done:
+                if done.value == -1:
+                    return self.finish(context, "Stopped on an error after %d of %d files, see the console" % (self._done, self._total), {'CANCELLED'})
+                return self.finish(context, "Imported %d files" % self._total, {'FINISHED'})
+            except Exception as e:
+                # Raised outside the per file error handling, the import can not go on
+                traceback.print_exc()
+                self._anims.close()
+                return self.finish(context, "Import failed after %d of %d files: %s, see the console" % (self._done, self._total, e),
+                                   {'CANCELLED'}, 'ERROR')
+        context.window_manager.progress_update(self._done)
+        self.set_status(context, "Importing %d of %d: %s" % (self._done + 1, self._total, self._file))
+        return{ 'RUNNING_MODAL'}
+
+    def finish(self, context, status, result, level='INFO'):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        OBJECT_OT_ImportAnimations.running = False
+        self.set_status(context, status)
+        self.report({level}, status)
+        return result
+
+    def set_status(self, context, status):
+        global import_status
+        import_status = status
+        for area in context.window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
 class OBJECT_OT_ApplyAnimations(bpy.types.Operator):
     '''Operator for applying all imported animations to a target control rig'''
     bl_idname = "mixamo.applyanims"
@@ -140,12 +486,140 @@ class OBJECT_OT_ApplyAnimations(bpy.types.Operator):
         delete_applied_armatures = mixamo.delete_applied_armatures
         control_rig = mixamo_control_rig
         push_nla = mixamo.push_nla
+        fast_retarget = mixamo.fast_retarget
         if control_rig == '' or control_rig == None or bpy.data.objects[control_rig.name].type != "ARMATURE":
             self.report({'ERROR_INVALID_INPUT'}, "Error: No valid control rig armature selected")
             return{ 'CANCELLED'}
         if delete_applied_armatures == True:
             self.report({'WARNING'}, "Delete Armatures set to true, imported animation armatures will be removed.")
-        mixamoroot.apply_all_anims(delete_applied_armatures=delete_applied_armatures, control_rig=control_rig, push_nla=push_nla)
+        nla_options = None
+        if mixamo.nla_layout != 'TRACK':
+            nla_options = {'mode': mixamo.nla_layout.lower(), 'max_tracks': mixamo.nla_tracks, 'gap': mixamo.nla_gap}
+        manifest_path = mixamo.nla_manifest_path if mixamo.nla_manifest else None
+        mixamoroot.apply_all_anims(delete_applied_armatures=delete_applied_armatures, control_rig=control_rig, push_nla=push_nla,
+                                   fast_retarget=fast_retarget, name_prefix=mixamo.name_prefix, nla_options=nla_options,
+                                   manifest_path=manifest_path)
+        return{ 'FINISHED'}
+
+class OBJECT_OT_ExportNLAManifest(bpy.types.Operator):
+    '''Operator for writing the NLA layout of the control rig as a manifest'''
+    bl_idname = "mixamo.exportnlamanifest"
+    bl_label = "Export NLA Manifest"
+    bl_description = "Writes clip name, track and frame range of every strip on the control rig's NLA to the [Manifest File]"
+
+    def execute(self, context):
+        control_rig = context.scene.mixamo_control_rig
+        if control_rig is None or control_rig.animation_data is None:
+            self.report({'ERROR_INVALID_INPUT'}, "Error: The control rig has no NLA tracks")
+            return{ 'CANCELLED'}
+        path = mixamoroot.export_nla_manifest(control_rig, context.scene.mixamo.nla_manifest_path)
+        self.report({'INFO'}, "Wrote " + path)
+        return{ 'FINISHED'}
+
+class OBJECT_OT_SaveLibrary(bpy.types.Operator):
+    '''Operator for saving all actions into an animation library file'''
+    bl_idname = "mixamo.savelibrary"
+    bl_label = "Save Library"
+    bl_description = "Saves all actions in the blend file into the [Library File]"
+
+    def execute(self, context):
+        library_path = context.scene.mixamo.library_path
+        if library_path == '':
+            self.report({'ERROR_INVALID_INPUT'}, "Error: no Library File set.")
+            return{ 'CANCELLED'}
+        filepath = bpy.path.abspath(library_path)
+        if not filepath.lower().endswith(mixamoroot.animlib.EXTENSION):
+            filepath += mixamoroot.animlib.EXTENSION
+        count = mixamoroot.save_library(filepath)
+        self.report({'INFO'}, "Saved %d actions to %s" % (count, filepath))
+        return{ 'FINISHED'}
+
+class OBJECT_OT_LoadLibrary(bpy.types.Operator):
+    '''Operator for loading actions from an animation library file'''
+    bl_idname = "mixamo.loadlibrary"
+    bl_label = "Load Library"
+    bl_description = "Loads the clips matching [Clips] from the [Library File] as actions"
+
+    def execute(self, context):
+        mixamo = context.scene.mixamo
+        filepath = bpy.path.abspath(mixamo.library_path)
+        if mixamo.library_path == '' or not os.path.exists(filepath):
+            self.report({'ERROR_INVALID_INPUT'}, "Error: Library File not found.")
+            return{ 'CANCELLED'}
+        try:
+            loaded = mixamoroot.load_library(filepath, mixamo.library_filter or "*")
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return{ 'CANCELLED'}
+        self.report({'INFO'}, "Loaded %d actions" % len(loaded))
+        return{ 'FINISHED'}
+
+class OBJECT_OT_BuildMotionIndex(bpy.types.Operator):
+    '''Operator for building the motion feature index of all actions'''
+    bl_idname = "mixamo.buildmotionindex"
+    bl_label = "Build Motion Index"
+    bl_description = "Computes motion features (root velocity, heading change, feet, hands and head) of all actions on the selected armature's skeleton and saves the search index next to the blend file"
+
+    def execute(self, context):
+        mixamo = context.scene.mixamo
+        armature = context.object
+        if armature is None or armature.type != 'ARMATURE':
+            self.report({'ERROR_INVALID_INPUT'}, "Error: select the armature the actions belong to.")
+            return{ 'CANCELLED'}
+        try:
+            index, path = mixamoroot.build_motion_index(armature, name_prefix=mixamo.name_prefix, root_bone_name=mixamo.root_name)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return{ 'CANCELLED'}
+        self.report({'INFO'}, "Indexed %d actions to %s" % (len(index.clip_names), path))
+        return{ 'FINISHED'}
+
+class OBJECT_OT_FindSimilarClips(bpy.types.Operator):
+    '''Operator for listing the clips most similar to the active action'''
+    bl_idname = "mixamo.findsimilar"
+    bl_label = "Find Similar Clips"
+    bl_description = "Lists the indexed clips whose motion is closest to the selected armature's active action"
+
+    def execute(self, context):
+        armature = context.object
+        if armature is None or armature.animation_data is None or armature.animation_data.action is None:
+            self.report({'ERROR_INVALID_INPUT'}, "Error: select an armature with an active action.")
+            return{ 'CANCELLED'}
+        try:
+            matches = mixamoroot.similar_clips(armature.animation_data.action.name, context.scene.mixamo.similar_count)
+        except (FileNotFoundError, KeyError) as e:
+            self.report({'ERROR'}, str(e).strip("'"))
+            return{ 'CANCELLED'}
+        for name, distance in matches:
+            print("[Mixamo Root] %s (%.3f)" % (name, distance))
+        self.report({'INFO'}, "Similar clips: " + ", ".join(name for name, _ in matches))
+        return{ 'FINISHED'}
+
+class OBJECT_OT_ExportAnimations(bpy.types.Operator):
+    '''Operator for exporting the actions of the selected armature to glTF'''
+    bl_idname = "mixamo.exportanims"
+    bl_label = "Export glTF"
+    bl_description = "Exports all actions of the selected armature to the [Export Directory], as one glTF file or one file per action (unchanged actions are skipped)"
+
+    def execute(self, context):
+        mixamo = context.scene.mixamo
+        armature = context.object
+        if armature is None or armature.type != 'ARMATURE':
+            self.report({'ERROR_INVALID_INPUT'}, "Error: select the armature to export.")
+            return{ 'CANCELLED'}
+        if mixamo.export_directory == '':
+            self.report({'ERROR_INVALID_INPUT'}, "Error: no Export Directory set.")
+            return{ 'CANCELLED'}
+        bpy.ops.object.mode_set(mode='OBJECT')
+        output_dir = bpy.path.abspath(mixamo.export_directory)
+        if mixamo.export_per_action:
+            timings = export.export_per_action(armature, output_dir, mixamo.export_format, mixamo.export_workers)
+            self.report({'INFO'}, "Exported %d changed actions" % len(timings))
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+            filepath = os.path.join(output_dir, bpy.path.clean_name(armature.name) + export.FORMATS[mixamo.export_format])
+            seconds = export.export_combined(armature, filepath, mixamo.export_format)
+            self.report({'INFO'}, "Exported %s in %.2fs" % (filepath, seconds))
         return{ 'FINISHED'}
 
 class OBJECT_OT_AddRootNLA(bpy.types.Operator):
@@ -166,7 +640,10 @@ class OBJECT_OT_AddRootNLA(bpy.types.Operator):
         if root_name == '':
             self.report({'ERROR_INVALID_INPUT'}, "Error: no Root Bone Name set.")
             return{ 'CANCELLED'}
-        mixamoroot.add_root_bone_nla(root_bone_name=root_name, hip_bone_name=hip_name, name_prefix=name_prefix)
+        root_motion = {'project_ground': mixamo.root_ground, 'use_yaw': mixamo.root_yaw, 'world_space': mixamo.root_world}
+        actions, shared = mixamoroot.add_root_bone_nla(root_bone_name=root_name, hip_bone_name=hip_name, name_prefix=name_prefix, root_motion=root_motion,
+                                                       workers=mixamo.compute_threads or 1)
+        self.report({'INFO'}, "Added root motion to %d actions (%d strips shared an action and were skipped)" % (actions, shared))
         return{ 'FINISHED'}
 
 class MIXAMOCONV_VIEW_3D_PT_mixamoroot(bpy.types.Panel):
@@ -191,21 +668,87 @@ class MIXAMOCONV_VIEW_3D_PT_mixamoroot(bpy.types.Panel):
         row.prop(scene.mixamo, "remove_prefix", toggle=True)
         row.prop(scene.mixamo, "delete_armatures", toggle=True)
         row = box.row()
+        row.prop(scene.mixamo, "animation_only", toggle=True)
+        if scene.mixamo.animation_only:
+            row.prop(scene.mixamo, "compute_threads")
+        if scene.mixamo.insert_root:
+            row = box.row()
+            row.prop(scene.mixamo, "root_ground", toggle=True)
+            row.prop(scene.mixamo, "root_clamp_floor", toggle=True)
+            row.prop(scene.mixamo, "root_yaw", toggle=True)
+            row.prop(scene.mixamo, "root_world", toggle=True)
+        row = box.row()
+        row.prop(scene.mixamo, "reduce_keys", toggle=True)
+        if scene.mixamo.reduce_keys:
+            row = box.row()
+            row.prop(scene.mixamo, "reduce_location")
+            row.prop(scene.mixamo, "reduce_rotation")
+            row.prop(scene.mixamo, "reduce_scale")
+        row = box.row()
+        row.prop(scene.mixamo, "resample", toggle=True)
+        if scene.mixamo.resample:
+            row.prop(scene.mixamo, "resample_fps")
+            row.prop(scene.mixamo, "resample_start")
+        row = box.row()
         box.prop(scene.mixamo, "hip_name")
         row = box.row()
         box.prop(scene.mixamo, "root_name")
         row = box.row()
         box.prop(scene.mixamo, "name_prefix")
+        if scene.mixamo.remove_prefix:
+            row = box.row()
+            box.prop(scene.mixamo, "target_prefix")
+        row = box.row()
+        box.prop(scene.mixamo, "unit_scale")
         # Button for conversion of single Selected rig
         box = layout.box()
         box.label(text="Animation Files")
         row = box.row()
         row.prop(scene.mixamo, "source_directory")
+        row = box.row()
+        row.prop(scene.mixamo, "recursive", toggle=True)
+        row.prop(scene.mixamo, "file_pattern")
+        row = box.row()
+        row.prop(scene.mixamo, "file_order")
+        row.prop(scene.mixamo, "prefetch")
+        if scene.mixamo.file_order == 'manifest':
+            row = box.row()
+            row.prop(scene.mixamo, "manifest")
+        row = box.row()
+        row.prop(scene.mixamo, "use_cache", toggle=True)
+        if scene.mixamo.use_cache:
+            row.prop(scene.mixamo, "cache_size")
+            row = box.row()
+            row.prop(scene.mixamo, "cache_directory")
+        row = box.row()
+        row.prop(scene.mixamo, "use_journal", toggle=True)
+        row.prop(scene.mixamo, "continue_on_error", toggle=True)
+        if scene.mixamo.use_journal:
+            row = box.row()
+            row.prop(scene.mixamo, "resume", toggle=True)
+            row.prop(scene.mixamo, "checkpoint_every")
+            if scene.mixamo.resume:
+                row = box.row()
+                row.prop(scene.mixamo, "resume_blend")
+        row = box.row()
+        row.prop(scene.mixamo, "batch_session", toggle=True)
+        if scene.mixamo.batch_session:
+            row.prop(scene.mixamo, "memory_budget")
+        row = box.row()
+        row.prop(scene.mixamo, "profile", toggle=True)
+        if scene.mixamo.profile:
+            row.prop(scene.mixamo, "profile_directory")
         # button to start batch conversion
         row = box.row()
         row.scale_y = 2.0
         row.operator("mixamo.importanim")
         status_row = box.row()
+        if import_status:
+            status_row.label(text=import_status)
+        if scene.mixamo.profile and mixamoroot.profiling.last_summary:
+            col = box.column(align=True)
+            for stage, seconds, share in mixamoroot.profiling.last_summary:
+                col.label(text="%s: %.2fs (%d%%)" % (stage, seconds, round(share * 100)))
         box = layout.box()
         box.label(text="Animation Helpers")
         row = box.row()
@@ -215,19 +758,65 @@ class MIXAMOCONV_VIEW_3D_PT_mixamoroot(bpy.types.Panel):
         row = box.row()
         row.prop(scene.mixamo, "delete_applied_armatures", toggle=True) # todo delete_applied_armatures
         row.prop(scene.mixamo, "push_nla", toggle=True)
+        row.prop(scene.mixamo, "fast_retarget", toggle=True)
+        if scene.mixamo.push_nla:
+            row = box.row()
+            row.prop(scene.mixamo, "nla_layout")
+            if scene.mixamo.nla_layout != 'TRACK':
+                row = box.row()
+                if scene.mixamo.nla_layout == 'PACK':
+                    row.prop(scene.mixamo, "nla_tracks")
+                row.prop(scene.mixamo, "nla_gap")
+                row = box.row()
+                row.prop(scene.mixamo, "nla_manifest", toggle=True)
+                row.prop(scene.mixamo, "nla_manifest_path")
+                row = box.row()
+                row.operator("mixamo.exportnlamanifest")
         row = box.row()
         # box.prop(scene.mixamo, "mixamo.applyanims") # todo
         row.operator("mixamo.applyanims")
         row = box.row()
         row.scale_y = 2.0
         row.operator("mixamo.addrootnla")
+        row.prop(scene.mixamo, "compute_threads")
         status_row = box.row()
         # status_row = box.row()
+        box = layout.box()
+        box.label(text="Animation Library")
+        row = box.row()
+        row.prop(scene.mixamo, "library_path")
+        row = box.row()
+        row.prop(scene.mixamo, "library_filter")
+        row = box.row()
+        row.operator("mixamo.savelibrary")
+        row.operator("mixamo.loadlibrary")
+        row = box.row()
+        row.operator("mixamo.buildmotionindex")
+        row = box.row()
+        row.operator("mixamo.findsimilar")
+        row.prop(scene.mixamo, "similar_count")
+        box = layout.box()
+        box.label(text="Export")
+        row = box.row()
+        row.prop(scene.mixamo, "export_directory")
+        row = box.row()
+        row.prop(scene.mixamo, "export_format")
+        row.prop(scene.mixamo, "export_per_action", toggle=True)
+        if scene.mixamo.export_per_action:
+            row.prop(scene.mixamo, "export_workers")
+        row = box.row()
+        row.operator("mixamo.exportanims")
 
 classes = (
     OBJECT_OT_ImportAnimations,
     OBJECT_OT_ApplyAnimations,
+    OBJECT_OT_ExportNLAManifest,
     OBJECT_OT_AddRootNLA,
+    OBJECT_OT_SaveLibrary,
+    OBJECT_OT_LoadLibrary,
+    OBJECT_OT_BuildMotionIndex,
+    OBJECT_OT_FindSimilarClips,
+    OBJECT_OT_ExportAnimations,
     MIXAMOCONV_VIEW_3D_PT_mixamoroot,
 )
 
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Animation library file: many processed actions in one binary file that is memory mapped when
+# read, so opening it only parses the index and only a clip's own keys are read (and copied out)
+# when it is loaded.
+#
+# Layout, little endian:
+#   header    MAGIC, uint32 version, uint32 0, uint64 index offset, uint64 index size
+#   clips     per clip, 8 byte aligned: int64 key count per channel, then float32 (keys, 2) co,
+#             handle_left, handle_right, then int32 interpolation per key
+#   index     utf-8 JSON: channel tables (data paths, array indices, groups), shared by all clips
+#             of the same skeleton, and per clip its name, table, block offset and key count
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+try:
+    from . import fcurves
+except ImportError:
+    import fcurves
+
+
+MAGIC = b"MXRLIB\0\0"
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')
+EXTENSION = ".mxlib"
+
+KEY_ARRAYS = fcurves.KEY_ATTRS + ('interpolation',)
+
+
+def _align(f):
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b"\0" * pad)
+
+def write_clips(filepath, clips):
+    '''Writes (name, fcurves.read_action() layout data, frame range) clips into a library file. Returns the clip count'''
+    tables = []
+    table_ids = {}
+    index_clips = []
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for name, data, frame_range in clips:
+            table = (tuple(data['data_paths'].tolist()), tuple(data['array_indices'].tolist()), tuple(data['groups'].tolist()))
+            if table not in table_ids:
+                table_ids[table] = len(tables)
+                tables.append({'data_paths': table[0], 'array_indices': table[1], 'groups': table[2]})
+            _align(f)
+            offset = f.tell()
+            f.write(np.ascontiguousarray(data['counts'], dtype='<i8').tobytes())
+            for attr in fcurves.KEY_ATTRS:
+                f.write(np.ascontiguousarray(data[attr], dtype='<f4').tobytes())
+            f.write(np.ascontiguousarray(data['interpolation'], dtype='<i4').tobytes())
+            index_clips.append({'name': name, 'table': table_ids[table], 'offset': offset,
+                                'keys': int(data['counts'].sum()), 'frame_range': list(frame_range)})
+        _align(f)
+        index_offset = f.tell()
+        index = json.dumps({'tables': tables, 'clips': index_clips}).encode('utf-8')
+        f.write(index)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, index_offset, len(index)))
+    os.replace(tmp_path, filepath)
+    return len(index_clips)
+
+def write_library(filepath, actions):
+    '''Writes actions (processed, e.g. after import and root insertion) into a library file. Returns the clip count'''
+    return write_clips(filepath, ((action.name, fcurves.read_action(action), tuple(action.frame_range)) for action in actions))
+
+def merge_libraries(filepath, parts):
+    '''Writes the clips of several library files into one, a later clip of the same name wins. Returns the clip count'''
+    libraries = [AnimationLibrary(part) for part in parts]
+    try:
+        latest = {}
+        for library in libraries:
+            for name in library.names():
+                latest[name] = library
+        return write_clips(filepath, ((name, library.clip_data(name), library.clips[name]['frame_range'])
+                                      for name, library in latest.items()))
+    finally:
+        for library in libraries:
+            library.close()
+
+class AnimationLibrary:
+    '''Memory mapped library file, clips are read on demand'''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self._file.close()
+            raise ValueError("Not an animation library: " + filepath)
+        magic, version, _, index_offset, index_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version > VERSION:
+            self.close()
+            raise ValueError("Not an animation library (or a newer version): " + filepath)
+        index = json.loads(bytes(self._map[index_offset:index_offset + index_size]).decode('utf-8'))
+        self.tables = index['tables']
+        self.clips = {clip['name']: clip for clip in index['clips']}
+
+    def names(self):
+        return list(self.clips)
+
+    def clip_data(self, name):
+        '''Arrays of one clip in the fcurves.read_action layout. Only the clip's bytes are read from
+        the mapped file, and copied, so the arrays stay valid after close()
+        '''
+        clip = self.clips[name]
+        table = self.tables[clip['table']]
+        channels = len(table['data_paths'])
+        keys = clip['keys']
+        offset = clip['offset']
+        data = {
+            'data_paths': np.array(table['data_paths'], dtype=str),
+            'array_indices': np.array(table['array_indices'], dtype=np.int32),
+            'groups': np.array(table['groups'], dtype=str),
+            'counts': np.frombuffer(self._map, dtype='<i8', count=channels, offset=offset).copy(),
+        }
+        offset += channels * 8
+        for attr in fcurves.KEY_ATTRS:
+            data[attr] = np.frombuffer(self._map, dtype='<f4', count=keys * 2, offset=offset).reshape(keys, 2).copy()
+            offset += keys * 8
+        data['interpolation'] = np.frombuffer(self._map, dtype='<i4', count=keys, offset=offset).copy()
+        return data
+
+    def load(self, name, actions):
+        '''Creates the action of clip name in actions (bpy.data.actions)'''
+        action = fcurves.write_action(actions, name, self.clip_data(name))
+        action.use_fake_user = True
+        return action
+
+    def close(self):
+        try:
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            # Something still holds a view of the map, it is unmapped once that is gone
+            pass
+        finally:
+            self._map = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
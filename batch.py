@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Headless batch importer. Splits a directory of mixamo animations into shards, imports each
+# shard in its own `blender --background` worker and appends every shard's actions into a
+# single target .blend.
+#
+# Usage, from a shell (plain python or blender both work as the parent):
+#   blender --background --python batch.py -- --source ./anims --output library.blend --workers 4 --insert-root
+#   python batch.py --blender /path/to/blender --source ./anims --output library.blend --workers 4
+# Add --benchmark to time the whole run at 1, 2, 4 and 8 workers instead.
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_WORKERS = (1, 2, 4, 8)
+
+
+def _mixamoroot():
+    # Imported lazily, the parent process does not need bpy
+    try:
+        from . import mixamoroot
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import mixamoroot
+    return mixamoroot
+
+def _discovery():
+    try:
+        from . import discovery
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import discovery
+    return discovery
+
+def find_fbx_files(source_dir, recursive=False, pattern="*.fbx"):
+    return [os.path.join(source_dir, f) for f in _discovery().find_files(source_dir, recursive, pattern)]
+
+def split_shards(files, workers):
+    '''Splits files into at most workers shards of roughly equal total size, largest files first'''
+    shards = [[] for _ in range(max(1, min(workers, len(files))))]
+    loads = [0] * len(shards)
+    for filepath in sorted(files, key=os.path.getsize, reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(filepath)
+        loads[i] += os.path.getsize(filepath)
+    # Keep the import order inside a shard stable, the first file provides the base armature
+    return [sorted(shard) for shard in shards if shard]
+
+def add_settings_arguments(parser):
+    # Mirrors MixamoPropertyGroup
+    parser.add_argument('--hip-name', default="mixamorig:Hips")
+    parser.add_argument('--root-name', default="Root")
+    parser.add_argument('--name-prefix', default="mixamorig:")
+    parser.add_argument('--target-prefix', default="")
+    parser.add_argument('--unit-scale', type=float, default=0.01)
+    parser.add_argument('--remove-prefix', action='store_true')
+    parser.add_argument('--insert-root', action='store_true')
+    parser.add_argument('--delete-armatures', action='store_true')
+    parser.add_argument('--ground-root', action='store_true')
+    parser.add_argument('--clamp-floor', action='store_true')
+    parser.add_argument('--root-yaw', action='store_true')
+    parser.add_argument('--world-root', action='store_true',
+                        help="Root motion from the hips evaluated through the rest pose instead of their location keys")
+    parser.add_argument('--reduce-keys', action='store_true')
+    parser.add_argument('--reduce-location', type=float, default=0.0005)
+    parser.add_argument('--reduce-rotation', type=float, default=0.0005)
+    parser.add_argument('--reduce-scale', type=float, default=0.0005)
+    parser.add_argument('--fps', type=float, default=0.0,
+                        help="Resample every action to one key per frame at this rate and start it at --start-frame")
+    parser.add_argument('--start-frame', type=float, default=None,
+                        help="Move every action to start at this frame (0 with --fps)")
+    parser.add_argument('--memory-budget', type=int, default=0,
+                        help="MB per worker, close to it imported actions are moved out of memory to a library file")
+
+def settings_argv(args):
+    argv = ['--hip-name', args.hip_name, '--root-name', args.root_name,
+            '--name-prefix', args.name_prefix, '--target-prefix', args.target_prefix, '--unit-scale', str(args.unit_scale),
+            '--reduce-location', str(args.reduce_location), '--reduce-rotation', str(args.reduce_rotation),
+            '--reduce-scale', str(args.reduce_scale), '--memory-budget', str(args.memory_budget), '--fps', str(args.fps)]
+    if args.start_frame is not None:
+        argv += ['--start-frame', str(args.start_frame)]
+    for flag in ('remove_prefix', 'insert_root', 'delete_armatures', 'ground_root', 'clamp_floor', 'root_yaw', 'world_root', 'reduce_keys'):
+        if getattr(args, flag):
+            argv.append('--' + flag.replace('_', '-'))
+    return argv
+
+def root_motion_options(args):
+    return {'project_ground': args.ground_root, 'clamp_floor': args.clamp_floor, 'use_yaw': args.root_yaw,
+            'world_space': args.world_root}
+
+def resampling_options(args):
+    if not args.fps and args.start_frame is None:
+        return None
+    return {'fps': args.fps, 'start_frame': args.start_frame or 0.0}
+
+def key_reduction_options(args):
+    if not args.reduce_keys:
+        return None
+    return {'location': args.reduce_location, 'rotation': args.reduce_rotation, 'scale': args.reduce_scale}
+
+def run_worker(args):
+    '''Imports one shard inside blender and saves the result to args.shard_output'''
+    mixamoroot = _mixamoroot()
+    with open(args.worker) as f:
+        files = json.load(f)
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+    if args.profile:
+        mixamoroot.profiling.start(bpy.data, {'blender': bpy.app.version_string, 'worker': os.getpid()})
+    failed = 0
+    base_objects = None
+    batch = mixamoroot.session.Session(bpy.data, bpy.context.preferences, args.memory_budget, flushed_directory(args.shard_output))
+    for filepath in files:
+        print("[Mixamo Root] worker %d: %s" % (os.getpid(), filepath))
+        mixamoroot.profiling.begin_file(filepath)
+        batch.begin_file()
+        old_objs = set(bpy.context.scene.objects)
+        try:
+            mixamoroot.import_armature(filepath, args.root_name, args.hip_name, args.remove_prefix,
+                                       args.name_prefix, args.insert_root, args.delete_armatures, args.unit_scale,
+                                       root_motion_options(args), key_reduction_options(args),
+                                       args.target_prefix, resampling_options(args))
+        except Exception as e:
+            log.error("[Mixamo Root] ERROR batch worker raised %s when processing %s" % (str(e), filepath))
+            failed += 1
+            batch.end_file(os.path.basename(filepath))
+            continue
+        imported_objects = set(bpy.context.scene.objects) - old_objs
+        if base_objects is None and args.keep_base:
+            base_objects = imported_objects
+        elif args.delete_armatures:
+            for obj in imported_objects:
+                bpy.data.objects.remove(obj, do_unlink=True)
+        batch.end_file(os.path.basename(filepath))
+    # Flushed actions are loaded back by the merge
+    batch.close()
+
+    # Actions of deleted armatures have no users left, keep them alive in the saved file
+    for action in bpy.data.actions:
+        action.use_fake_user = True
+    bpy.ops.wm.save_as_mainfile(filepath=args.shard_output)
+    profiler = mixamoroot.profiling.stop()
+    if profiler is not None:
+        profiler.write_report(os.path.dirname(args.shard_output), os.path.splitext(os.path.basename(args.shard_output))[0] + "_profile")
+    print("[Mixamo Root] worker %d done, %d of %d files failed" % (os.getpid(), failed, len(files)))
+    return 1 if failed else 0
+
+def flushed_directory(shard_output):
+    # Where a worker over its memory budget writes actions, next to its shard file
+    return os.path.splitext(shard_output)[0] + "_flushed"
+
+def run_merge(args):
+    '''Appends the actions and objects of every shard .blend into args.output'''
+    if not args.merge:
+        log.error("[Mixamo Root] ERROR no shard files to merge, %s left unchanged" % args.output)
+        return 1
+    mixamoroot = _mixamoroot()
+    if os.path.exists(args.output):
+        bpy.ops.wm.open_mainfile(filepath=args.output)
+    else:
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+    collection = bpy.context.scene.collection
+    for shard_path in args.merge:
+        with bpy.data.libraries.load(shard_path, link=False) as (data_from, data_to):
+            data_to.actions = data_from.actions
+            data_to.objects = data_from.objects
+        # Entries that failed to load are None
+        actions = [action for action in data_to.actions if action is not None]
+        for action in actions:
+            action.use_fake_user = True
+        for obj in data_to.objects:
+            if obj is not None:
+                collection.objects.link(obj)
+        print("[Mixamo Root] merged %d actions from %s" % (len(actions), shard_path))
+        flushed = flushed_directory(shard_path)
+        if os.path.isdir(flushed):
+            for name in sorted(os.listdir(flushed)):
+                if name.endswith(mixamoroot.animlib.EXTENSION):
+                    mixamoroot.load_library(os.path.join(flushed, name))
+    if args.fps:
+        render = bpy.context.scene.render
+        render.fps = max(1, int(round(args.fps)))
+        render.fps_base = render.fps / args.fps
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(args.output))
+    return 0
+
+def run_parent(args, workers=None):
+    '''Runs the sharded import and the merge. Returns the wall time in seconds'''
+    workers = workers or args.workers
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="mixamoroot_")
+    os.makedirs(work_dir, exist_ok=True)
+    files = find_fbx_files(args.source, args.recursive, args.pattern)
+    if not files:
+        log.warning("[Mixamo Root] No .fbx files found in %s" % args.source)
+        return 0.0
+    shards = split_shards(files, workers)
+    script = os.path.abspath(__file__)
+    start = time.perf_counter()
+
+    processes = []
+    for i, shard in enumerate(shards):
+        list_path = os.path.join(work_dir, "shard_%02d.json" % i)
+        shard_output = os.path.join(work_dir, "shard_%02d.blend" % i)
+        log_path = os.path.join(work_dir, "shard_%02d.log" % i)
+        with open(list_path, 'w') as f:
+            json.dump(shard, f)
+        cmd = [args.blender, '--background', '--factory-startup', '--python', script, '--',
+               '--worker', list_path, '--shard-output', shard_output] + settings_argv(args)
+        if i == 0:
+            cmd.append('--keep-base')
+        if args.profile:
+            cmd.append('--profile')
+        log_file = open(log_path, 'w')
+        processes.append((subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT), log_file, shard_output, log_path))
+        print("[Mixamo Root] shard %d: %d files, log %s" % (i, len(shard), log_path))
+
+    shard_outputs = []
+    for process, log_file, shard_output, log_path in processes:
+        code = process.wait()
+        log_file.close()
+        if code != 0:
+            log.warning("[Mixamo Root] shard exited with code %d, see %s" % (code, log_path))
+        if os.path.exists(shard_output):
+            shard_outputs.append(shard_output)
+    if not shard_outputs:
+        log.error("[Mixamo Root] ERROR no shard produced a .blend, see the logs in %s, %s left unchanged" % (work_dir, args.output))
+        return time.perf_counter() - start
+
+    merge_log = os.path.join(work_dir, "merge.log")
+    cmd = [args.blender, '--background', '--factory-startup', '--python', script, '--',
+           '--output', os.path.abspath(args.output), '--fps', str(args.fps), '--merge'] + shard_outputs
+    with open(merge_log, 'w') as log_file:
+        code = subprocess.call(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+    if code != 0:
+        log.error("[Mixamo Root] ERROR merge exited with code %d, see %s" % (code, merge_log))
+    elapsed = time.perf_counter() - start
+    print("[Mixamo Root] imported %d files with %d workers in %.2fs" % (len(files), len(shards), elapsed))
+    return elapsed
+
+def run_benchmark(args):
+    output = args.output
+    results = []
+    for workers in BENCHMARK_WORKERS:
+        args.output = "%s.bench_%d.blend" % (os.path.splitext(output)[0], workers)
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        results.append((workers, run_parent(args, workers)))
+    args.output = output
+    base = results[0][1] or 1.0
+    print("workers  seconds  speedup")
+    for workers, elapsed in results:
+        print("%7d  %7.2f  %6.2fx" % (workers, elapsed, base / elapsed if elapsed else 0.0))
+    return results
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless multi-process Mixamo Root importer")
+    parser.add_argument('--source', help="Directory containing mixamo animation files (.fbx)")
+    parser.add_argument('--output', help="Target .blend, actions are appended if it already exists")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--blender', default=bpy.app.binary_path if bpy else "blender",
+                        help="Blender executable used for the workers")
+    parser.add_argument('--recursive', action='store_true', help="Also import files in sub directories of --source")
+    parser.add_argument('--pattern', default="*.fbx", help="File name pattern of the files to import")
+    parser.add_argument('--work-dir', help="Directory for shard files and per-shard logs, a temp dir by default")
+    parser.add_argument('--benchmark', action='store_true', help="Time the run at 1, 2, 4 and 8 workers")
+    parser.add_argument('--profile', action='store_true', help="Write per stage timings of every shard to the work dir (JSON and CSV)")
+    # Internal, used by the parent to start workers and the merge
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--shard-output', help=argparse.SUPPRESS)
+    parser.add_argument('--keep-base', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--merge', nargs='*', help=argparse.SUPPRESS)
+    add_settings_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        # Blender passes script arguments after '--'
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.worker:
+        return run_worker(args)
+    if args.merge is not None:
+        return run_merge(args)
+    if not args.source or not args.output:
+        log.error("[Mixamo Root] ERROR --source and --output are required")
+        return 2
+    if args.benchmark:
+        run_benchmark(args)
+    else:
+        run_parent(args)
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    if bpy is None or bpy.app.background:
+        sys.exit(code)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# In memory stand-in for the part of bpy the data level modules use: actions, fcurves,
+# keyframe_points with foreach_get/foreach_set, action groups, animation data with NLA tracks
+# and armature objects with bones. Only the data model, there are no operators, depsgraph or
+# handle recalculation, so timings only compare our own code against itself.
+import numpy as np
+
+
+class Collection:
+    '''Named datablock collection like bpy.data.actions'''
+
+    def __init__(self, factory):
+        self._items = []
+        self._factory = factory
+
+    def new(self, name, *args, **kwargs):
+        names = {item.name for item in self._items}
+        unique = name
+        suffix = 0
+        while unique in names:
+            suffix += 1
+            unique = "%s.%03d" % (name, suffix)
+        item = self._factory(unique, *args, **kwargs)
+        self._items.append(item)
+        return item
+
+    def remove(self, item):
+        self._items.remove(item)
+
+    def get(self, name, default=None):
+        return next((item for item in self._items if item.name == name), default)
+
+    def find(self, name):
+        return next((i for i, item in enumerate(self._items) if item.name == name), -1)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            item = self.get(key)
+            if item is None:
+                raise KeyError(key)
+            return item
+        return self._items[key]
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+class Keyframe:
+    __slots__ = ('_points', '_index')
+
+    def __init__(self, points, index):
+        self._points = points
+        self._index = index
+
+    @property
+    def co(self):
+        return tuple(self._points._data['co'][self._index])
+
+class KeyframePoints:
+    '''Keys stored as arrays, (n, 2) float32 per vector attribute like blender's foreach layout'''
+
+    WIDTHS = {'co': 2, 'handle_left': 2, 'handle_right': 2, 'interpolation': 1}
+
+    def __init__(self):
+        self._data = {attr: np.empty((0, width) if width > 1 else 0, dtype=np.int32 if width == 1 else np.float32)
+                      for attr, width in self.WIDTHS.items()}
+
+    def __len__(self):
+        return len(self._data['co'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Keyframe(self, index)
+
+    def add(self, count=1):
+        for attr, values in self._data.items():
+            extra = np.zeros((count,) + values.shape[1:], dtype=values.dtype)
+            self._data[attr] = np.concatenate((values, extra))
+
+    def remove(self, keyframe, fast=False):
+        for attr, values in self._data.items():
+            self._data[attr] = np.delete(values, keyframe._index, axis=0)
+
+    def _assign(self, co, interpolation):
+        # Shortcut for the generator, all keys at once with handles on the keys
+        co = np.asarray(co, dtype=np.float32)
+        self._data = {'co': co, 'handle_left': co.copy(), 'handle_right': co.copy(),
+                      'interpolation': np.asarray(interpolation, dtype=np.int32)}
+
+    def _check(self, attr, seq):
+        if attr not in self.WIDTHS:
+            raise AttributeError(attr)
+        if len(seq) != len(self) * self.WIDTHS[attr]:
+            raise RuntimeError("internal error setting the array")
+
+    def foreach_get(self, attr, seq):
+        self._check(attr, seq)
+        seq[:] = self._data[attr].ravel()
+
+    def foreach_set(self, attr, seq):
+        self._check(attr, seq)
+        values = self._data[attr]
+        self._data[attr] = np.asarray(seq, dtype=values.dtype).reshape(values.shape).copy()
+
+class ActionGroup:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+class FCurve:
+    __slots__ = ('_data_path', '_owner', 'array_index', 'group', 'keyframe_points')
+
+    def __init__(self, owner, data_path, index=0, group=None):
+        self._owner = owner
+        self._data_path = data_path
+        self.array_index = index
+        self.group = group
+        self.keyframe_points = KeyframePoints()
+
+    @property
+    def data_path(self):
+        return self._data_path
+
+    @data_path.setter
+    def data_path(self, value):
+        self._data_path = value
+        self._owner._index = None
+
+    def update(self):
+        # Blender also recalculates handles here, sorting is what keeps the data valid
+        points = self.keyframe_points
+        order = np.argsort(points._data['co'][:, 0], kind='stable')
+        if np.any(order[1:] < order[:-1]):
+            for attr, values in points._data.items():
+                points._data[attr] = values[order]
+
+class ActionFCurves:
+    def __init__(self, action):
+        self._action = action
+        self._curves = []
+        # Blender searches the list, a dict keeps the stand-in's own cost out of the timings
+        self._index = {}
+
+    def new(self, data_path, index=0, action_group=""):
+        if self.find(data_path, index) is not None:
+            raise RuntimeError('F-Curve "%s[%d]" already exists in action "%s"' % (data_path, index, self._action.name))
+        group = None
+        if action_group:
+            group = self._action.groups.get(action_group) or self._action.groups.new(action_group)
+        fc = FCurve(self, data_path, index, group)
+        self._curves.append(fc)
+        if self._index is not None:
+            self._index[data_path, index] = fc
+        return fc
+
+    def find(self, data_path, index=0):
+        if self._index is None:
+            # Dropped whenever a data_path is assigned, e.g. by a rename
+            self._index = {(fc.data_path, fc.array_index): fc for fc in self._curves}
+        return self._index.get((data_path, index))
+
+    def remove(self, fcurve):
+        self._curves.remove(fcurve)
+        if self._index is not None:
+            self._index.pop((fcurve.data_path, fcurve.array_index), None)
+
+    def __iter__(self):
+        return iter(list(self._curves))
+
+    def __len__(self):
+        return len(self._curves)
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+        self.use_fake_user = False
+        self.groups = Collection(ActionGroup)
+        self.fcurves = ActionFCurves(self)
+
+    @property
+    def frame_range(self):
+        frames = [fc.keyframe_points._data['co'][:, 0] for fc in self.fcurves if len(fc.keyframe_points)]
+        if not frames:
+            return (0.0, 0.0)
+        return (min(float(f.min()) for f in frames), max(float(f.max()) for f in frames))
+
+class NlaStrip:
+    def __init__(self, name, start, action):
+        self.name = name
+        self.action = action
+        self.frame_start = start
+
+class NlaStrips(Collection):
+    def __init__(self):
+        super().__init__(NlaStrip)
+
+class NlaTrack:
+    def __init__(self, name="NlaTrack"):
+        self.name = name
+        self.mute = False
+        self.lock = False
+        self.strips = NlaStrips()
+
+class NlaTracks:
+    def __init__(self):
+        self._tracks = []
+
+    def new(self, prev=None):
+        track = NlaTrack("NlaTrack" if not self._tracks else "NlaTrack.%03d" % len(self._tracks))
+        self._tracks.append(track)
+        return track
+
+    def __iter__(self):
+        return iter(list(self._tracks))
+
+    def __len__(self):
+        return len(self._tracks)
+
+class AnimData:
+    def __init__(self):
+        self.action = None
+        self.nla_tracks = NlaTracks()
+
+class Bone:
+    def __init__(self, name, head_local=(0.0, 0.0, 0.0)):
+        self.name = name
+        self.head_local = head_local
+        self.parent = None
+
+class Armature:
+    def __init__(self, name):
+        self.name = name
+        self.bones = Collection(Bone)
+
+class VertexGroup:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+class Object:
+    def __init__(self, name, data=None):
+        self.name = name
+        self.data = data
+        self.type = 'ARMATURE' if isinstance(data, Armature) else 'MESH'
+        self.animation_data = None
+        self.children = []
+        self.vertex_groups = Collection(VertexGroup)
+
+    def animation_data_create(self):
+        if self.animation_data is None:
+            self.animation_data = AnimData()
+        return self.animation_data
+
+class BlendData:
+    '''bpy.data'''
+
+    def __init__(self):
+        self.actions = Collection(Action)
+        self.armatures = Collection(Armature)
+        self.objects = Collection(Object)
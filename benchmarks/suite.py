@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Times the data level code paths of the import (scaling, prefix renaming, root insertion, the
+# threaded pipeline at 1 to 8 threads) on synthetic libraries of 10, 100 and 1000 clips and
+# compares them against a saved baseline.
+#
+# Usage, from the addon directory:
+#   python -m benchmarks --save-baseline     (once, on the machine the numbers are compared on)
+#   python -m benchmarks                     (exits with 1 if a case got slower than the threshold)
+import argparse
+import functools
+import json
+import os
+import time
+
+from . import fakebpy
+from . import synthetic
+
+try:
+    from .. import fcurves
+    from .. import pipeline
+    from .. import rename
+    from .. import rootmotion
+except ImportError:
+    # Run from the addon directory, which is not a package then
+    import fcurves
+    import pipeline
+    import rename
+    import rootmotion
+
+
+CLIP_COUNTS = (10, 100, 1000)
+# Machine specific, ignored by git
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Allowed slowdown against the baseline before a case counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+HIPS = synthetic.NAME_PREFIX + "Hips"
+ROOT = synthetic.NAME_PREFIX + "Root"
+# Thread counts of the pipeline cases, throughput against threads
+PIPELINE_THREADS = (1, 2, 4, 8)
+
+
+# Channels the root cases change, restored from a snapshot after every repeat
+ROOT_CHANNELS = pipeline.bone_filter(HIPS, ROOT)
+RENAMED_PREFIX = "bench:"
+
+
+def case_scale(rig, actions, state):
+    fcurves.scale_locations(actions, 0.01)
+
+def reset_scale(rig, actions, state):
+    fcurves.scale_locations(actions, 100.0)
+
+def case_rename(rig, actions, state):
+    rename.rename_rig(rig, synthetic.NAME_PREFIX, RENAMED_PREFIX, actions)
+
+def reset_rename(rig, actions, state):
+    rename.rename_rig(rig, RENAMED_PREFIX, synthetic.NAME_PREFIX, actions)
+
+def case_root(rig, actions, state):
+    for action in actions:
+        rootmotion.apply_to_action(action, HIPS, ROOT)
+
+def reset_root(rig, actions, state):
+    # Back to the generated hip keys and no root channels, every repeat works on the same data
+    for action, original in zip(actions, state['original']):
+        fcurves.update_action(action, original, fcurves.read_action(action, ROOT_CHANNELS))
+
+def case_root_yaw(rig, actions, state):
+    for action in actions:
+        rootmotion.apply_to_action(action, HIPS, ROOT, {'project_ground': True, 'use_yaw': True}, (0.0, 100.0, 0.0))
+
+def pipeline_case(workers):
+    # Root motion with the floor clamp and scaling in one read, compute and write pass
+    def case(rig, actions, state):
+        steps = [functools.partial(pipeline.root_motion, hip_bone=HIPS, root_bone=ROOT, options={'clamp_floor': True}),
+                 functools.partial(pipeline.scale_locations, scale=0.01)]
+        pipeline.process_actions(actions, steps, workers, ROOT_CHANNELS)
+    return case
+
+# name -> (timed function, untimed reset run after every repeat). Every case leaves the library
+# as it found it, so the cases after it time the same work as when run alone.
+CASES = {
+    'scale': (case_scale, reset_scale),
+    'rename': (case_rename, reset_rename),
+    'root': (case_root, reset_root),
+    'root_yaw': (case_root_yaw, reset_root),
+}
+for _workers in PIPELINE_THREADS:
+    CASES['pipeline_%d' % _workers] = (pipeline_case(_workers), reset_root)
+
+
+def run(counts=CLIP_COUNTS, frames=30, repeat=3, cases=None):
+    '''{case: {clip count: best seconds}}'''
+    results = {name: {} for name in (cases or CASES)}
+    for count in counts:
+        data = fakebpy.BlendData()
+        start = time.perf_counter()
+        rig, actions = synthetic.make_library(data, count, frames)
+        original = [fcurves.read_action(action, ROOT_CHANNELS) for action in actions]
+        print("[Mixamo Root] benchmark: generated %d clips of %d frames in %.2fs" % (count, frames, time.perf_counter() - start))
+        for name in results:
+            function, reset = CASES[name]
+            state = {'original': original}
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function(rig, actions, state)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+                reset(rig, actions, state)
+            results[name][str(count)] = best
+            print("[Mixamo Root] benchmark: %-8s %5d clips %8.3fs (%.2fms per clip)" % (name, count, best, best * 1000.0 / count))
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''Cases slower than baseline * (1 + threshold), as (case, clips, seconds, baseline seconds)'''
+    regressions = []
+    for name, counts in results.items():
+        for count, seconds in counts.items():
+            reference = baseline.get(name, {}).get(count)
+            if reference is not None and seconds > reference * (1.0 + threshold):
+                regressions.append((name, count, seconds, reference))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Mixamo Root data level benchmarks")
+    parser.add_argument('--clips', type=int, nargs='+', default=list(CLIP_COUNTS))
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run(args.clips, args.frames, args.repeat, args.cases)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'frames': args.frames, 'results': results}, f, indent=1)
+        print("[Mixamo Root] benchmark: baseline saved to " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("[Mixamo Root] benchmark: no baseline at %s, run with --save-baseline first" % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('frames') != args.frames:
+        print("[Mixamo Root] benchmark: baseline was recorded with %s frames, not comparing" % baseline.get('frames'))
+        return 0
+    regressions = compare(results, baseline['results'], args.threshold)
+    for name, count, seconds, reference in regressions:
+        print("[Mixamo Root] benchmark: REGRESSION %s at %s clips: %.3fs, baseline %.3fs" % (name, count, seconds, reference))
+    return 1 if regressions else 0
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Synthetic mixamo-like data on the fakebpy stand-in: the 65 bone mixamorig skeleton and clips
+# keyed the way the fbx importer leaves them, location, rotation_quaternion and scale on every
+# bone and every frame, in centimeters.
+import numpy as np
+
+
+NAME_PREFIX = "mixamorig:"
+
+FINGERS = ('Thumb', 'Index', 'Middle', 'Ring', 'Pinky')
+
+# Rest heads (centimeters, Y up) of the main joints, fingers and end bones are placed off their parent
+_JOINTS = {
+    'Hips': (0.0, 100.0, 0.0), 'Spine': (0.0, 110.0, 0.0), 'Spine1': (0.0, 122.0, 0.0), 'Spine2': (0.0, 136.0, 0.0),
+    'Neck': (0.0, 150.0, 0.0), 'Head': (0.0, 160.0, 0.0), 'HeadTop_End': (0.0, 180.0, 0.0),
+    'Shoulder': (6.0, 145.0, 0.0), 'Arm': (16.0, 145.0, 0.0), 'ForeArm': (42.0, 145.0, 0.0), 'Hand': (66.0, 145.0, 0.0),
+    'UpLeg': (9.0, 95.0, 0.0), 'Leg': (9.0, 52.0, 0.0), 'Foot': (9.0, 9.0, 0.0), 'ToeBase': (9.0, 1.0, 12.0),
+    'Toe_End': (9.0, 1.0, 20.0),
+}
+
+
+def skeleton(name_prefix=NAME_PREFIX):
+    '''[(bone name, parent name or None, rest head)] of the mixamorig skeleton, parents first'''
+    bones = [('Hips', None, _JOINTS['Hips'])]
+    parent = 'Hips'
+    for name in ('Spine', 'Spine1', 'Spine2', 'Neck', 'Head', 'HeadTop_End'):
+        bones.append((name, parent, _JOINTS[name]))
+        parent = name
+    for side, sign in (('Left', 1.0), ('Right', -1.0)):
+        parent = 'Spine2'
+        for joint in ('Shoulder', 'Arm', 'ForeArm', 'Hand'):
+            x, y, z = _JOINTS[joint]
+            bones.append((side + joint, parent, (sign * x, y, z)))
+            parent = side + joint
+        for f, finger in enumerate(FINGERS):
+            parent = side + 'Hand'
+            for segment in range(1, 5):
+                head = (sign * (_JOINTS['Hand'][0] + 4.0 + 3.0 * segment), 145.0, 4.0 - 2.0 * f)
+                bones.append((side + 'Hand' + finger + str(segment), parent, head))
+                parent = side + 'Hand' + finger + str(segment)
+        parent = 'Hips'
+        for joint in ('UpLeg', 'Leg', 'Foot', 'ToeBase', 'Toe_End'):
+            x, y, z = _JOINTS[joint]
+            bones.append((side + joint, parent, (sign * x, y, z)))
+            parent = side + joint
+    return [(name_prefix + name, name_prefix + parent if parent else None, head) for name, parent, head in bones]
+
+def make_rig(data, name="Armature", name_prefix=NAME_PREFIX, meshes=1):
+    '''Armature object with the mixamorig bones and skinned child meshes (vertex groups only)'''
+    armature = data.armatures.new(name)
+    for bone_name, parent, head in skeleton(name_prefix):
+        bone = armature.bones.new(bone_name, head)
+        bone.parent = armature.bones[parent] if parent else None
+    rig = data.objects.new(name, armature)
+    for i in range(meshes):
+        mesh = data.objects.new("%s_mesh%d" % (name, i))
+        for bone in armature.bones:
+            mesh.vertex_groups.new(bone.name)
+        rig.children.append(mesh)
+    rig.animation_data_create()
+    return rig
+
+def _random_walk(rng, frames, size, step):
+    return np.cumsum(rng.normal(0.0, step, (frames, size)), axis=0)
+
+def make_clip(data, name, frames=60, name_prefix=NAME_PREFIX, seed=0):
+    '''Action keyed on every frame of every channel of every bone, like a mixamo fbx import'''
+    rng = np.random.default_rng(seed)
+    action = data.actions.new(name)
+    frame_numbers = np.arange(1, frames + 1, dtype=np.float64)
+    bezier = np.full(frames, 2, dtype=np.int32)
+    for bone_name, parent, head in skeleton(name_prefix):
+        if parent is None:
+            # Hips walk forward and bob up and down
+            location = np.column_stack((_random_walk(rng, frames, 1, 0.5)[:, 0],
+                                        5.0 * np.sin(frame_numbers / 5.0),
+                                        np.linspace(0.0, 3.0 * frames, frames)))
+        else:
+            location = np.zeros((frames, 3))
+        rotation = np.column_stack((np.ones(frames), _random_walk(rng, frames, 3, 0.02)))
+        rotation /= np.linalg.norm(rotation, axis=1, keepdims=True)
+        channels = (('location', location), ('rotation_quaternion', rotation), ('scale', np.ones((frames, 3))))
+        for prop, values in channels:
+            data_path = 'pose.bones["%s"].%s' % (bone_name, prop)
+            for index in range(values.shape[1]):
+                fc = action.fcurves.new(data_path, index, bone_name)
+                fc.keyframe_points._assign(np.column_stack((frame_numbers, values[:, index])), bezier)
+    return action
+
+def make_library(data, clips, frames=60, name_prefix=NAME_PREFIX, rig_name="Armature"):
+    '''A rig with clips actions as strips on its NLA, one track per clip, the last one also active'''
+    rig = make_rig(data, rig_name, name_prefix)
+    actions = [make_clip(data, "clip_%04d" % i, frames, name_prefix, seed=i) for i in range(clips)]
+    for action in actions:
+        track = rig.animation_data.nla_tracks.new()
+        track.strips.new(action.name, 0, action)
+    if actions:
+        rig.animation_data.action = actions[-1]
+    return rig, actions
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# On disk cache of processed clips. An entry holds every channel of an action after import,
+# root insertion, prefix removal and scaling, keyed by the hash of the source file and the
+# import settings that affect the result. Entries are evicted least recently used first.
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+try:
+    from . import fcurves
+except ImportError:
+    import fcurves
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_DIRNAME = ".mixamoroot_cache"
+# Bump when the stored layout or the processing changes, old entries are then never hit again
+CACHE_VERSION = 1
+
+
+class ClipCache:
+    '''Directory of .npz entries, one per processed clip'''
+
+    def __init__(self, directory, max_size_mb=512):
+        self.directory = directory
+        self.max_bytes = int(max_size_mb) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filepath, settings, data=None):
+        '''Hash of the file contents (data if already read) and the settings dict'''
+        digest = hashlib.sha1()
+        digest.update(json.dumps({'version': CACHE_VERSION, 'settings': settings}, sort_keys=True).encode())
+        if data is not None:
+            digest.update(data)
+            return digest.hexdigest()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def restore(self, key, actions, name):
+        '''Rebuilds the cached clip as a new action in actions (bpy.data.actions), None on a miss'''
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                data = {k: entry[k] for k in entry.files}
+        except (OSError, ValueError) as e:
+            log.warning("[Mixamo Root] Ignoring broken cache entry %s: %s" % (path, str(e)))
+            os.remove(path)
+            self.misses += 1
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        self.hits += 1
+        action = fcurves.write_action(actions, name, data)
+        action.use_fake_user = True
+        return action
+
+    def store(self, key, action):
+        path = self.path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **fcurves.read_action(action))
+        # Rename last so an interrupted write never leaves a half entry behind
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        '''Removes the least recently used entries until the cache fits in its size limit'''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Finding the files of an import and reading ahead of it. find_files() walks the source directory
+# with os.scandir, which gets file type and size from the directory listing without a stat per
+# file on most platforms. Prefetcher reads the next few files on background threads while blender
+# imports the current one, so network mounts and cold disks don't stall every import.
+import concurrent.futures
+import fnmatch
+import os
+
+
+ORDERS = ('name', 'size', 'size_desc', 'manifest')
+DEFAULT_PATTERN = "*.fbx"
+# Our own files and directories in the source directory (cache, journal, profile reports)
+IGNORED_PREFIX = ".mixamoroot"
+READ_CHUNK = 1024 * 1024
+
+
+def scan(source_dir, recursive=False, pattern=DEFAULT_PATTERN):
+    '''[(path relative to source_dir, size)] of the files matching pattern (case insensitive)'''
+    found = []
+    pattern = pattern.lower()
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(source_dir, relative)) as entries:
+            for entry in entries:
+                if entry.name.startswith(IGNORED_PREFIX):
+                    continue
+                path = os.path.join(relative, entry.name) if relative else entry.name
+                if entry.is_dir():
+                    if recursive:
+                        stack.append(path)
+                elif entry.is_file() and fnmatch.fnmatchcase(entry.name.lower(), pattern):
+                    found.append((path, entry.stat().st_size))
+    return found
+
+def read_manifest(manifest):
+    '''Relative paths listed in a manifest file, one per line, blank lines and # comments ignored'''
+    with open(manifest) as f:
+        lines = (line.strip() for line in f)
+        return [os.path.normpath(line) for line in lines if line and not line.startswith('#')]
+
+def find_files(source_dir, recursive=False, pattern=DEFAULT_PATTERN, order='name', manifest=""):
+    '''Paths relative to source_dir of the files to import, in import order.
+
+    order is 'name', 'size' (smallest first), 'size_desc' or 'manifest'. With a manifest its files
+    come first in the listed order, any other matching files follow by name.
+    '''
+    found = scan(source_dir, recursive, pattern)
+    if order == 'size':
+        found.sort(key=lambda item: (item[1], item[0]))
+    elif order == 'size_desc':
+        found.sort(key=lambda item: (-item[1], item[0]))
+    else:
+        found.sort()
+    files = [path for path, _ in found]
+    if manifest:
+        listed = read_manifest(manifest)
+        available = set(files)
+        first = [path for path in listed if path in available]
+        rest = set(first)
+        files = first + [path for path in files if path not in rest]
+    return files
+
+def _read(path, keep):
+    # Reading the whole file is what gets it into the page cache, also when the bytes are not kept
+    with open(path, 'rb') as f:
+        if keep:
+            return f.read()
+        while f.read(READ_CHUNK):
+            pass
+    return None
+
+class Prefetcher:
+    '''Reads up to depth files ahead of the one being imported on a small thread pool.
+
+    With keep the contents stay in memory until take() hands them out, for the code that can read
+    from bytes (fbxanim, the clip cache). Otherwise files are only read into the OS page cache.
+    '''
+
+    def __init__(self, paths, depth=4, workers=2, keep=False):
+        self.paths = list(paths)
+        self.depth = depth
+        self.keep = keep
+        self.futures = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="mixamoroot_prefetch")
+
+    def advance(self, index):
+        '''Makes sure files index .. index + depth are being read, forgets the ones before index'''
+        for i in [i for i in self.futures if i < index]:
+            self.futures.pop(i).cancel()
+        for i in range(index, min(index + self.depth + 1, len(self.paths))):
+            if i not in self.futures:
+                self.futures[i] = self.executor.submit(_read, self.paths[i], self.keep)
+
+    def take(self, index):
+        '''Contents of file index if kept in memory (waits for the read), else None'''
+        future = self.futures.pop(index, None)
+        if future is None or not self.keep:
+            return None
+        try:
+            return future.result()
+        except OSError:
+            # The importer reports the problem with the file itself
+            return None
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
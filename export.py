@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# glTF export of the actions of one armature, for Godot. Either a single file with every action,
+# or one file per action written by a pool of background blender processes, each working on a
+# copy of the blend file. Per action exports are skipped while the output exists and the hash of
+# the action's keys (plus the export settings) matches the one recorded in the output directory.
+#
+# Usage, from a shell:
+#   blender --background library.blend --python export.py -- --output-dir ./godot/anims --per-action --workers 4
+#   blender --background library.blend --python export.py -- --output-dir ./godot --format GLTF_SEPARATE
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+
+log = logging.getLogger(__name__)
+
+FORMATS = {'GLB': ".glb", 'GLTF_SEPARATE': ".gltf"}
+# Hash and export time per action, kept in the output directory
+MANIFEST_NAME = ".mixamoroot_export.json"
+
+
+def _fcurves():
+    try:
+        from . import fcurves
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import fcurves
+    return fcurves
+
+def armature_actions(armature):
+    '''Actions with channels on bones of armature, by name'''
+    bones = armature.data.bones
+    actions = []
+    for action in bpy.data.actions:
+        for fc in action.fcurves:
+            if fc.data_path.startswith('pose.bones["') and fc.data_path.split('"')[1] in bones:
+                actions.append(action)
+                break
+    return sorted(actions, key=lambda action: action.name)
+
+def action_hash(action, settings):
+    '''Hash of every key of an action and the export settings'''
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    data = _fcurves().read_action(action)
+    for name in sorted(data):
+        digest.update(name.encode())
+        digest.update(data[name].tobytes())
+    return digest.hexdigest()
+
+def output_path(output_dir, action_name, export_format='GLB'):
+    return os.path.join(output_dir, bpy.path.clean_name(action_name) + FORMATS[export_format])
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def gltf_settings(export_format, all_actions):
+    # Only the options this blender's glTF exporter knows, they changed between versions
+    available = bpy.ops.export_scene.gltf.get_rna_type().properties.keys()
+    settings = {'export_format': export_format, 'use_selection': True, 'export_animations': True}
+    if 'export_animation_mode' in available:
+        settings['export_animation_mode'] = 'ACTIONS' if all_actions else 'ACTIVE_ACTIONS'
+    elif 'export_nla_strips' in available:
+        settings['export_nla_strips'] = all_actions
+    if 'export_force_sampling' in available:
+        settings['export_force_sampling'] = True
+    return {key: value for key, value in settings.items() if key in available}
+
+def select_for_export(armature, include_children=True):
+    for obj in bpy.context.view_layer.objects:
+        obj.select_set(False)
+    armature.select_set(True)
+    if include_children:
+        for child in armature.children:
+            child.select_set(True)
+    bpy.context.view_layer.objects.active = armature
+
+def export_combined(armature, filepath, export_format='GLB', include_children=True):
+    '''One file with every action of armature, each on its own temporary NLA track. Returns seconds'''
+    actions = armature_actions(armature)
+    if armature.animation_data is None:
+        armature.animation_data_create()
+    animation_data = armature.animation_data
+    active_action = animation_data.action
+    animation_data.action = None
+    tracks = []
+    for action in actions:
+        track = animation_data.nla_tracks.new()
+        track.name = action.name
+        track.strips.new(action.name, int(action.frame_range[0]), action)
+        tracks.append(track)
+    select_for_export(armature, include_children)
+    start = time.perf_counter()
+    try:
+        bpy.ops.export_scene.gltf(filepath=filepath, **gltf_settings(export_format, True))
+    finally:
+        for track in tracks:
+            animation_data.nla_tracks.remove(track)
+        animation_data.action = active_action
+    seconds = time.perf_counter() - start
+    print("[Mixamo Root] Exported %d actions to %s in %.2fs" % (len(actions), filepath, seconds))
+    return seconds
+
+def export_action(armature, action, filepath, export_format='GLB', include_children=True):
+    '''One file with only action, as the armature's active action with its NLA muted. Returns seconds'''
+    if armature.animation_data is None:
+        armature.animation_data_create()
+    animation_data = armature.animation_data
+    active_action = animation_data.action
+    muted = [(track, track.mute) for track in animation_data.nla_tracks]
+    for track, _ in muted:
+        track.mute = True
+    animation_data.action = action
+    select_for_export(armature, include_children)
+    start = time.perf_counter()
+    try:
+        bpy.ops.export_scene.gltf(filepath=filepath, **gltf_settings(export_format, False))
+    finally:
+        animation_data.action = active_action
+        for track, mute in muted:
+            track.mute = mute
+    return time.perf_counter() - start
+
+def export_actions(armature, names, output_dir, export_format='GLB', include_children=True):
+    '''Exports the named actions one file each in this process. Returns {name: seconds}'''
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    for name in names:
+        action = bpy.data.actions.get(name)
+        if action is None:
+            log.warning("[Mixamo Root] No action %s to export" % name)
+            continue
+        try:
+            timings[name] = export_action(armature, action, output_path(output_dir, name, export_format), export_format, include_children)
+        except Exception as e:
+            log.error("[Mixamo Root] ERROR exporting %s raised %s" % (name, str(e)))
+            continue
+        print("[Mixamo Root] Exported %s in %.2fs" % (name, timings[name]))
+    return timings
+
+def split_names(names, workers):
+    return [names[i::workers] for i in range(min(workers, len(names)))]
+
+def export_per_action(armature, output_dir, export_format='GLB', workers=1, include_children=True,
+                      blender=None, work_dir=None, force=False):
+    '''One file per action of armature, skipping unchanged ones. Returns {name: seconds} of the exported actions.
+
+    With more than one worker the actions are split across background blender processes that
+    each open a copy of the current blend file.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {'format': export_format, 'include_children': include_children, 'armature': armature.name}
+    manifest = load_manifest(output_dir)
+    hashes = {}
+    pending = []
+    for action in armature_actions(armature):
+        hashes[action.name] = action_hash(action, settings)
+        recorded = manifest.get(action.name, {})
+        if not force and recorded.get('hash') == hashes[action.name] and os.path.exists(output_path(output_dir, action.name, export_format)):
+            continue
+        pending.append(action.name)
+    print("[Mixamo Root] %d of %d actions changed since the last export" % (len(pending), len(hashes)))
+
+    start = time.perf_counter()
+    if workers <= 1 or len(pending) <= 1:
+        timings = export_actions(armature, pending, output_dir, export_format, include_children)
+    else:
+        timings = run_pool(armature, pending, output_dir, export_format, workers, include_children, blender, work_dir)
+    for name, seconds in timings.items():
+        manifest[name] = {'hash': hashes[name], 'file': os.path.basename(output_path(output_dir, name, export_format)), 'seconds': seconds}
+    save_manifest(output_dir, manifest)
+    print("[Mixamo Root] Exported %d actions in %.2fs" % (len(timings), time.perf_counter() - start))
+    return timings
+
+def run_pool(armature, names, output_dir, export_format, workers, include_children=True, blender=None, work_dir=None):
+    '''Runs export_actions for shares of names in background blender processes. Returns {name: seconds}'''
+    work_dir = work_dir or tempfile.mkdtemp(prefix="mixamoroot_export_")
+    os.makedirs(work_dir, exist_ok=True)
+    blend_copy = os.path.join(work_dir, "export_source.blend")
+    # The workers need the actions as they are now, saved or not
+    bpy.ops.wm.save_as_mainfile(filepath=blend_copy, copy=True)
+    script = os.path.abspath(__file__)
+    processes = []
+    for i, shard in enumerate(split_names(names, workers)):
+        list_path = os.path.join(work_dir, "export_%02d.json" % i)
+        result_path = os.path.join(work_dir, "export_%02d_result.json" % i)
+        log_path = os.path.join(work_dir, "export_%02d.log" % i)
+        with open(list_path, 'w') as f:
+            json.dump(shard, f)
+        cmd = [blender or bpy.app.binary_path, '--background', blend_copy, '--python', script, '--',
+               '--worker', list_path, '--result', result_path, '--armature', armature.name,
+               '--output-dir', os.path.abspath(output_dir), '--format', export_format]
+        if not include_children:
+            cmd.append('--skeleton-only')
+        log_file = open(log_path, 'w')
+        processes.append((subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT), log_file, result_path, log_path))
+        print("[Mixamo Root] export worker %d: %d actions, log %s" % (i, len(shard), log_path))
+
+    timings = {}
+    for process, log_file, result_path, log_path in processes:
+        code = process.wait()
+        log_file.close()
+        if code != 0:
+            log.warning("[Mixamo Root] export worker exited with code %d, see %s" % (code, log_path))
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                timings.update(json.load(f))
+    for name, seconds in sorted(timings.items()):
+        print("[Mixamo Root] Exported %s in %.2fs" % (name, seconds))
+    return timings
+
+def find_armature(name=None):
+    if name:
+        return bpy.data.objects.get(name)
+    active = bpy.context.view_layer.objects.active
+    if active is not None and active.type == 'ARMATURE':
+        return active
+    return next((obj for obj in bpy.context.scene.objects if obj.type == 'ARMATURE'), None)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Mixamo Root glTF exporter, run inside blender with the library .blend open")
+    parser.add_argument('--output-dir', required=True, help="Directory for the exported files")
+    parser.add_argument('--armature', help="Armature object to export, the active or first armature by default")
+    parser.add_argument('--format', default='GLB', choices=list(FORMATS))
+    parser.add_argument('--per-action', action='store_true', help="One file per action instead of one file with all actions")
+    parser.add_argument('--name', default="animations", help="File name (without extension) of the combined export")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Blender processes for per action exports")
+    parser.add_argument('--blender', help="Blender executable used for the workers, this one by default")
+    parser.add_argument('--work-dir', help="Directory for the blend copy and worker logs, a temp dir by default")
+    parser.add_argument('--skeleton-only', action='store_true', help="Leave the child meshes of the armature out")
+    parser.add_argument('--force', action='store_true', help="Export unchanged actions again")
+    # Internal, used by the parent to start workers
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        # Blender passes script arguments after '--'
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if bpy is None:
+        log.error("[Mixamo Root] ERROR export.py has to run inside blender")
+        return 2
+    armature = find_armature(args.armature)
+    if armature is None or armature.type != 'ARMATURE':
+        log.error("[Mixamo Root] ERROR no armature to export")
+        return 2
+    include_children = not args.skeleton_only
+    if args.worker:
+        with open(args.worker) as f:
+            names = json.load(f)
+        timings = export_actions(armature, names, args.output_dir, args.format, include_children)
+        with open(args.result, 'w') as f:
+            json.dump(timings, f)
+        return 0 if len(timings) == len(names) else 1
+    if args.per_action:
+        export_per_action(armature, args.output_dir, args.format, args.workers, include_children,
+                          args.blender, args.work_dir, args.force)
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        export_combined(armature, os.path.join(args.output_dir, args.name + FORMATS[args.format]), args.format, include_children)
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    if bpy is None or bpy.app.background:
+        sys.exit(code)
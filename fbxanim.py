@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Minimal streaming reader for the animation of binary FBX 7.x files, as downloaded from mixamo.
+# Only GlobalSettings, the Objects that describe bones and animation curves, and Connections are
+# visited; everything else (geometry, materials, textures, ...) is skipped by seeking past it.
+# Arrays are decompressed straight into numpy buffers. This module does not use bpy.
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from . import transforms
+except ImportError:
+    import transforms
+
+FBX_MAGIC = b"Kaydara FBX Binary  \x00"
+FBX_KTIME = 46186158000 # FBX time units per second
+
+# GlobalSettings TimeMode -> frames per second, 14 is a custom rate (CustomFrameRate)
+FBX_FRAMERATES = {
+    1: 120.0, 2: 100.0, 3: 60.0, 4: 50.0, 5: 48.0, 6: 30.0, 7: 30.0,
+    8: 30.0 / 1.001, 9: 30.0 / 1.001, 10: 25.0, 11: 24.0, 13: 24.0 / 1.001,
+    15: 96.0, 16: 72.0, 17: 60.0 / 1.001, 18: 120.0 / 1.001,
+}
+
+# Blender's fbx importer places the first key at frame 1 by default ("Animation Offset")
+DEFAULT_FRAME_OFFSET = 1.0
+
+# RotationOrder enum -> euler order
+ROTATION_ORDERS = ('XYZ', 'XZY', 'YZX', 'YXZ', 'ZXY', 'ZYX')
+
+CHANNELS = {'Lcl Translation': 'T', 'Lcl Rotation': 'R', 'Lcl Scaling': 'S'}
+
+_SCALARS = {b'Y': struct.Struct('<h'), b'C': struct.Struct('<?'), b'I': struct.Struct('<i'),
+            b'F': struct.Struct('<f'), b'D': struct.Struct('<d'), b'L': struct.Struct('<q')}
+_ARRAYS = {b'f': '<f4', b'd': '<f8', b'l': '<i8', b'i': '<i4', b'b': 'u1'}
+_ARRAY_HEADER = struct.Struct('<III')
+_UINT = struct.Struct('<I')
+
+# Pose of one bone over the frames of one animation, in the bone's rest space like a blender pose bone
+BoneTrack = namedtuple('BoneTrack', 'bone frames location rotation_quaternion scale')
+Animation = namedtuple('Animation', 'name fps tracks')
+
+
+class _Reader:
+    '''Random access over the node records of a binary fbx held in memory'''
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        if bytes(self.view[:len(FBX_MAGIC)]) != FBX_MAGIC:
+            raise ValueError("Not a binary FBX file")
+        self.version = _UINT.unpack_from(self.view, 23)[0]
+        if self.version < 7000:
+            raise ValueError("Unsupported FBX version %d, only 7.x is supported" % self.version)
+        # 7.5 and later use 64 bit record headers
+        self.header = struct.Struct('<QQQ' if self.version >= 7500 else '<III')
+
+    def node(self, offset):
+        '''Returns (name, end, props_offset, prop_count, children_offset) or None for a null record'''
+        end, count, length = self.header.unpack_from(self.view, offset)
+        if end == 0:
+            return None
+        offset += self.header.size
+        name_len = self.view[offset]
+        name = bytes(self.view[offset + 1:offset + 1 + name_len]).decode('ascii')
+        props = offset + 1 + name_len
+        return name, end, props, count, props + length
+
+    def children(self, start, end):
+        offset = start
+        while offset < end:
+            node = self.node(offset)
+            if node is None:
+                break
+            yield node
+            offset = node[1]
+
+    def top_level(self):
+        return self.children(27, len(self.view))
+
+    def props(self, offset, count):
+        view = self.view
+        values = []
+        for _ in range(count):
+            code = bytes(view[offset:offset + 1])
+            offset += 1
+            if code in _SCALARS:
+                fmt = _SCALARS[code]
+                values.append(fmt.unpack_from(view, offset)[0])
+                offset += fmt.size
+            elif code in _ARRAYS:
+                length, encoding, stored = _ARRAY_HEADER.unpack_from(view, offset)
+                offset += _ARRAY_HEADER.size
+                raw = view[offset:offset + stored]
+                offset += stored
+                if encoding == 1:
+                    raw = zlib.decompress(raw)
+                values.append(np.frombuffer(raw, dtype=_ARRAYS[code], count=length))
+            elif code in (b'S', b'R'):
+                length = _UINT.unpack_from(view, offset)[0]
+                offset += _UINT.size
+                raw = bytes(view[offset:offset + length])
+                offset += length
+                values.append(raw.decode('utf-8', 'replace') if code == b'S' else raw)
+            else:
+                raise ValueError("Unknown FBX property type %r at offset %d" % (code, offset - 1))
+        return values
+
+    def node_props(self, node):
+        return self.props(node[2], node[3])
+
+    def child(self, node, name):
+        for sub in self.children(node[4], node[1]):
+            if sub[0] == name:
+                return sub
+        return None
+
+    def properties70(self, node):
+        props = self.child(node, 'Properties70')
+        if props is None:
+            return {}
+        result = {}
+        for p in self.children(props[4], props[1]):
+            values = self.node_props(p)
+            result[values[0]] = values[4:]
+        return result
+
+
+def _object_name(name):
+    # Object names are stored as "Name\x00\x01Class"
+    return name.split('\x00\x01')[0]
+
+def _euler_matrices(degrees, order='XYZ'):
+    '''(n, 3) euler angles in degrees -> (n, 4, 4) rotation matrices'''
+    rotation = transforms.euler_matrices(np.radians(np.asarray(degrees, dtype=np.float64)), order)
+    result = np.broadcast_to(np.eye(4), (len(rotation), 4, 4)).copy()
+    result[:, :3, :3] = rotation
+    return result
+
+def _local_matrices(translation, rotation, scale, pre_rotation, post_rotation, order):
+    '''Composes FBX local transforms T * Rpre * R * Rpost^-1 * S for (n, 3) channel arrays'''
+    n = len(translation)
+    t = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+    t[:, :3, 3] = translation
+    s = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+    s[:, 0, 0], s[:, 1, 1], s[:, 2, 2] = scale[:, 0], scale[:, 1], scale[:, 2]
+    pre = _euler_matrices([pre_rotation])[0]
+    post_inv = np.linalg.inv(_euler_matrices([post_rotation])[0])
+    return t @ pre @ _euler_matrices(rotation, order) @ post_inv @ s
+
+class _Model:
+    __slots__ = ('name', 'kind', 'props', 'parent', 'channels')
+
+    def __init__(self, name, kind, props):
+        self.name = name
+        self.kind = kind
+        self.props = props
+        self.parent = None
+        self.channels = {} # 'T'/'R'/'S' -> curve node id
+
+    def static(self, key, default):
+        return np.array(self.props.get(key, default)[:3], dtype=np.float64)
+
+    def rest_matrix(self):
+        order = ROTATION_ORDERS[int(self.props.get('RotationOrder', (0,))[0])]
+        return _local_matrices(self.static('Lcl Translation', (0, 0, 0))[None],
+                               self.static('Lcl Rotation', (0, 0, 0))[None],
+                               self.static('Lcl Scaling', (1, 1, 1))[None],
+                               self.static('PreRotation', (0, 0, 0)),
+                               self.static('PostRotation', (0, 0, 0)), order)[0]
+
+
+def _read_objects(reader, objects_node):
+    models, stacks, layers, curve_nodes, curves, bind_pose = {}, {}, set(), {}, {}, {}
+    for node in reader.children(objects_node[4], objects_node[1]):
+        kind = node[0]
+        if kind not in ('Model', 'AnimationStack', 'AnimationLayer', 'AnimationCurveNode', 'AnimationCurve', 'Pose'):
+            continue
+        props = reader.node_props(node)
+        uid, name = props[0], _object_name(props[1])
+        if kind == 'Model':
+            models[uid] = _Model(name, props[2], reader.properties70(node))
+        elif kind == 'AnimationStack':
+            stacks[uid] = name
+        elif kind == 'AnimationLayer':
+            layers.add(uid)
+        elif kind == 'AnimationCurveNode':
+            defaults = reader.properties70(node)
+            curve_nodes[uid] = {'defaults': {k[2:]: v[0] for k, v in defaults.items() if k.startswith('d|')}, 'curves': {}}
+        elif kind == 'AnimationCurve':
+            times = reader.child(node, 'KeyTime')
+            values = reader.child(node, 'KeyValueFloat')
+            if times is not None and values is not None:
+                curves[uid] = (reader.node_props(times)[0], reader.node_props(values)[0])
+        elif kind == 'Pose' and props[2] == 'BindPose':
+            for pose_node in reader.children(node[4], node[1]):
+                if pose_node[0] != 'PoseNode':
+                    continue
+                target = reader.child(pose_node, 'Node')
+                matrix = reader.child(pose_node, 'Matrix')
+                if target is not None and matrix is not None:
+                    # FBX matrices are stored column major
+                    bind_pose[reader.node_props(target)[0]] = reader.node_props(matrix)[0].reshape(4, 4).T
+    return models, stacks, layers, curve_nodes, curves, bind_pose
+
+def _read_frame_rate(reader, node):
+    props = reader.properties70(node)
+    mode = int(props.get('TimeMode', (0,))[0])
+    if mode in FBX_FRAMERATES:
+        return FBX_FRAMERATES[mode]
+    return float(props.get('CustomFrameRate', (30.0,))[0]) if mode == 14 else 30.0
+
+def _channel_values(curve_node, curves, times, static):
+    '''Samples the X/Y/Z curves of a curve node at times, missing axes use their default'''
+    values = np.empty((len(times), 3))
+    for i, axis in enumerate('XYZ'):
+        curve = curves.get(curve_node['curves'].get(axis))
+        if curve is not None and len(curve[0]):
+            values[:, i] = np.interp(times, curve[0], curve[1])
+        else:
+            values[:, i] = curve_node['defaults'].get(axis, static[i])
+    return values
+
+def _bone_track(model, curve_nodes, curves, bind_pose, uid, parent_uid, fps, start_time, frame_offset):
+    nodes = {channel: curve_nodes[cid] for channel, cid in model.channels.items() if cid in curve_nodes}
+    key_times = [curves[cid][0] for node in nodes.values() for cid in node['curves'].values() if cid in curves]
+    if not key_times:
+        return None
+    times = np.unique(np.concatenate(key_times))
+    statics = {'T': model.static('Lcl Translation', (0, 0, 0)),
+               'R': model.static('Lcl Rotation', (0, 0, 0)),
+               'S': model.static('Lcl Scaling', (1, 1, 1))}
+    channels = {}
+    for channel, static in statics.items():
+        if channel in nodes:
+            channels[channel] = _channel_values(nodes[channel], curves, times, static)
+        else:
+            channels[channel] = np.broadcast_to(static, (len(times), 3))
+    order = ROTATION_ORDERS[int(model.props.get('RotationOrder', (0,))[0])]
+    anim = _local_matrices(channels['T'], channels['R'], channels['S'],
+                           model.static('PreRotation', (0, 0, 0)), model.static('PostRotation', (0, 0, 0)), order)
+
+    # Rest pose relative to the parent bone, from the bind pose when the file has one
+    if uid in bind_pose and parent_uid in bind_pose:
+        rest = np.linalg.inv(bind_pose[parent_uid]) @ bind_pose[uid]
+    else:
+        rest = model.rest_matrix()
+    basis = np.linalg.inv(rest) @ anim
+
+    scale = np.linalg.norm(basis[:, :3, :3], axis=1)
+    rotation = basis[:, :3, :3] / scale[:, None, :]
+    frames = (times - start_time) / FBX_KTIME * fps + frame_offset
+    return BoneTrack(model.name, frames.astype(np.float32), basis[:, :3, 3].astype(np.float32),
+                     transforms.matrices_to_quaternions(rotation).astype(np.float32), scale.astype(np.float32))
+
+def read_animations(source, frame_offset=DEFAULT_FRAME_OFFSET, bone_types=('LimbNode',)):
+    '''Reads the bone animations of a binary fbx file.
+
+    source is a file path or the file contents as bytes. Returns one Animation per animation stack,
+    each holding a BoneTrack per animated bone with dense float32 arrays over its key frames.
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = source
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    reader = _Reader(data)
+
+    fps = 30.0
+    objects = None
+    connections = []
+    for node in reader.top_level():
+        if node[0] == 'GlobalSettings':
+            fps = _read_frame_rate(reader, node)
+        elif node[0] == 'Objects':
+            objects = _read_objects(reader, node)
+        elif node[0] == 'Connections':
+            connections = [reader.node_props(c) for c in reader.children(node[4], node[1]) if c[0] == 'C']
+    if objects is None:
+        return []
+    models, stacks, layers, curve_nodes, curves, bind_pose = objects
+
+    layer_stack = {}
+    node_layer = {}
+    for c in connections:
+        kind, child, parent = c[0], c[1], c[2]
+        if child in curves and parent in curve_nodes and kind == 'OP':
+            curve_nodes[parent]['curves'][c[3][2:]] = child
+        elif child in curve_nodes and parent in models and kind == 'OP' and c[3] in CHANNELS:
+            models[parent].channels[CHANNELS[c[3]]] = child
+        elif child in curve_nodes and parent in layers:
+            node_layer[child] = parent
+        elif child in layers and parent in stacks:
+            layer_stack[child] = parent
+        elif child in models and parent in models:
+            models[child].parent = parent
+
+    animations = []
+    for stack_uid, stack_name in (stacks.items() or [(None, "")]):
+        stack_nodes = {cid: node for cid, node in curve_nodes.items()
+                       if stack_uid is None or layer_stack.get(node_layer.get(cid)) == stack_uid}
+        stack_times = [curves[cid][0][0] for node in stack_nodes.values()
+                       for cid in node['curves'].values() if cid in curves and len(curves[cid][0])]
+        start_time = min(stack_times) if stack_times else 0
+        tracks = []
+        for uid, model in models.items():
+            if model.kind not in bone_types:
+                continue
+            track = _bone_track(model, stack_nodes, curves, bind_pose, uid, model.parent, fps, start_time, frame_offset)
+            if track is not None:
+                tracks.append(track)
+        animations.append(Animation(stack_name, fps, tracks))
+    return animations
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Data level F-Curve helpers. Everything in here works directly on actions and
+# keyframe_points through foreach_get/foreach_set, so none of it needs an editor
+# area, selection state or operators, and it runs fine in blender --background.
+import numpy as np
+
+
+# Per keyframe vector attributes, each stored as an (n, 2) float32 array of (frame, value)
+KEY_ATTRS = ('co', 'handle_left', 'handle_right')
+# Keyframe.interpolation 'LINEAR' as foreach_get/foreach_set see it
+LINEAR = 1
+
+
+def bone_data_path(bone_name, prop="location"):
+    return 'pose.bones["' + bone_name + '"].' + prop
+
+def find_fcurves(action, data_path):
+    '''Returns the fcurves of an action matching data_path, ordered by array index'''
+    curves = [fc for fc in action.fcurves if fc.data_path == data_path]
+    return sorted(curves, key=lambda fc: fc.array_index)
+
+def ensure_fcurve(action, data_path, index=0, group_name=None):
+    '''Returns the fcurve for data_path[index], creating it if it does not exist'''
+    fc = action.fcurves.find(data_path, index=index)
+    if fc is None:
+        if group_name:
+            fc = action.fcurves.new(data_path, index=index, action_group=group_name)
+        else:
+            fc = action.fcurves.new(data_path, index=index)
+    return fc
+
+def read_keys(fcurve):
+    '''Reads every keyframe point of an fcurve into a dict of numpy arrays'''
+    points = fcurve.keyframe_points
+    count = len(points)
+    keys = {}
+    for attr in KEY_ATTRS:
+        buf = np.empty(count * 2, dtype=np.float32)
+        points.foreach_get(attr, buf)
+        keys[attr] = buf.reshape(count, 2)
+    interpolation = np.empty(count, dtype=np.int32)
+    points.foreach_get('interpolation', interpolation)
+    keys['interpolation'] = interpolation
+    return keys
+
+def resize_points(points, count):
+    '''Grows or shrinks a keyframe_points collection to exactly count points'''
+    current = len(points)
+    if current < count:
+        points.add(count - current)
+    else:
+        # Removing from the end keeps the remaining indices stable
+        for i in range(current - 1, count - 1, -1):
+            points.remove(points[i], fast=True)
+
+def write_keys(fcurve, keys):
+    '''Replaces the keyframe points of an fcurve with the arrays in keys (see read_keys)'''
+    points = fcurve.keyframe_points
+    count = len(keys['co'])
+    resize_points(points, count)
+    for attr in KEY_ATTRS:
+        # Missing handles start on the key itself and get placed by fcurve.update()
+        values = keys.get(attr, keys['co'])
+        points.foreach_set(attr, np.ascontiguousarray(values, dtype=np.float32).ravel())
+    if 'interpolation' in keys:
+        points.foreach_set('interpolation', np.ascontiguousarray(keys['interpolation'], dtype=np.int32))
+    fcurve.update()
+
+def transfer_location(action, source_bone, target_bone, remove_source=True):
+    '''Moves the location fcurves of source_bone onto target_bone within an action.
+
+    This is the data level equivalent of copying the hip location channels in the graph editor,
+    pasting them onto the root and deleting the originals. Existing target curves are overwritten.
+    Returns the number of channels moved.
+    '''
+    source_path = bone_data_path(source_bone)
+    target_path = bone_data_path(target_bone)
+    source_curves = find_fcurves(action, source_path)
+    for fc in source_curves:
+        keys = read_keys(fc)
+        target = ensure_fcurve(action, target_path, fc.array_index, target_bone)
+        write_keys(target, keys)
+    if remove_source:
+        for fc in source_curves:
+            action.fcurves.remove(fc)
+    return len(source_curves)
+
+def location_fcurves(action):
+    '''Returns every location channel of an action, the same set the graph editor "Location" filter shows'''
+    return [fc for fc in action.fcurves if fc.data_path.endswith('location')]
+
+def scale_values(fcurve_list, scale):
+    '''Multiplies the values (not the frames) of keys and handles of every fcurve by scale.
+
+    One foreach_get and one foreach_set per attribute and curve, equivalent to a graph editor
+    resize on the value axis around a cursor value of 0. Returns the number of keys touched.
+    '''
+    touched = 0
+    for fc in fcurve_list:
+        points = fc.keyframe_points
+        count = len(points)
+        if not count:
+            continue
+        buf = np.empty(count * 2, dtype=np.float32)
+        for attr in KEY_ATTRS:
+            points.foreach_get(attr, buf)
+            buf[1::2] *= scale
+            points.foreach_set(attr, buf)
+        fc.update()
+        touched += count
+    return touched
+
+def scale_locations(actions, scale=0.01):
+    '''Scales the location channels of all given actions in a single pass, e.g. centimeters to meters'''
+    touched = 0
+    for action in actions:
+        touched += scale_values(location_fcurves(action), scale)
+    return touched
+
+def read_action(action, channel_filter=None):
+    '''Packs every fcurve of an action (or those whose data path channel_filter accepts) into a
+    dict of flat numpy arrays, see write_action
+    '''
+    data_paths, array_indices, groups, counts = [], [], [], []
+    parts = {attr: [] for attr in KEY_ATTRS + ('interpolation',)}
+    for fc in action.fcurves:
+        if channel_filter is not None and not channel_filter(fc.data_path):
+            continue
+        keys = read_keys(fc)
+        data_paths.append(fc.data_path)
+        array_indices.append(fc.array_index)
+        groups.append(fc.group.name if fc.group else "")
+        counts.append(len(keys['co']))
+        for attr in parts:
+            parts[attr].append(keys[attr])
+    data = {
+        'data_paths': np.array(data_paths, dtype=str),
+        'array_indices': np.array(array_indices, dtype=np.int32),
+        'groups': np.array(groups, dtype=str),
+        'counts': np.array(counts, dtype=np.int64),
+    }
+    for attr in KEY_ATTRS:
+        data[attr] = np.concatenate(parts[attr]) if counts else np.empty((0, 2), dtype=np.float32)
+    data['interpolation'] = np.concatenate(parts['interpolation']) if counts else np.empty(0, dtype=np.int32)
+    return data
+
+def write_action(actions, name, data):
+    '''Creates a new action in actions (bpy.data.actions) from the arrays of read_action'''
+    action = actions.new(name)
+    ends = np.cumsum(data['counts'])
+    starts = ends - data['counts']
+    for i, data_path in enumerate(data['data_paths']):
+        fc = ensure_fcurve(action, str(data_path), int(data['array_indices'][i]), str(data['groups'][i]) or None)
+        keys = {attr: data[attr][starts[i]:ends[i]] for attr in KEY_ATTRS + ('interpolation',)}
+        write_keys(fc, keys)
+    return action
+
+def _channel_keys(data):
+    # (data path, array index) -> key arrays of every channel
+    ends = np.cumsum(data['counts'])
+    starts = ends - data['counts']
+    return {(str(data_path), int(index)): {attr: data[attr][start:end] for attr in KEY_ATTRS + ('interpolation',)}
+            for data_path, index, start, end in zip(data['data_paths'], data['array_indices'], starts, ends)}
+
+def update_action(action, data, previous=None):
+    '''Writes the arrays of read_action back into an existing action. Channels are created or
+    replaced, channels of the action that are not in data are removed. With previous, the arrays
+    the action was read into, channels whose keys did not change are not written and only the
+    channels in previous are candidates for removal.
+    '''
+    ends = np.cumsum(data['counts'])
+    starts = ends - data['counts']
+    unchanged = _channel_keys(previous) if previous is not None else {}
+    written = set()
+    for i, data_path in enumerate(data['data_paths']):
+        data_path = str(data_path)
+        index = int(data['array_indices'][i])
+        old = unchanged.get((data_path, index))
+        if old is not None and all(np.array_equal(old[attr], data[attr][starts[i]:ends[i]]) for attr in old):
+            written.add((data_path, index))
+            continue
+        group = str(data['groups'][i]) or None
+        fc = ensure_fcurve(action, data_path, index, group)
+        if len(fc.keyframe_points) > ends[i] - starts[i]:
+            # A new curve is cheaper than removing keys one by one
+            action.fcurves.remove(fc)
+            fc = ensure_fcurve(action, data_path, index, group)
+        write_keys(fc, {attr: data[attr][starts[i]:ends[i]] for attr in KEY_ATTRS + ('interpolation',)})
+        written.add((data_path, index))
+    removable = unchanged if previous is not None else None
+    for fc in [fc for fc in action.fcurves if (fc.data_path, fc.array_index) not in written]:
+        if removable is None or (fc.data_path, fc.array_index) in removable:
+            action.fcurves.remove(fc)
+    return action
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Journal of a batch import, one JSON line per file outcome appended to a file in the source
+# directory and synced to disk right away, so it survives blender crashing halfway. The last line
+# for a file wins. A file only counts as completed while its size and modification time are
+# still the ones recorded, an edited file is imported again on resume.
+import json
+import os
+import time
+
+
+FILENAME = ".mixamoroot_journal.jsonl"
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def file_stat(filepath):
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime
+
+class Journal:
+    '''Outcome per file name of the imports in one source directory'''
+
+    def __init__(self, source_dir, resume=False):
+        self.path = os.path.join(source_dir, FILENAME)
+        self.source_dir = source_dir
+        self.records = {}
+        if resume:
+            self.records = self.load(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self.counts = {DONE: 0, FAILED: 0, SKIPPED: 0}
+
+    @staticmethod
+    def load(path):
+        '''file name -> last record, a line cut off by a crash is ignored'''
+        records = {}
+        if not os.path.exists(path):
+            return records
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['file']] = record
+        return records
+
+    def completed(self, file):
+        '''The record of a file that was done (or skipped) and has not changed since, else None'''
+        record = self.records.get(file)
+        if record is None or record['status'] == FAILED:
+            return None
+        try:
+            size, mtime = file_stat(os.path.join(self.source_dir, file))
+        except OSError:
+            return None
+        if record.get('size') != size or record.get('mtime') != mtime:
+            return None
+        return record
+
+    def record(self, file, status, action=None, error=None):
+        try:
+            size, mtime = file_stat(os.path.join(self.source_dir, file))
+        except OSError:
+            # Removed or moved since, e.g. while recording why it failed. Never counts as completed
+            size = mtime = None
+        record = {'file': file, 'status': status, 'action': action, 'error': error,
+                  'size': size, 'mtime': mtime, 'time': time.time()}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[file] = record
+        self.counts[status] += 1
+        return record
+
+    def summary(self):
+        return ", ".join("%d %s" % (count, status) for status, count in self.counts.items())
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Forward kinematics of an armature over whole frame ranges with numpy, straight from the action's
+# keys, no scene evaluation. Pose matrices are armature space like pose_bone.matrix:
+#   pose[bone] = pose[parent] @ parent_rest^-1 @ rest[bone] @ basis[bone]
+# with rest the bone's matrix_local and basis built from its location, rotation and scale channels.
+# Every bone is evaluated for all frames at once as a stack of 4x4 matrices, so the world space
+# path of the hips over a long clip costs a few batched matrix products instead of a frame_set()
+# and matrix read per frame. root_motion() uses that path to split the hips' motion onto a root.
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from . import fcurves
+    from . import rootmotion
+    from . import transforms
+except ImportError:
+    import fcurves
+    import rootmotion
+    import transforms
+
+
+# names, parent index per bone (-1 for roots) and (n, 4, 4) armature space rest matrices
+Skeleton = namedtuple('Skeleton', 'names parents rest')
+
+
+def skeleton(armature):
+    '''Skeleton of an armature object's bones'''
+    bones = armature.data.bones
+    rest = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get('matrix_local', rest)
+    # foreach_get flattens matrices column by column
+    rest = rest.reshape(-1, 4, 4).transpose(0, 2, 1).astype(np.float64)
+    names = [bone.name for bone in bones]
+    parents = [bones.find(bone.parent.name) if bone.parent else -1 for bone in bones]
+    return Skeleton(names, parents, rest)
+
+def object_matrix(obj):
+    '''(4, 4) matrix_world of an object'''
+    return np.array(obj.matrix_world, dtype=np.float64)
+
+def rotation_modes(armature):
+    '''{bone name: rotation mode} of an armature's pose bones'''
+    return {bone.name: bone.rotation_mode for bone in armature.pose.bones}
+
+def action_channels(action):
+    '''{data_path: {array index: (n, 2) key coordinates}} of an action, read in one pass'''
+    channels = {}
+    for fc in action.fcurves:
+        channels.setdefault(fc.data_path, {})[fc.array_index] = fcurves.read_keys(fc)['co']
+    return channels
+
+def data_channels(data, bone_names=None):
+    '''action_channels() of fcurves.read_action() arrays, only the channels of bone_names if given'''
+    prefixes = tuple(fcurves.bone_data_path(name, '') for name in bone_names) if bone_names is not None else ('',)
+    ends = np.cumsum(data['counts'])
+    channels = {}
+    for row, data_path in enumerate(data['data_paths']):
+        data_path = str(data_path)
+        if data_path.startswith(prefixes):
+            channels.setdefault(data_path, {})[int(data['array_indices'][row])] = data['co'][ends[row] - data['counts'][row]:ends[row]]
+    return channels
+
+def basis_matrices(channels, bone_name, frames, rotation_mode='QUATERNION'):
+    '''(n, 4, 4) pose basis of one bone at frames from action_channels() output'''
+    def channel(prop):
+        return channels.get(fcurves.bone_data_path(bone_name, prop), {})
+    n = len(frames)
+    basis = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+    quaternion = channel('rotation_quaternion')
+    euler = channel('rotation_euler')
+    if rotation_mode in transforms.EULER_ORDERS and euler:
+        basis[:, :3, :3] = transforms.euler_matrices(rootmotion.sample_channels(euler, 3, (0.0, 0.0, 0.0), frames), rotation_mode)
+    elif quaternion:
+        basis[:, :3, :3] = transforms.quaternions_to_matrices(rootmotion.sample_channels(quaternion, 4, (1.0, 0.0, 0.0, 0.0), frames))
+    scale = channel('scale')
+    if scale:
+        basis[:, :3, :3] *= rootmotion.sample_channels(scale, 3, (1.0, 1.0, 1.0), frames)[:, None, :]
+    location = channel('location')
+    if location:
+        basis[:, :3, 3] = rootmotion.sample_channels(location, 3, (0.0, 0.0, 0.0), frames)
+    return basis
+
+def ancestors(skel, index):
+    '''Bone indices from the root down to index'''
+    chain = []
+    while index != -1:
+        chain.append(index)
+        index = skel.parents[index]
+    return chain[::-1]
+
+def pose_matrices(skel, channels, bone_names, frames, rotation_modes=None):
+    '''{bone name: (n, 4, 4) armature space pose matrices} for bone_names, evaluating each ancestor once'''
+    rotation_modes = rotation_modes or {}
+    frames = np.asarray(frames, dtype=np.float64)
+    computed = {}
+    for name in bone_names:
+        for index in ancestors(skel, skel.names.index(name)):
+            if index in computed:
+                continue
+            bone = skel.names[index]
+            local = skel.rest[index] @ basis_matrices(channels, bone, frames, rotation_modes.get(bone, 'QUATERNION'))
+            parent = skel.parents[index]
+            if parent == -1:
+                computed[index] = local
+            else:
+                computed[index] = computed[parent] @ (np.linalg.inv(skel.rest[parent]) @ local)
+    return {name: computed[skel.names.index(name)] for name in bone_names}
+
+def head_positions(skel, channels, bone_names, frames, rotation_modes=None):
+    '''{bone name: (n, 3) armature space head positions}'''
+    return {name: matrices[:, :3, 3] for name, matrices in pose_matrices(skel, channels, bone_names, frames, rotation_modes).items()}
+
+def world_matrices(skel, channels, bone_names, frames, object_matrix=None, rotation_modes=None):
+    '''{bone name: (n, 4, 4) world matrices}, pose_matrices() with the object transform applied'''
+    poses = pose_matrices(skel, channels, bone_names, frames, rotation_modes)
+    if object_matrix is None:
+        return poses
+    return {name: object_matrix @ matrices for name, matrices in poses.items()}
+
+def _rotations(matrices):
+    # Rotation part of (n, 3, 3) basis matrices, scale is applied to their columns
+    return matrices / np.linalg.norm(matrices, axis=1, keepdims=True)
+
+def root_motion(skel, channels, hip_bone, root_bone, options=None, rotation_modes=None):
+    '''rootmotion.extract() on the actual path of hip_bone, evaluated through its rest matrix.
+
+    Unlike moving the hip location channels this also holds when the hips are oriented differently
+    from the root. hip_bone must be a child of root_bone, channels are action_channels() of the hips
+    (the root's keys are ignored, they get replaced). The object transform cancels out in root
+    space. Returns (frames, RootMotion): root channels in the root's space, hip location and with
+    use_yaw rotation (quaternion or euler, the hips' rotation mode) as new hip channel values.
+    '''
+    options = dict(rootmotion.DEFAULT_OPTIONS, **(options or {}))
+    rotation_modes = rotation_modes or {}
+    hip, root = skel.names.index(hip_bone), skel.names.index(root_bone)
+    if skel.parents[hip] != root:
+        raise ValueError("%s is not a child of %s" % (hip_bone, root_bone))
+    prefix = fcurves.bone_data_path(hip_bone, '')
+    keys = [co[:, 0] for data_path, indices in channels.items() if data_path.startswith(prefix) for co in indices.values()]
+    if not keys:
+        return None, None
+    frames = np.unique(np.concatenate(keys)).astype(np.float64)
+    mode = rotation_modes.get(hip_bone, 'QUATERNION')
+    basis = basis_matrices(channels, hip_bone, frames, mode)
+
+    # Hips in the root's rest space: offset @ basis, with offset = root_rest^-1 @ hip_rest
+    offset = np.linalg.inv(skel.rest[root]) @ skel.rest[hip]
+    orientation, rest_head = offset[:3, :3], offset[:3, 3]
+    inverse = np.linalg.inv(orientation)
+    hips = offset @ basis
+    rotation = None
+    if options['use_yaw']:
+        # Hip rotation relative to its rest, as seen from the root
+        rotation = transforms.matrices_to_quaternions(orientation @ _rotations(basis[:, :3, :3]) @ inverse)
+    motion = rootmotion.extract(hips[:, :3, 3] - rest_head, rotation, options['project_ground'], options['clamp_floor'],
+                                options['floor_height'], options['use_yaw'], rest_head)
+
+    hip_location = motion.hip_location @ inverse.T
+    hip_rotation = None
+    if motion.root_rotation is not None:
+        # Undo the root's heading in the hip's own space: orientation^-1 @ R_root^-1 @ orientation
+        undo = inverse @ transforms.quaternions_to_matrices(transforms.quaternion_conjugate(motion.root_rotation)) @ orientation
+        rotated = undo @ _rotations(basis[:, :3, :3])
+        if mode in transforms.EULER_ORDERS:
+            hip_rotation = transforms.matrices_to_euler(rotated, mode)
+        else:
+            hip_rotation = transforms.matrices_to_quaternions(rotated)
+    return frames, rootmotion.RootMotion(motion.root_location, motion.root_rotation, hip_location, hip_rotation)
@@ -25,15 +25,57 @@
 # Original Script Created By: Average Godot Enjoyer (Johngoss725)
 # Bone Renaming Modifications, File Handling, And Addon By: Richard Perry
 import bpy
+import numpy as np
 import os
+import fnmatch
+import functools
 import logging
+import math
 from pathlib import Path
 
+try:
+    from . import fcurves
+    from . import fbxanim
+    from . import cache
+    from . import rootmotion
+    from . import reduction
+    from . import rename
+    from . import retarget
+    from . import profiling
+    from . import journal
+    from . import discovery
+    from . import animlib
+    from . import kinematics
+    from . import motionindex
+    from . import session
+    from . import resample
+    from . import pipeline
+    from . import nlalayout
+    from . import export
+except ImportError:
+    import fcurves
+    import fbxanim
+    import cache
+    import rootmotion
+    import reduction
+    import rename
+    import retarget
+    import profiling
+    import journal
+    import discovery
+    import animlib
+    import kinematics
+    import motionindex
+    import session
+    import resample
+    import pipeline
+    import nlalayout
+    import export
 
 log = logging.getLogger(__name__)
 
-# in future remove_prefix should be renamed to rename prefix and a target prefix should be specifiable via ui
-def fixBones(remove_prefix=False, name_prefix="mixamorig:"):
+# remove_prefix swaps name_prefix for target_prefix (nothing by default) on the imported rig and its action
+def fixBones(remove_prefix=False, name_prefix="mixamorig:", target_prefix=""):
     bpy.ops.object.mode_set(mode = 'OBJECT')
         
     if not bpy.ops.object:
@@ -45,75 +87,49 @@ def fixBones(remove_prefix=False, name_prefix="mixamorig:"):
     if remove_prefix:
         for rig in bpy.context.selected_objects:
             if rig.type == 'ARMATURE':
-                for mesh in rig.children:
-                    for vg in mesh.vertex_groups:
-                        new_name = vg.name
-                        new_name = new_name.replace(name_prefix,"")
-                        rig.pose.bones[vg.name].name = new_name
-                        vg.name = new_name
-                for bone in rig.pose.bones:
-                    bone.name = bone.name.replace(name_prefix,"")
-        for action in bpy.data.actions:
-            fc = action.fcurves
-            for f in fc:
-                f.data_path = f.data_path.replace(name_prefix,"")
+                rename.rename_rig(rig, name_prefix, target_prefix)
         
-def scaleAll():
+def scaleAll(unit_scale=0.01, actions=None):
+    # Scales the location channels of the imported actions, mixamo uses centimeters.
+    # Defaults to the action of the active object, pass actions to scale a whole batch in one pass
     bpy.ops.object.mode_set(mode='OBJECT')
-
-    prev_context=bpy.context.area.type
-        
-    bpy.ops.object.mode_set(mode='POSE')
-    bpy.ops.pose.select_all(action='SELECT')
-    bpy.context.area.type = 'GRAPH_EDITOR'
-    bpy.context.space_data.dopesheet.filter_text = "Location"
-    bpy.context.space_data.pivot_point = 'CURSOR'
-    bpy.context.space_data.dopesheet.use_filter_invert = False
-        
-    bpy.ops.anim.channels_select_all(action='SELECT')   
-        
-    bpy.ops.transform.resize(value=(1, 0.01, 1), orient_type='GLOBAL',
-    orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-    orient_matrix_type='GLOBAL',
-    constraint_axis=(False, True, False),
-    mirror=True, use_proportional_edit=False,
-    proportional_edit_falloff='SMOOTH',
-    proportional_size=1,
-    use_proportional_connected=False,
-    use_proportional_projected=False)
-
-
-def copyHips(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:"):
-    bpy.context.area.ui_type = 'FCURVES'
-    #SELECT OUR ROOT MOTION BONE 
-    bpy.ops.pose.select_all(action='DESELECT')
-    bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-    # SET FRAME TO ZERO
-    bpy.ops.graph.cursor_set(frame=0.0, value=0.0)
-    #ADD NEW KEYFRAME
-    bpy.ops.anim.keyframe_insert_menu(type='Location')
-    #SELECT ONLY HIPS AND LOCTAIUON GRAPH DATA
-    bpy.ops.pose.select_all(action='DESELECT')
-    bpy.context.object.pose.bones[hip_bone_name].bone.select = True        
-    bpy.context.area.ui_type = 'DOPESHEET'
-    bpy.context.space_data.dopesheet.filter_text = "Location"
-    bpy.context.area.ui_type = 'FCURVES'
-    #COPY THE LOCATION VALUES OF THE HIPS AND DELETE THEM         
-    bpy.ops.graph.copy()
-    bpy.ops.graph.select_all(action='DESELECT')
-    
-    myFcurves = bpy.context.object.animation_data.action.fcurves
-        
-    for i in myFcurves:
-        hip_bone_fcvurve = 'pose.bones["'+hip_bone_name+'"].location'
-        if str(i.data_path)==hip_bone_fcvurve:
-            myFcurves.remove(i)
-                
-    bpy.ops.pose.select_all(action='DESELECT')
-    bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-    bpy.ops.graph.paste()        
-        
-    bpy.context.area.ui_type = 'VIEW_3D'
+    if actions is None:
+        actions = [bpy.context.object.animation_data.action]
+    fcurves.scale_locations(actions, unit_scale)
+
+
+def active_actions():
+    # Action of the active object, what the import stages work on
+    obj = bpy.context.object
+    if obj is None or obj.animation_data is None or obj.animation_data.action is None:
+        return []
+    return [obj.animation_data.action]
+
+def hip_rest_head(armature, hip_bone_name, root_bone_name):
+    # Rest position of the hips in the root bone's space, used to compensate root rotation
+    bones = armature.data.bones
+    if hip_bone_name not in bones or root_bone_name not in bones:
+        return (0.0, 0.0, 0.0)
+    return tuple(bones[root_bone_name].matrix_local.inverted() @ bones[hip_bone_name].head_local)
+
+def skeleton_settings(armature, root_motion):
+    # pipeline.root_motion() arguments for world space root motion, read once on the main thread
+    if not (root_motion or {}).get('world_space'):
+        return {}
+    return {'skeleton': kinematics.skeleton(armature), 'rotation_modes': kinematics.rotation_modes(armature)}
+
+def copyHips(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:", root_motion=None):
+    # Moves the hip motion onto the root directly in the action data (see rootmotion for the
+    # options), no graph editor copy/paste so this also works without a visible area
+    armature = bpy.context.object
+    action = armature.animation_data.action
+    rest_head = hip_rest_head(armature, hip_bone_name, name_prefix + root_bone_name)
+    if (root_motion or {}).get('world_space'):
+        pipeline.process_actions([action], [functools.partial(pipeline.root_motion, hip_bone=hip_bone_name, root_bone=name_prefix + root_bone_name,
+                                                              options=root_motion, hip_rest_head=rest_head, **skeleton_settings(armature, root_motion))],
+                                 1, pipeline.bone_filter(hip_bone_name, name_prefix + root_bone_name))
+    else:
+        rootmotion.apply_to_action(action, hip_bone_name, name_prefix + root_bone_name, root_motion, rest_head)
     bpy.ops.object.mode_set(mode='OBJECT')
 
 def fix_bones_nla(remove_prefix=False, name_prefix="mixamorig:"):
@@ -125,136 +141,40 @@ def fix_bones_nla(remove_prefix=False, name_prefix="mixamorig:"):
     bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
     bpy.context.object.show_in_front = True
 
-def scale_all_nla(armature):
+def scale_all_nla(armature, unit_scale=0.01, workers=pipeline.DEFAULT_WORKERS):
     bpy.ops.object.mode_set(mode='OBJECT')
-
-    # prev_context=bpy.context.area.type
-
-    for track in [x for x in armature.animation_data.nla_tracks]:
-        bpy.context.active_nla_track = track
+    actions, _ = strip_actions(armature)
+    pipeline.process_actions(actions, [functools.partial(pipeline.scale_locations, scale=unit_scale)], workers,
+                             lambda data_path: data_path.endswith('location'))
+
+def strip_actions(armature):
+    # Unique actions behind the NLA strips of an armature, in track order, and the number of strips using them
+    actions = []
+    strips = 0
+    for track in armature.animation_data.nla_tracks:
         for strip in track.strips:
-            bpy.context.active_nla_strip = strip
-            print(bpy.context.active_nla_strip)
-
-        
-    bpy.ops.object.mode_set(mode='POSE')
-    bpy.ops.pose.select_all(action='SELECT')
-    bpy.context.area.type = 'GRAPH_EDITOR'
-    bpy.context.space_data.dopesheet.filter_text = "Location"
-    bpy.context.space_data.pivot_point = 'CURSOR'
-    bpy.context.space_data.dopesheet.use_filter_invert = False
-    
-    bpy.ops.anim.channels_select_all(action='SELECT')   
-        
-    bpy.ops.transform.resize(value=(1, 0.01, 1), orient_type='GLOBAL',
-    orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-    orient_matrix_type='GLOBAL',
-    constraint_axis=(False, True, False),
-    mirror=True, use_proportional_edit=False,
-    proportional_edit_falloff='SMOOTH',
-    proportional_size=1,
-    use_proportional_connected=False,
-    use_proportional_projected=False)
-
-def copy_hips_nla(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:"):
+            if strip.action is None:
+                continue
+            strips += 1
+            if strip.action not in actions:
+                actions.append(strip.action)
+    return actions, strips
+
+def copy_hips_nla(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:", root_motion=None, workers=pipeline.DEFAULT_WORKERS):
     hip_bone_name="Ctrl_Hips"
-    bpy.ops.object.mode_set(mode='POSE')
-    previous_context = bpy.context.area.ui_type
-    bpy.ops.pose.select_all(action='DESELECT')
-    while False:
-        #SELECT OUR ROOT MOTION BONE 
-        # bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-
-        # bpy.ops.nla.tweakmode_enter()
-        # bpy.context.area.ui_type = 'FCURVES'
-        
-        # # SET FRAME TO ZERO
-        # bpy.ops.graph.cursor_set(frame=0.0, value=0.0)
-        # #ADD NEW KEYFRAME
-        # bpy.ops.anim.keyframe_insert_menu(type='Location')
-        # #SELECT ONLY HIPS AND LOCTAIUON GRAPH DATA
-        # bpy.ops.pose.select_all(action='DESELECT')
-        # bpy.context.object.pose.bones[hip_bone_name].bone.select = True        
-        # bpy.context.area.ui_type = 'DOPESHEET'
-        # bpy.context.space_data.dopesheet.filter_text = "Location"
-        # bpy.context.area.ui_type = 'FCURVES'
-        # #COPY THE LOCATION VALUES OF THE HIPS AND DELETE THEM         
-        # bpy.ops.graph.copy()
-        # bpy.ops.graph.select_all(action='DESELECT')
-            
-        # myFcurves = bpy.context.object.animation_data.action.fcurves
-                
-        # for i in myFcurves:
-        #     hip_bone_fcvurve = 'pose.bones["'+hip_bone_name+'"].location'
-        #     if str(i.data_path)==hip_bone_fcvurve:
-        #         myFcurves.remove(i)
-                    
-        # bpy.ops.pose.select_all(action='DESELECT')
-        # bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-        # bpy.ops.graph.paste()
-
-        # for animation data in object
-        # for 
-        pass
-
-    for track in bpy.context.object.animation_data.nla_tracks:
-        bpy.context.object.animation_data.nla_tracks.active = track
-        for strip in track.strips:
-            bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-            bpy.context.area.ui_type = 'NLA_EDITOR'
-            bpy.ops.nla.tweakmode_enter()
-            bpy.context.area.ui_type = 'FCURVES'
-            hip_curves = [fc for fc in strip.fcurves if hip_bone_name in fc.data_path and fc.data_path.startswith('location')]
-            
-            # Copy Hips to root
-            ## Insert keyframe for root bone
-            start_frame = strip.action.frame_range[0]
-            # frame sets the x axis cursor (determines the frame, and value the y axis cursor, which is the amplitude of the curve)
-            bpy.ops.graph.cursor_set(frame=start_frame, value=0.0)
-            bpy.ops.anim.keyframe_insert_menu(type='Location')
-            bpy.ops.pose.select_all(action='DESELECT')
-
-            ## Copy Location fcruves
-            bpy.context.object.pose.bones[hip_bone_name].bone.select = True        
-            bpy.context.area.ui_type = 'DOPESHEET'
-            bpy.context.space_data.dopesheet.filter_text = "Location"
-            bpy.context.area.ui_type = 'FCURVES'
-            bpy.ops.graph.copy()
-            bpy.ops.graph.select_all(action='DESELECT')
-
-            ## We want to delete the hips locations
-            allFcurves = strip.fcurves
-            for fc in hip_curves:
-                allFcurves.remove(fc)
-
-            ## Paste location fcurves to the root bone
-            bpy.ops.pose.select_all(action='DESELECT')
-            bpy.context.object.pose.bones[name_prefix + root_bone_name].bone.select = True
-            bpy.ops.graph.paste()
-
-
-            loc_fcurves = [fc for fc in strip.fcurves if root_bone_name in fc.data_path and fc.data_path.startswith('location')]
-            
-            # Update Root Bone
-            # set z of root to min 0 (not negative).
-            for fc in loc_fcurves:
-                # Z axis location curve
-                if fc.array_index == 2:
-                    for kp in fc.keyframe_points:
-                        kp.co.z = min(0, abs(kp.co.z))
-                        
-            # Delete rotation curves for x(0) and y(1) axis. Should we delet Z rotation too? 
-            # rot_fcurves = [fc for fc in strip.fcurves if root_bone_name in fc.data_path and fc.data_path.startswith('rotation') and (fc.array_index == 0 or fc.array_index == 1)]
-            # for fc in rot_fcurves:
-            #     strip.fcurves.remove(fc)
-            # while(rot_fcurves):
-            #     fc = rot_fcurves.pop()
-            #     strip.fcurves.remove(fc)
-            bpy.context.area.ui_type = 'NLA_EDITOR'
-            bpy.ops.nla.tweakmode_exit()
-            bpy.context.area.ui_type = previous_context
     bpy.ops.object.mode_set(mode='OBJECT')
-    
+    armature = bpy.context.object
+    # The root never goes below the floor, whatever height is cut off stays on the hips
+    root_motion = dict(root_motion or {}, clamp_floor=True)
+    rest_head = hip_rest_head(armature, hip_bone_name, name_prefix + root_bone_name)
+    # Copy hips to root without entering tweak mode, once per action however many strips share it
+    actions, strips = strip_actions(armature)
+    timings = pipeline.process_actions(actions, [functools.partial(pipeline.root_motion, hip_bone=hip_bone_name, root_bone=name_prefix + root_bone_name,
+                                                                   options=root_motion, hip_rest_head=rest_head, **skeleton_settings(armature, root_motion))], workers,
+                                       pipeline.bone_filter(hip_bone_name, name_prefix + root_bone_name))
+    print("[Mixamo Root] Added root motion to %d actions, %d shared strips skipped (%s)" % (len(actions), strips - len(actions), format_timings(timings)))
+    return len(actions), strips - len(actions)
+
 def deleteArmature(imported_objects=set()):
     armature = None
     if bpy.context.selected_objects:
@@ -271,13 +191,18 @@ def deleteArmature(imported_objects=set()):
     if bpy.context.selected_objects:
         bpy.context.view_layer.objects.active = armature
 
-def import_armature(filepath, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:",  insert_root=False, delete_armatures=False):
+def resample_imported(action, resampling, source_fps):
+    # resampling holds the target 'fps' (0 keeps the rate) and the 'start_frame'
+    return resample.resample_action(action, resampling.get('fps', 0.0), source_fps, resampling.get('start_frame', 0.0))
+
+def import_armature(filepath, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:",  insert_root=False, delete_armatures=False, unit_scale=0.01, root_motion=None, key_reduction=None, target_prefix="", resampling=None):
     old_objs = set(bpy.context.scene.objects)
-    if insert_root:
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        bpy.ops.import_scene.fbx(filepath = filepath)#,  automatic_bone_orientation=True)
-    else:
-        bpy.ops.import_scene.fbx(filepath = filepath)#,  automatic_bone_orientation=True)
+    with profiling.stage('fbx_import', active_actions):
+        if insert_root and bpy.context.selected_objects:
+            bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+            bpy.ops.import_scene.fbx(filepath = filepath)#,  automatic_bone_orientation=True)
+        else:
+            bpy.ops.import_scene.fbx(filepath = filepath)#,  automatic_bone_orientation=True)
     
     imported_objects = set(bpy.context.scene.objects) - old_objs
     imported_actions = [x.animation_data.action for x in imported_objects if x.animation_data]
@@ -285,10 +210,99 @@ def import_armature(filepath, root_bone_name="Root", hip_bone_name="mixamorig:Hi
     imported_actions[0].name = Path(filepath).resolve().stem # Only reads the first animation associated with an imported armature
     
     if insert_root:
-        add_root_bone(root_bone_name, hip_bone_name, remove_prefix, name_prefix)
+        add_root_bone(root_bone_name, hip_bone_name, remove_prefix, name_prefix, unit_scale, root_motion, target_prefix)
+    if resampling is not None:
+        # The fbx importer places keys at the scene's frame rate
+        render = bpy.context.scene.render
+        with profiling.stage('resample', imported_actions[:1]):
+            resample_imported(imported_actions[0], resampling, render.fps / render.fps_base)
+    if key_reduction is not None:
+        with profiling.stage('reduce_keys', imported_actions[:1]):
+            reduction.reduce_action(imported_actions[0], key_reduction)
+    return imported_actions[0]
     
     
-def add_root_bone(root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:"):
+# Custom property holding the frame rate of an action read without processing
+SOURCE_FPS_PROP = "mixamo_source_fps"
+# Actions read before a deferred processing batch runs
+PROCESS_BATCH = 64
+
+def process_animations(actions, armature, workers=pipeline.DEFAULT_WORKERS, **settings):
+    # Runs animation_steps() over actions read by import_animation(process=False) on a thread
+    # pool, grouped by their frame rate. settings are animation_steps() arguments
+    by_fps = {}
+    for action in actions:
+        by_fps.setdefault(action.get(SOURCE_FPS_PROP, resample.DEFAULT_FPS), []).append(action)
+    for fps, group in by_fps.items():
+        with profiling.stage('process', group):
+            timings = pipeline.process_actions(group, animation_steps(armature, source_fps=fps, **settings), workers)
+        for action in group:
+            del action[SOURCE_FPS_PROP]
+        print("[Mixamo Root] Processed %d actions on %d threads: %s" % (len(group), workers, format_timings(timings)))
+
+def animation_steps(armature, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:", insert_root=False, root_motion=None, key_reduction=None, target_prefix="", resampling=None, source_fps=resample.DEFAULT_FPS):
+    # Pipeline steps processing an action read by import_animation: root motion, resampling and
+    # key reduction, in that order
+    steps = []
+    if insert_root:
+        if remove_prefix:
+            hip_bone_name = rename.rename(hip_bone_name, name_prefix, target_prefix)
+            name_prefix = target_prefix
+        steps.append(functools.partial(pipeline.root_motion, hip_bone=hip_bone_name, root_bone=name_prefix + root_bone_name, options=root_motion,
+                                       hip_rest_head=hip_rest_head(armature, hip_bone_name, name_prefix + root_bone_name),
+                                       **skeleton_settings(armature, root_motion)))
+    if resampling is not None:
+        steps.append(functools.partial(pipeline.resample, target_fps=resampling.get('fps', 0.0), source_fps=source_fps,
+                                       start_frame=resampling.get('start_frame', 0.0)))
+    if key_reduction is not None:
+        steps.append(functools.partial(pipeline.reduce_keys, tolerances=key_reduction))
+    return steps
+
+def format_timings(timings):
+    return ", ".join("%s %.2fs" % item for item in timings.items())
+
+def import_animation(filepath, armature, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:", insert_root=False, unit_scale=0.01, root_motion=None, key_reduction=None, target_prefix="", data=None, resampling=None, process=True):
+    # Fast path for animation only files: the curves are read straight from the fbx into a new
+    # action on an armature that was already imported (and processed) with import_armature,
+    # without building a scene for the file. Without process the action is left as read, its
+    # frame rate is kept in SOURCE_FPS_PROP for process_animations().
+    animations = fbxanim.read_animations(data if data is not None else filepath)
+    if not animations or not animations[0].tracks:
+        log.warning("[Mixamo Root] No animation found in %s" % filepath)
+        return None
+    print("[Mixamo Root] Now importing animation: " + str(filepath))
+    animation = animations[0] # Only reads the first animation, same as import_armature
+
+    action = bpy.data.actions.new(Path(filepath).resolve().stem)
+    action.use_fake_user = True
+    linear = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['LINEAR'].value
+    # Locations only get converted to meters once the armature had its transforms applied
+    location_scale = unit_scale if insert_root else 1.0
+    for track in animation.tracks:
+        bone_name = rename.rename(track.bone, name_prefix, target_prefix) if remove_prefix else track.bone
+        if bone_name not in armature.pose.bones:
+            continue
+        channels = (('location', track.location * location_scale), ('rotation_quaternion', track.rotation_quaternion), ('scale', track.scale))
+        interpolation = np.full(len(track.frames), linear, dtype=np.int32)
+        for prop, values in channels:
+            data_path = fcurves.bone_data_path(bone_name, prop)
+            for index in range(values.shape[1]):
+                fc = fcurves.ensure_fcurve(action, data_path, index, bone_name)
+                fcurves.write_keys(fc, {'co': np.column_stack((track.frames, values[:, index])), 'interpolation': interpolation})
+
+    if process:
+        # Keys read from the fbx are at the file's own frame rate
+        pipeline.process_actions([action], animation_steps(armature, root_bone_name, hip_bone_name, remove_prefix, name_prefix, insert_root,
+                                                           root_motion, key_reduction, target_prefix, resampling, animation.fps), workers=1)
+    else:
+        action[SOURCE_FPS_PROP] = animation.fps
+
+    if armature.animation_data is None:
+        armature.animation_data_create()
+    armature.animation_data.action = action
+    return action
+
+def add_root_bone(root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:", unit_scale=0.01, root_motion=None, target_prefix=""):
     armature = bpy.context.selected_objects[0]
     bpy.ops.object.mode_set(mode='EDIT')
 
@@ -298,11 +312,18 @@ def add_root_bone(root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_
     armature.data.edit_bones[hip_bone_name].parent = armature.data.edit_bones[name_prefix + root_bone_name]
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    fixBones(remove_prefix=remove_prefix, name_prefix=name_prefix)
-    scaleAll()
-    copyHips(root_bone_name=root_bone_name, hip_bone_name=hip_bone_name, name_prefix=name_prefix)
+    with profiling.stage('fixBones', active_actions):
+        fixBones(remove_prefix=remove_prefix, name_prefix=name_prefix, target_prefix=target_prefix)
+    with profiling.stage('scaleAll', active_actions):
+        scaleAll(unit_scale)
+    if remove_prefix:
+        # fixBones already renamed the bones and the action channels
+        hip_bone_name = rename.rename(hip_bone_name, name_prefix, target_prefix)
+        name_prefix = target_prefix
+    with profiling.stage('copyHips', active_actions):
+        copyHips(root_bone_name=root_bone_name, hip_bone_name=hip_bone_name, name_prefix=name_prefix, root_motion=root_motion)
 
-def add_root_bone_nla(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:"):#remove_prefix=False, name_prefix="mixamorig:"):
+def add_root_bone_nla(root_bone_name="Root", hip_bone_name="mixamorig:Hips", name_prefix="mixamorig:", root_motion=None, workers=pipeline.DEFAULT_WORKERS):#remove_prefix=False, name_prefix="mixamorig:"):
     armature = bpy.context.selected_objects[0]
     bpy.ops.object.mode_set(mode='EDIT')
 
@@ -315,51 +336,320 @@ def add_root_bone_nla(root_bone_name="Root", hip_bone_name="mixamorig:Hips", nam
 
     # fix_bones_nla(remove_prefix=remove_prefix, name_prefix=name_prefix)
     # scale_all_nla()
-    copy_hips_nla(root_bone_name=root_bone_name, hip_bone_name=hip_bone_name, name_prefix=name_prefix)
+    return copy_hips_nla(root_bone_name=root_bone_name, hip_bone_name=hip_bone_name, name_prefix=name_prefix, root_motion=root_motion, workers=workers)
 
-def push(obj, action, track_name=None, start_frame=0):
+def push(obj, action, track_name=None, start_frame=0, layout=None):
     # Simulate push :
     # * add a track
     # * add an action on track
     # * lock & mute the track
     # * remove active action from object
+    # With a layout (nla_layout()) the strip goes on the track and frame the layout picks instead
     tracks = obj.animation_data.nla_tracks
-    new_track = tracks.new(prev=None)
-    if track_name:
-        new_track.name = track_name
+    if layout is None:
+        new_track = tracks.new(prev=None)
+        if track_name:
+            new_track.name = track_name
+    else:
+        first, last = action.frame_range
+        track_name, start_frame = layout.place(action.name, int(math.ceil(last - first)))
+        new_track = tracks.get(track_name)
+        if new_track is None:
+            new_track = tracks.new(prev=None)
+            new_track.name = track_name
     strip = new_track.strips.new(action.name, start_frame, action)
+    if layout is not None:
+        # Holding the first or last frame would cover the strips of the tracks below
+        strip.extrapolation = 'NOTHING'
     obj.animation_data.action = None
 
-def get_all_anims(source_dir, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:",  insert_root=False, delete_armatures=False):
-    files = os.listdir(source_dir)
-    num_files = len(files)
-    current_context = bpy.context.area.ui_type
+def nla_layout(obj, mode='pack', max_tracks=nlalayout.DEFAULT_TRACKS, gap=nlalayout.DEFAULT_GAP, start_frame=0, name_prefix="ctrl_"):
+    # Layout for push() holding the strips already on obj's tracks, so clips pushed by a later
+    # run go after them. Frames are whole, strips.new() only takes an integer start.
+    layout = nlalayout.Layout(mode, max_tracks, gap, start_frame, name_prefix)
+    if obj.animation_data is not None:
+        for track in obj.animation_data.nla_tracks:
+            if mode == 'category' or track.name in layout.tracks:
+                for strip in track.strips:
+                    layout.reserve(track.name, int(math.floor(strip.frame_start)), int(math.ceil(strip.frame_end)), strip.name)
+    return layout
+
+def nla_manifest_path(filepath=""):
+    # Next to the .blend unless given, like the motion index
+    if filepath:
+        return bpy.path.abspath(filepath)
+    if bpy.data.filepath:
+        return bpy.data.filepath + nlalayout.MANIFEST_EXTENSION
+    return os.path.join(bpy.app.tempdir, "untitled" + nlalayout.MANIFEST_EXTENSION)
+
+def export_nla_manifest(obj, filepath="", layout=None):
+    # Writes clip name -> track and frame range of every strip on obj's NLA as JSON
+    if layout is None:
+        layout = nla_layout(obj, 'category')
+    render = bpy.context.scene.render
+    path = layout.write_manifest(nla_manifest_path(filepath), fps=render.fps / render.fps_base, object=obj.name)
+    print("[Mixamo Root] Wrote the NLA layout of %d clips to %s" % (len(layout.manifest()), path))
+    return path
+
+def iter_all_anims(source_dir, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:",  insert_root=False, delete_armatures=False, unit_scale=0.01, animation_only=False, use_cache=False, cache_directory="", cache_size=512, root_motion=None, key_reduction=None, target_prefix="", profile=False, profile_directory="", profile_info=None,
+                   use_journal=False, resume=False, continue_on_error=False, resume_blend="", checkpoint_every=0,
+                   recursive=False, pattern=discovery.DEFAULT_PATTERN, order='name', manifest="", prefetch=0,
+                   batch_session=False, memory_budget=0, flush_directory="", resampling=None, workers=0):
+    # Does the work of get_all_anims one file at a time. Yields (files done, file count, next file)
+    # before every file, closing the generator at a yield stops the import after the file before
+    # and still finishes up. Returns -1 if a file raised (unless continue_on_error).
+    files = discovery.find_files(source_dir, recursive, pattern, order, manifest)
+    # No area when running in blender --background
+    current_context = bpy.context.area.ui_type if bpy.context.area else None
     old_objs = set(bpy.context.scene.objects)
+
+    # With animation_only every file after the first is read onto the first armature (or the active
+    # one), only the first file creates objects. That armature is left selected at the end
+    base_armature = None
+    if animation_only:
+        active = bpy.context.view_layer.objects.active
+        if active and active.type == 'ARMATURE':
+            base_armature = active
+
+    # Cached clips come back as actions only, so the first file is still imported for the armature
+    clip_cache = None
+    if use_cache:
+        clip_cache = cache.ClipCache(cache_directory or os.path.join(source_dir, cache.DEFAULT_DIRNAME), cache_size)
+        settings = {'hip_name': hip_bone_name, 'root_name': root_bone_name, 'name_prefix': name_prefix, 'target_prefix': target_prefix,
+                    'remove_prefix': remove_prefix, 'insert_root': insert_root, 'unit_scale': unit_scale,
+                    'root_motion': root_motion or {}, 'key_reduction': key_reduction, 'resampling': resampling,
+                    # Files go through the fbx reader or the full import, a clip is only restored for the one it came from
+                    'animation_only': animation_only}
+    if profile:
+        profiling.start(bpy.data, dict(profile_info or {}, blender=bpy.app.version_string, source=source_dir))
+
+    # Resume skips the files the journal has as completed, their actions are reloaded if missing
+    batch_journal = None
+    if use_journal or resume:
+        batch_journal = journal.Journal(source_dir, resume)
+    if resume:
+        files = resume_completed(batch_journal, files, resume_blend)
+    # delete_armatures keeps the armature of the last file actually imported: the objects of one
+    # import are only deleted once the next one is in, cached and failed files never get that far
+    previous_objects = None
+    imported = 0
+
+    # The next prefetch files are read in the background, kept in memory where the bytes can be
+    # used directly (fbx reader, cache hash), otherwise only into the OS page cache
+    prefetcher = None
+    if prefetch:
+        prefetcher = discovery.Prefetcher([os.path.join(source_dir, file) for file in files], prefetch,
+                                          keep=animation_only or use_cache)
+
+    # With workers the animation only files are read without processing, and processed in
+    # batches of PROCESS_BATCH actions on that many threads (see pipeline)
+    pending = []
+    step_settings = dict(root_bone_name=root_bone_name, hip_bone_name=hip_bone_name, remove_prefix=remove_prefix, name_prefix=name_prefix,
+                         insert_root=insert_root, root_motion=root_motion, key_reduction=key_reduction, target_prefix=target_prefix,
+                         resampling=resampling)
+
+    def process_pending():
+        if not pending:
+            return
+        process_animations([action for _, action, _ in pending], base_armature, workers, **step_settings)
+        for file, action, cache_key in pending:
+            if cache_key:
+                clip_cache.store(cache_key, action)
+            if batch_journal is not None:
+                batch_journal.record(file, journal.DONE, action.name)
+        pending.clear()
+
+    # Undo off, orphans of every file purged, actions flushed to disk near the memory budget
+    batch = None
+    if batch_session:
+        batch = session.Session(bpy.data, bpy.context.preferences, memory_budget,
+                                flush_directory or os.path.join(source_dir, session.DEFAULT_DIRNAME))
     
-    for file in files:
+    for i, file in enumerate(files):
+        try:
+            yield i, len(files), file
+        except GeneratorExit:
+            print("[Mixamo Root] Import cancelled after %d of %d files" % (i, len(files)))
+            process_pending()
+            if prefetcher is not None:
+                prefetcher.close()
+            finish_import(source_dir, current_context, clip_cache, base_armature, profile_directory, batch, resampling)
+            raise
         print("file: " + str(file))
+        profiling.begin_file(file)
+        if batch is not None:
+            batch.begin_file()
         try:
-            filepath = source_dir+"/"+file
-            import_armature(filepath, root_bone_name, hip_bone_name, remove_prefix, name_prefix, insert_root, delete_armatures)
-            imported_objects = set(bpy.context.scene.objects) - old_objs
-            if delete_armatures and num_files > 1:
-                deleteArmature(imported_objects)
-                num_files -= 1
+            filepath = os.path.join(source_dir, file)
+            data = None
+            if prefetcher is not None:
+                prefetcher.advance(i)
+                data = prefetcher.take(i)
+            if os.path.isdir(filepath) or file.startswith(".mixamoroot"):
+                # e.g. the cache directory or the journal
+                continue
+            action_name = Path(filepath).resolve().stem
+            cache_key = None
+            if clip_cache is not None:
+                cache_key = clip_cache.key(filepath, settings, data)
+                has_armature = any(x.type == 'ARMATURE' for x in bpy.context.scene.objects)
+                with profiling.stage('cache_restore'):
+                    restored = has_armature and clip_cache.restore(cache_key, bpy.data.actions, action_name)
+                if restored:
+                    if batch_journal is not None:
+                        batch_journal.record(file, journal.DONE, action_name)
+                    continue
+            if base_armature is not None:
+                action = None
+                if file.lower().endswith('.fbx'):
+                    with profiling.stage('fbx_read', lambda: [base_armature.animation_data.action] if base_armature.animation_data else []):
+                        action = import_animation(filepath, base_armature, root_bone_name, hip_bone_name, remove_prefix, name_prefix, insert_root, unit_scale, root_motion, key_reduction, target_prefix, data, resampling,
+                                                  process=not workers)
+                    if workers and action:
+                        pending.append((file, action, cache_key))
+                        if len(pending) >= PROCESS_BATCH:
+                            process_pending()
+                        continue
+                    if cache_key and action:
+                        clip_cache.store(cache_key, action)
+                if batch_journal is not None:
+                    batch_journal.record(file, journal.DONE if action else journal.SKIPPED, action.name if action else None)
+                continue
+            action = import_armature(filepath, root_bone_name, hip_bone_name, remove_prefix, name_prefix, insert_root, delete_armatures, unit_scale, root_motion, key_reduction, target_prefix, resampling)
+            if cache_key:
+                clip_cache.store(cache_key, action)
+            if batch_journal is not None:
+                batch_journal.record(file, journal.DONE, action.name)
+                imported += 1
+                if checkpoint_every and imported % checkpoint_every == 0:
+                    save_checkpoint()
+            imported_objects = set(bpy.context.scene.objects) - old_objs - (previous_objects or set())
+            if animation_only:
+                base_armature = next((x for x in imported_objects if x.type == 'ARMATURE'), None)
+            elif delete_armatures:
+                if previous_objects:
+                    with profiling.stage('deleteArmature'):
+                        deleteArmature(previous_objects)
+                previous_objects = imported_objects
 
 
         except Exception as e:
             log.error("[Mixamo Root] ERROR get_all_anims raised %s when processing %s" % (str(e), file))
+            if batch_journal is not None:
+                batch_journal.record(file, journal.FAILED, error=str(e))
+            if continue_on_error:
+                continue
+            process_pending()
+            profiling.stop()
+            if prefetcher is not None:
+                prefetcher.close()
+            if batch is not None:
+                batch.end_file(file)
+                batch.close()
             return -1
-    bpy.context.area.ui_type = current_context
+        finally:
+            if batch is not None:
+                if batch.over_budget():
+                    # Only processed actions get flushed
+                    process_pending()
+                with profiling.stage('purge'):
+                    batch.end_file(file)
+    process_pending()
+    if prefetcher is not None:
+        prefetcher.close()
+    if batch_journal is not None:
+        print("[Mixamo Root] Journal: " + batch_journal.summary())
+    finish_import(source_dir, current_context, clip_cache, base_armature, profile_directory, batch, resampling)
+
+def finish_import(source_dir, current_context, clip_cache=None, base_armature=None, profile_directory="", batch=None, resampling=None):
+    if clip_cache is not None:
+        clip_cache.evict()
+        print("[Mixamo Root] Cache: %d clips restored, %d imported" % (clip_cache.hits, clip_cache.misses))
+    if batch is not None:
+        batch.close()
+    profiler = profiling.stop()
+    if profiler is not None:
+        for path in profiler.write_report(profile_directory or os.path.join(source_dir, profiling.DEFAULT_DIRNAME)):
+            print("[Mixamo Root] Profile written to " + path)
+    if base_armature is not None:
+        # Leaves the armature the actions were read onto selected
+        base_armature.select_set(True)
+        bpy.context.view_layer.objects.active = base_armature
+    if current_context and bpy.context.area:
+        bpy.context.area.ui_type = current_context
     bpy.context.scene.frame_start = 0
+    if resampling is not None:
+        bpy.context.scene.frame_start = int(resampling.get('start_frame', 0))
+        if resampling.get('fps'):
+            # Plays the resampled actions at their new rate, fps_base covers fractional rates
+            render = bpy.context.scene.render
+            render.fps = max(1, int(round(resampling['fps'])))
+            render.fps_base = render.fps / resampling['fps']
     bpy.ops.object.mode_set(mode='OBJECT')
 
-def apply_all_anims(delete_applied_armatures=False, control_rig=None, push_nla=False):
+def resume_completed(batch_journal, files, resume_blend=""):
+    # Files still to import. Actions of completed files missing from this blend file are appended
+    # from resume_blend (a saved output file) in one go, files whose action can't be found there
+    # are imported again.
+    completed = {}
+    for file in files:
+        record = batch_journal.completed(file)
+        if record is not None:
+            completed[file] = record
+    missing = {record['action'] for record in completed.values() if record.get('action') and record['action'] not in bpy.data.actions}
+    if missing and resume_blend and os.path.exists(resume_blend):
+        with bpy.data.libraries.load(resume_blend) as (data_from, data_to):
+            data_to.actions = [name for name in data_from.actions if name in missing]
+        for action in data_to.actions:
+            if action is not None:
+                action.use_fake_user = True
+                missing.discard(action.name)
+    remaining = [file for file in files if file not in completed or completed[file].get('action') in missing]
+    print("[Mixamo Root] Resuming: %d files completed before, %d to import" % (len(files) - len(remaining), len(remaining)))
+    return remaining
+
+def save_checkpoint():
+    # Saves the blend file so a crash only loses the files imported since, needs a saved file
+    if bpy.data.filepath:
+        bpy.ops.wm.save_mainfile()
+        print("[Mixamo Root] Checkpoint saved to " + bpy.data.filepath)
+
+def get_all_anims(source_dir, root_bone_name="Root", hip_bone_name="mixamorig:Hips", remove_prefix=False, name_prefix="mixamorig:",  insert_root=False, delete_armatures=False, unit_scale=0.01, animation_only=False, use_cache=False, cache_directory="", cache_size=512, root_motion=None, key_reduction=None, target_prefix="", profile=False, profile_directory="", profile_info=None,
+                  use_journal=False, resume=False, continue_on_error=False, resume_blend="", checkpoint_every=0,
+                  recursive=False, pattern=discovery.DEFAULT_PATTERN, order='name', manifest="", prefetch=0,
+                  batch_session=False, memory_budget=0, flush_directory="", resampling=None, workers=0):
+    anims = iter_all_anims(source_dir, root_bone_name, hip_bone_name, remove_prefix, name_prefix, insert_root, delete_armatures, unit_scale, animation_only,
+                           use_cache, cache_directory, cache_size, root_motion, key_reduction, target_prefix, profile, profile_directory, profile_info,
+                           use_journal, resume, continue_on_error, resume_blend, checkpoint_every,
+                           recursive, pattern, order, manifest, prefetch,
+                           batch_session, memory_budget, flush_directory, resampling, workers)
+    try:
+        while True:
+            next(anims)
+    except StopIteration as done:
+        return done.value
+
+def apply_all_anims(delete_applied_armatures=False, control_rig=None, push_nla=False, fast_retarget=False, name_prefix="mixamorig:", nla_options=None, manifest_path=None):
+    # nla_options ({'mode', 'max_tracks', 'gap'}) packs the pushed strips with nla_layout() instead
+    # of a track per clip, manifest_path (None for no manifest, "" for next to the .blend) then
+    # gets the resulting layout
     if control_rig and control_rig.type == 'ARMATURE':
         bpy.ops.object.mode_set(mode='OBJECT')
 
         imported_objects = set(bpy.context.scene.objects)
-        imported_armatures = [x for x in imported_objects if x.type == 'ARMATURE' and x.name != control_rig.name]
+        imported_armatures = sorted((x for x in imported_objects if x.type == 'ARMATURE' and x.name != control_rig.name), key=lambda x: x.name)
+        layout = None
+        if push_nla and nla_options:
+            if control_rig.animation_data is None:
+                control_rig.animation_data_create()
+            layout = nla_layout(control_rig, **nla_options)
+        if fast_retarget:
+            apply_all_anims_fast(imported_armatures, control_rig, push_nla, name_prefix, layout)
+            if delete_applied_armatures:
+                deleteArmature(set(imported_armatures))
+            if layout is not None and manifest_path is not None:
+                export_nla_manifest(control_rig, manifest_path, layout)
+            return
 
         for obj in imported_armatures:
             action_name = obj.animation_data.action.name
@@ -374,11 +664,114 @@ def apply_all_anims(delete_applied_armatures=False, control_rig=None, push_nla=F
             # created_actions.append(selected_action)
 
             if push_nla:
-                push(control_rig, selected_action, None, int(selected_action.frame_start))
+                push(control_rig, selected_action, None, int(selected_action.frame_start), layout)
 
             if delete_applied_armatures:
                 bpy.context.view_layer.objects.active = control_rig
                 deleteArmature(set([obj]))
+        if layout is not None and manifest_path is not None:
+            export_nla_manifest(control_rig, manifest_path, layout)
+
+def apply_all_anims_fast(imported_armatures, control_rig, push_nla=False, name_prefix="mixamorig:", layout=None):
+    # Bakes every imported action onto a ctrl_ action with retarget.Retarget instead of running
+    # the control rig operator per clip. Bone map and rest corrections are only rebuilt when an
+    # armature has a different skeleton than the one before.
+    if control_rig.animation_data is None:
+        control_rig.animation_data_create()
+    mapping = None
+    for obj in imported_armatures:
+        if obj.animation_data is None or obj.animation_data.action is None:
+            continue
+        if mapping is None or not mapping.matches(obj):
+            mapping = retarget.Retarget(obj, control_rig, name_prefix)
+            print("[Mixamo Root] Mapped %d bones of %s to %s" % (len(mapping.pairs), obj.name, control_rig.name))
+        source_action = obj.animation_data.action
+        action = bpy.data.actions.new('ctrl_' + source_action.name)
+        action.use_fake_user = True
+        mapping.apply(source_action, action)
+        if push_nla:
+            push(control_rig, action, None, int(action.frame_range[0]), layout)
+        else:
+            control_rig.animation_data.action = action
+
+def save_library(filepath, actions=None):
+    # Writes the processed actions (all of them by default) into one animation library file
+    if actions is None:
+        actions = list(bpy.data.actions)
+    count = animlib.write_library(filepath, actions)
+    print("[Mixamo Root] Saved %d actions to %s" % (count, filepath))
+    return count
+
+def load_library(filepath, pattern="*"):
+    # Loads the clips of a library file whose names match pattern as actions, clips that already
+    # have an action of the same name are left alone. Only the loaded clips are read from disk.
+    loaded = []
+    with animlib.AnimationLibrary(filepath) as library:
+        for name in library.names():
+            if not fnmatch.fnmatchcase(name, pattern) or name in bpy.data.actions:
+                continue
+            loaded.append(library.load(name, bpy.data.actions))
+    print("[Mixamo Root] Loaded %d actions from %s" % (len(loaded), filepath))
+    return loaded
+
+def motion_index_path(filepath=None):
+    # The index lives next to the .blend, or in the temp directory for unsaved files
+    if filepath:
+        return filepath
+    if bpy.data.filepath:
+        return bpy.data.filepath + motionindex.INDEX_EXTENSION
+    return os.path.join(bpy.app.tempdir, "untitled" + motionindex.INDEX_EXTENSION)
+
+def _feature_prefix(armature, name_prefix):
+    # Bones keep the prefix unless it was removed on import
+    return name_prefix if name_prefix + motionindex.FEATURE_BONES['hips'] in armature.data.bones else ""
+
+def build_motion_index(armature, actions=None, filepath=None, name_prefix="mixamorig:", root_bone_name="Root",
+                       window=motionindex.DEFAULT_WINDOW, stride=motionindex.DEFAULT_STRIDE):
+    # Computes window features of the actions (by default all that animate the armature's bones)
+    # with numpy forward kinematics on the armature's skeleton and saves the index. Actions
+    # without hip keys would index as a static rest pose and are skipped. Returns (index, path)
+    if actions is None:
+        actions = export.armature_actions(armature)
+    skel = kinematics.skeleton(armature)
+    prefix = _feature_prefix(armature, name_prefix)
+    missing = [name for name in motionindex.FEATURE_BONES.values() if prefix + name not in skel.names]
+    if missing:
+        raise ValueError("Armature has no bones " + ", ".join(prefix + name for name in missing))
+    root_bone = prefix + root_bone_name if prefix + root_bone_name in skel.names else None
+    rotation_modes = {bone.name: bone.rotation_mode for bone in armature.pose.bones}
+    hip_prefix = fcurves.bone_data_path(prefix + motionindex.FEATURE_BONES['hips'], '')
+    clips = []
+    for action in actions:
+        channels = kinematics.action_channels(action)
+        if not any(data_path.startswith(hip_prefix) for data_path in channels):
+            log.warning("[Mixamo Root] %s has no keys on %s, not indexed" % (action.name, prefix + motionindex.FEATURE_BONES['hips']))
+            continue
+        start, end = action.frame_range
+        frames = np.arange(np.floor(start), np.ceil(end) + 1.0)
+        features, starts = motionindex.clip_features(skel, channels, frames, prefix, root_bone,
+                                                     rotation_modes, window, stride)
+        clips.append((action.name, frames[0], features, starts))
+    index = motionindex.MotionIndex.build(clips)
+    path = motion_index_path(filepath)
+    index.save(path)
+    print("[Mixamo Root] Indexed %d windows of %d actions to %s" % (len(index.features), len(clips), path))
+    return index, path
+
+def load_motion_index(filepath=None):
+    path = motion_index_path(filepath)
+    if not os.path.exists(path):
+        return None
+    return motionindex.MotionIndex.load(path)
+
+def similar_clips(action_name, count=5, filepath=None):
+    # [(action name, distance)] of the indexed clips closest to action_name
+    index = load_motion_index(filepath)
+    if index is None:
+        raise FileNotFoundError("No motion index at " + motion_index_path(filepath))
+    if action_name not in index.clip_names:
+        raise KeyError("Action %s is not in the motion index, rebuild it" % action_name)
+    return index.similar_clips(action_name, count)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Motion feature index over a library of clips. Every clip is cut into sliding windows and each
+# window gets a feature vector, all in the character's heading frame at the window start:
+#   root velocity (3), heading change (1), foot positions and velocities relative to the root (12)
+#   and a pose vector of hand and head positions relative to the hips (9).
+# Features are normalized by their spread over the library and put in a kd-tree for nearest
+# neighbour queries, one tree over windows (motion matching) and one over per clip summaries
+# (similar clips). Index files are .npz, written next to the .blend.
+import numpy as np
+
+try:
+    from . import kinematics
+except ImportError:
+    import kinematics
+
+
+FEATURE_BONES = {
+    'hips': "Hips", 'left_foot': "LeftFoot", 'right_foot': "RightFoot",
+    'left_hand': "LeftHand", 'right_hand': "RightHand", 'head': "Head",
+}
+FEATURE_NAMES = (['root_velocity_%s' % a for a in 'xyz'] + ['heading_change'] +
+                 ['%s_foot_%s_%s' % (side, kind, a) for side in ('left', 'right') for kind in ('position', 'velocity') for a in 'xyz'] +
+                 ['%s_%s' % (bone, a) for bone in ('left_hand', 'right_hand', 'head') for a in 'xyz'])
+DEFAULT_WINDOW = 10
+DEFAULT_STRIDE = 5
+INDEX_EXTENSION = ".mxidx.npz"
+
+
+def heading_angles(hip_matrices):
+    '''Angle around armature Z of the hips' forward axis (bone local Z) per frame'''
+    forward = hip_matrices[:, :3, 2]
+    return np.unwrap(np.arctan2(forward[:, 0], -forward[:, 1]))
+
+def _to_heading(vectors, angles):
+    # Rotates (n, 3) armature space vectors by -angles around Z
+    c, s = np.cos(-angles), np.sin(-angles)
+    x, y = vectors[:, 0], vectors[:, 1]
+    return np.column_stack((c * x - s * y, s * x + c * y, vectors[:, 2]))
+
+def window_features(positions, hip_matrices, root=None, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE):
+    '''(windows, features) feature matrix and window start indices of one clip.
+
+    positions holds (n, 3) armature space head positions per FEATURE_BONES key, root is the (n, 3)
+    root bone position (the hips projected onto the ground if None).
+    '''
+    n = len(hip_matrices)
+    if n < window + 1:
+        return np.empty((0, len(FEATURE_NAMES))), np.empty(0, dtype=np.int64)
+    if root is None:
+        root = positions['hips'] * np.array((1.0, 1.0, 0.0))
+    angles = heading_angles(hip_matrices)
+    starts = np.arange(0, n - window, stride)
+    ends = starts + window
+    centers = starts + window // 2
+    heading = angles[starts]
+
+    columns = [_to_heading((root[ends] - root[starts]) / window, heading), (angles[ends] - angles[starts])[:, None]]
+    for side in ('left_foot', 'right_foot'):
+        foot = positions[side]
+        columns.append(_to_heading(foot[centers] - root[centers], heading))
+        columns.append(_to_heading(foot[centers + 1] - foot[centers - 1], heading) / 2.0)
+    for bone in ('left_hand', 'right_hand', 'head'):
+        columns.append(_to_heading(positions[bone][centers] - positions['hips'][centers], heading))
+    return np.column_stack(columns), starts
+
+def clip_features(skel, channels, frames, name_prefix="mixamorig:", root_bone=None, rotation_modes=None, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE):
+    '''window_features() of one action, from kinematics.action_channels() output'''
+    bones = {key: name_prefix + name for key, name in FEATURE_BONES.items()}
+    wanted = list(bones.values()) + ([root_bone] if root_bone else [])
+    matrices = kinematics.pose_matrices(skel, channels, wanted, frames, rotation_modes)
+    positions = {key: matrices[name][:, :3, 3] for key, name in bones.items()}
+    root = matrices[root_bone][:, :3, 3] if root_bone else None
+    return window_features(positions, matrices[bones['hips']], root, window, stride)
+
+
+class KDTree:
+    '''Exact k nearest neighbour search over (n, d) points, median splits on the widest dimension'''
+
+    def __init__(self, points, leaf_size=32, _arrays=None):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        if _arrays is not None:
+            self.order, self.split_dim, self.split_value, self.left, self.right, self.start, self.end = _arrays
+            return
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        split_dim, split_value, left, right, start, end = [], [], [], [], [], []
+
+        def add_node(lo, hi):
+            split_dim.append(-1)
+            split_value.append(0.0)
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            end.append(hi)
+            return len(split_dim) - 1
+
+        stack = [add_node(0, len(self.points))] if len(self.points) else []
+        while stack:
+            node = stack.pop()
+            lo, hi = start[node], end[node]
+            if hi - lo <= leaf_size:
+                continue
+            chunk = self.points[self.order[lo:hi]]
+            dim = int(np.argmax(chunk.max(axis=0) - chunk.min(axis=0)))
+            mid = (hi - lo) // 2
+            partition = np.argpartition(chunk[:, dim], mid)
+            self.order[lo:hi] = self.order[lo:hi][partition]
+            split_dim[node] = dim
+            split_value[node] = float(self.points[self.order[lo + mid], dim])
+            left[node] = add_node(lo, lo + mid)
+            right[node] = add_node(lo + mid, hi)
+            stack.extend((left[node], right[node]))
+        self.split_dim = np.array(split_dim, dtype=np.int64)
+        self.split_value = np.array(split_value)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+
+    def arrays(self):
+        return self.order, self.split_dim, self.split_value, self.left, self.right, self.start, self.end
+
+    def query(self, point, k=1):
+        '''(distances, point indices) of the k nearest points, closest first'''
+        point = np.asarray(point, dtype=np.float64)
+        best_d = np.full(k, np.inf)
+        best_i = np.full(k, -1, dtype=np.int64)
+        if not len(self.points):
+            return best_d, best_i
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound > best_d[-1]:
+                continue
+            dim = self.split_dim[node]
+            if dim == -1:
+                indices = self.order[self.start[node]:self.end[node]]
+                d = np.einsum('ij,ij->i', self.points[indices] - point, self.points[indices] - point)
+                all_d = np.concatenate((best_d, d))
+                all_i = np.concatenate((best_i, indices))
+                keep = np.argsort(all_d, kind='stable')[:k]
+                best_d, best_i = all_d[keep], all_i[keep]
+                continue
+            diff = point[dim] - self.split_value[node]
+            near, far = (self.left[node], self.right[node]) if diff < 0 else (self.right[node], self.left[node])
+            # Far side first on the stack so the near side is searched first
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        found = best_i >= 0
+        return np.sqrt(best_d[found]), best_i[found]
+
+
+class MotionIndex:
+    '''Window and clip feature trees over a library of clips'''
+
+    def __init__(self, features, clip_ids, starts, clip_names, frames_start=None, mean=None, std=None, trees=None):
+        self.features = np.asarray(features, dtype=np.float64)
+        self.clip_ids = np.asarray(clip_ids, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.clip_names = list(clip_names)
+        self.frames_start = np.zeros(len(self.clip_names)) if frames_start is None else np.asarray(frames_start, dtype=np.float64)
+        if mean is None:
+            mean = self.features.mean(axis=0) if len(self.features) else np.zeros(self.features.shape[1])
+            std = self.features.std(axis=0) if len(self.features) else np.ones(self.features.shape[1])
+        self.mean = np.asarray(mean)
+        self.std = np.where(np.asarray(std) > 1e-8, std, 1.0)
+        normalized = self.normalize(self.features)
+        # Clip summaries: mean and spread of the normalized window features
+        summaries = np.zeros((len(self.clip_names), normalized.shape[1] * 2))
+        for clip in range(len(self.clip_names)):
+            rows = normalized[self.clip_ids == clip]
+            if len(rows):
+                summaries[clip] = np.concatenate((rows.mean(axis=0), rows.std(axis=0)))
+        self.summaries = summaries
+        if trees is None:
+            self.window_tree = KDTree(normalized)
+            self.clip_tree = KDTree(summaries)
+        else:
+            self.window_tree = KDTree(normalized, _arrays=trees[0])
+            self.clip_tree = KDTree(summaries, _arrays=trees[1])
+
+    @classmethod
+    def build(cls, clips):
+        '''clips is a list of (name, first frame, window features, window starts)'''
+        names = [clip[0] for clip in clips]
+        features = [clip[2] for clip in clips]
+        width = len(FEATURE_NAMES)
+        return cls(np.concatenate(features) if features else np.empty((0, width)),
+                   np.concatenate([np.full(len(f), i) for i, f in enumerate(features)]) if features else np.empty(0),
+                   np.concatenate([clip[3] for clip in clips]) if clips else np.empty(0),
+                   names, [clip[1] for clip in clips])
+
+    def normalize(self, features):
+        return (np.asarray(features, dtype=np.float64) - self.mean) / self.std
+
+    def nearest_windows(self, feature, k=5):
+        '''[(clip name, frame, distance)] of the k windows closest to an unnormalized feature vector'''
+        distances, indices = self.window_tree.query(self.normalize(feature), k)
+        return [(self.clip_names[self.clip_ids[i]], float(self.frames_start[self.clip_ids[i]] + self.starts[i]), float(d))
+                for d, i in zip(distances, indices)]
+
+    def similar_clips(self, clip_name, k=5):
+        '''[(clip name, distance)] of the k clips most similar to clip_name, itself excluded'''
+        clip = self.clip_names.index(clip_name)
+        distances, indices = self.clip_tree.query(self.summaries[clip], k + 1)
+        return [(self.clip_names[i], float(d)) for d, i in zip(distances, indices) if i != clip][:k]
+
+    def save(self, filepath):
+        np.savez_compressed(filepath, features=self.features, clip_ids=self.clip_ids, starts=self.starts,
+                            clip_names=np.array(self.clip_names, dtype=str), frames_start=self.frames_start,
+                            mean=self.mean, std=self.std,
+                            **{'window_%d' % i: a for i, a in enumerate(self.window_tree.arrays())},
+                            **{'clip_%d' % i: a for i, a in enumerate(self.clip_tree.arrays())})
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            trees = (tuple(data['window_%d' % i] for i in range(7)), tuple(data['clip_%d' % i] for i in range(7)))
+            return cls(data['features'], data['clip_ids'], data['starts'], [str(name) for name in data['clip_names']],
+                       data['frames_start'], data['mean'], data['std'], trees)
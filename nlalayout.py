@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Layout of pushed clips on the NLA. Instead of one track per clip, strips are placed one after
+# another with a gap between them, either on a fixed number of tracks (each clip goes on the track
+# that ends first) or on one track per category taken from the clip name. The strips of every
+# track are kept in a sorted interval index, so placing a clip is a binary search however many
+# clips the track already holds. The layout can be written out as a manifest, clip name -> track
+# and frame range, for engines that cut one baked timeline back into clips.
+import bisect
+import heapq
+import json
+import os
+import re
+
+
+MODES = ('pack', 'category')
+DEFAULT_TRACKS = 4
+DEFAULT_GAP = 10
+PACK_TRACK_NAME = "Clips %d"
+MANIFEST_EXTENSION = ".nla.json"
+
+# Trailing copy numbers and takes, "Walking (2)", "Jump_03", "Idle.001"
+_CLIP_SUFFIX = re.compile(r'[\s_.-]*(\(\d+\)|\d+)$')
+_WORD_SPLIT = re.compile(r'[\s_.-]+')
+
+
+def category(name, prefix=""):
+    '''Track name of a clip in category mode: the first word of its name, without copy numbers'''
+    if prefix and name.startswith(prefix):
+        name = name[len(prefix):]
+    base = name
+    while True:
+        stripped = _CLIP_SUFFIX.sub('', base)
+        if stripped == base:
+            break
+        base = stripped
+    words = [word for word in _WORD_SPLIT.split(base) if word]
+    return words[0].capitalize() if words else "Clips"
+
+
+class IntervalIndex:
+    '''Non overlapping [start, end) frame ranges of one track, sorted by start'''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def end(self):
+        return self.ends[-1] if self.ends else None
+
+    def overlaps(self, start, end):
+        i = bisect.bisect_left(self.starts, end)
+        # Only the interval starting last before end can reach into [start, end)
+        return i > 0 and self.ends[i - 1] > start
+
+    def insert(self, start, end, name):
+        if self.overlaps(start, end):
+            raise ValueError("Frames %g-%g of %s overlap another strip" % (start, end, name))
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.names.insert(i, name)
+
+    def first_free(self, start, length, gap=0):
+        '''Earliest frame from start where length frames fit with gap frames to both neighbours'''
+        i = bisect.bisect_right(self.starts, start)
+        if i > 0:
+            start = max(start, self.ends[i - 1] + gap)
+        while i < len(self.starts) and start + length + gap > self.starts[i]:
+            start = max(start, self.ends[i] + gap)
+            i += 1
+        return start
+
+    def items(self):
+        return zip(self.names, self.starts, self.ends)
+
+
+class Layout:
+    '''Places clips on tracks. mode is 'pack' (at most max_tracks tracks) or 'category' '''
+
+    def __init__(self, mode='pack', max_tracks=DEFAULT_TRACKS, gap=DEFAULT_GAP, start_frame=0, name_prefix=""):
+        if mode not in MODES:
+            raise ValueError("Unknown layout mode " + mode)
+        self.mode = mode
+        self.max_tracks = max(1, max_tracks)
+        self.gap = gap
+        self.start_frame = start_frame
+        self.name_prefix = name_prefix
+        self.tracks = {}
+        # (track end, track order, name) of the pack tracks, the one ending first on top
+        self._ends = []
+        if mode == 'pack':
+            for i in range(self.max_tracks):
+                name = PACK_TRACK_NAME % (i + 1)
+                self.tracks[name] = IntervalIndex()
+                heapq.heappush(self._ends, (start_frame, i, name))
+
+    def reserve(self, track, start, end, name):
+        '''Marks frames of a track as taken, e.g. by strips that were there before'''
+        index = self.tracks.setdefault(track, IntervalIndex())
+        index.insert(start, end, name)
+        if track in self._track_names():
+            self._rebuild_ends()
+
+    def place(self, name, length, frame_start=None):
+        '''(track name, start frame) of a clip of length frames, recorded in the layout'''
+        if self.mode == 'pack':
+            _, order, track = heapq.heappop(self._ends)
+        else:
+            track = category(name, self.name_prefix)
+        index = self.tracks.setdefault(track, IntervalIndex())
+        if frame_start is None:
+            # Appended after the last strip, only an explicit frame_start looks for a gap in between
+            frame_start = self.start_frame if index.end is None else max(self.start_frame, index.end + self.gap)
+        start = index.first_free(frame_start, length, self.gap)
+        index.insert(start, start + length, name)
+        if self.mode == 'pack':
+            heapq.heappush(self._ends, (index.end + self.gap, order, track))
+        return track, start
+
+    def _track_names(self):
+        return {name for _, _, name in self._ends}
+
+    def _rebuild_ends(self):
+        self._ends = [(self.tracks[name].end + self.gap if len(self.tracks[name]) else self.start_frame, order, name)
+                      for _, order, name in self._ends]
+        heapq.heapify(self._ends)
+
+    def manifest(self):
+        '''{clip name: {'track', 'frame_start', 'frame_end'}} in track and frame order'''
+        clips = {}
+        for track, index in self.tracks.items():
+            for name, start, end in index.items():
+                clips[name] = {'track': track, 'frame_start': start, 'frame_end': end}
+        return clips
+
+    def write_manifest(self, filepath, **info):
+        '''JSON manifest of the layout, info (e.g. fps) is stored next to the clips'''
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(dict(info, clips=self.manifest()), f, indent=1)
+        return filepath
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Processing of many actions in three phases:
+#   read     the keys of every action into numpy arrays (fcurves.read_action), main thread
+#   compute  the steps on those arrays, clips spread over a thread pool
+#   write    the results back into the actions (fcurves.update_action), main thread
+# Only the first and last phase touch bpy, which is not thread safe. The compute phase runs in
+# numpy most of the time, which releases the GIL, so clips are processed on several cores.
+# A step is a function taking the read_action() arrays of one clip and returning new ones, with
+# its options bound through functools.partial; steps never modify the arrays they are given.
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+try:
+    from . import fcurves
+    from . import kinematics
+    from . import reduction
+    from . import resample as resampling
+    from . import rootmotion
+    from . import transforms
+except ImportError:
+    import fcurves
+    import kinematics
+    import reduction
+    import resample as resampling
+    import rootmotion
+    import transforms
+
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+ARRAYS = fcurves.KEY_ATTRS + ('interpolation',)
+
+
+def bounds(data):
+    '''(starts, ends) of every channel's keys in the flat arrays'''
+    ends = np.cumsum(data['counts'])
+    return ends - data['counts'], ends
+
+def channels(data, data_path):
+    '''{array index: (n, 2) key coordinates} of the channels of one property'''
+    starts, ends = bounds(data)
+    rows = np.flatnonzero(data['data_paths'] == data_path)
+    return {int(data['array_indices'][row]): data['co'][starts[row]:ends[row]].astype(np.float64) for row in rows}
+
+def replace_channels(data, data_path, group, frames=None, values=None, interpolation=None):
+    '''Copy of data with the channels of data_path replaced by (n, size) values at frames, or
+    only removed without values. New channels go at the end.
+    '''
+    keep = data['data_paths'] != data_path
+    key_keep = np.repeat(keep, data['counts'])
+    result = {
+        'data_paths': data['data_paths'][keep],
+        'array_indices': data['array_indices'][keep],
+        'groups': data['groups'][keep],
+        'counts': data['counts'][keep],
+    }
+    for attr in ARRAYS:
+        result[attr] = data[attr][key_keep]
+    if values is None:
+        return result
+    size = values.shape[1]
+    co = np.empty((len(frames) * size, 2), dtype=np.float32)
+    co[:, 0] = np.tile(frames, size)
+    co[:, 1] = values.T.ravel()
+    if interpolation is None:
+        interpolation = np.full(len(frames), _linear(data), dtype=np.int32)
+    result['data_paths'] = np.concatenate((result['data_paths'], np.array([data_path] * size, dtype=str)))
+    result['array_indices'] = np.concatenate((result['array_indices'], np.arange(size, dtype=np.int32)))
+    result['groups'] = np.concatenate((result['groups'], np.array([group] * size, dtype=str)))
+    result['counts'] = np.concatenate((result['counts'], np.full(size, len(frames), dtype=np.int64)))
+    for attr in fcurves.KEY_ATTRS:
+        # Handles of the new keys are placed by fcurve.update() when written
+        result[attr] = np.concatenate((result[attr], co))
+    result['interpolation'] = np.concatenate((result['interpolation'], np.tile(interpolation, size).astype(np.int32)))
+    return result
+
+def _linear(data):
+    # Interpolation of the first key, the fbx importer keys everything linear
+    return data['interpolation'][0] if len(data['interpolation']) else 0
+
+
+# Steps
+
+def scale_locations(data, scale=0.01):
+    '''Values of the location channels times scale, e.g. centimeters to meters'''
+    rows = np.char.endswith(data['data_paths'], 'location')
+    keys = np.repeat(rows, data['counts'])
+    result = dict(data)
+    for attr in fcurves.KEY_ATTRS:
+        result[attr] = data[attr].copy()
+        result[attr][keys, 1] *= scale
+    return result
+
+def _interpolation(data, data_path, count):
+    # Interpolation of the keys of a channel if it has count keys, the frames being replaced
+    starts, _ = bounds(data)
+    rows = np.flatnonzero(data['data_paths'] == data_path)
+    if not len(rows) or data['counts'][rows[0]] != count:
+        return None
+    return data['interpolation'][starts[rows[0]]:starts[rows[0]] + count]
+
+def root_motion(data, hip_bone, root_bone, options=None, hip_rest_head=(0.0, 0.0, 0.0), skeleton=None, rotation_modes=None):
+    '''rootmotion.apply_to_action on arrays: moves the root motion of hip_bone onto root_bone.
+    With the world_space option and a kinematics.Skeleton the hips go through kinematics.root_motion.
+    '''
+    options = dict(rootmotion.DEFAULT_OPTIONS, **(options or {}))
+    if options['world_space'] and skeleton is not None and root_bone in skeleton.names:
+        return _world_root_motion(data, hip_bone, root_bone, options, skeleton, rotation_modes)
+    hip_path = fcurves.bone_data_path(hip_bone, 'location')
+    root_path = fcurves.bone_data_path(root_bone, 'location')
+    location_channels = channels(data, hip_path)
+    if not location_channels:
+        return data
+    if not (options['project_ground'] or options['clamp_floor'] or options['use_yaw']):
+        # Plain move of the hip location channels
+        moved = data['data_paths'] == hip_path
+        result = replace_channels(data, root_path, root_bone)
+        rows = result['data_paths'] == hip_path
+        result['data_paths'] = np.where(rows, root_path, result['data_paths'])
+        result['groups'] = np.where(rows, root_bone, result['groups'])
+        return result if moved.any() else data
+
+    rotation_path = fcurves.bone_data_path(hip_bone, 'rotation_quaternion')
+    rotation_channels = channels(data, rotation_path) if options['use_yaw'] else {}
+    frames = np.unique(np.concatenate([co[:, 0] for co in list(location_channels.values()) + list(rotation_channels.values())]))
+    location = rootmotion.sample_channels(location_channels, 3, (0.0, 0.0, 0.0), frames)
+    rotation = rootmotion.sample_channels(rotation_channels, 4, (1.0, 0.0, 0.0, 0.0), frames) if rotation_channels else None
+    motion = rootmotion.extract(location, rotation, options['project_ground'], options['clamp_floor'], options['floor_height'],
+                                options['use_yaw'], hip_rest_head)
+
+    interpolation = _interpolation(data, hip_path, len(frames))
+    result = replace_channels(data, root_path, root_bone, frames, motion.root_location, interpolation)
+    result = replace_channels(result, hip_path, hip_bone, frames, motion.hip_location, interpolation)
+    if motion.root_rotation is not None:
+        result = replace_channels(result, fcurves.bone_data_path(root_bone, 'rotation_quaternion'), root_bone, frames, motion.root_rotation, interpolation)
+        result = replace_channels(result, rotation_path, hip_bone, frames, motion.hip_rotation, interpolation)
+    return result
+
+def _world_root_motion(data, hip_bone, root_bone, options, skeleton, rotation_modes=None):
+    frames, motion = kinematics.root_motion(skeleton, kinematics.data_channels(data, (hip_bone,)), hip_bone, root_bone, options, rotation_modes)
+    if motion is None:
+        return data
+    hip_path = fcurves.bone_data_path(hip_bone, 'location')
+    interpolation = _interpolation(data, hip_path, len(frames))
+    result = replace_channels(data, fcurves.bone_data_path(root_bone, 'location'), root_bone, frames, motion.root_location, interpolation)
+    result = replace_channels(result, hip_path, hip_bone, frames, motion.hip_location, interpolation)
+    if motion.root_rotation is not None:
+        prop = 'rotation_euler' if (rotation_modes or {}).get(hip_bone, 'QUATERNION') in transforms.EULER_ORDERS else 'rotation_quaternion'
+        result = replace_channels(result, fcurves.bone_data_path(root_bone, 'rotation_quaternion'), root_bone, frames, motion.root_rotation, interpolation)
+        result = replace_channels(result, fcurves.bone_data_path(hip_bone, prop), hip_bone, frames, motion.hip_rotation, interpolation)
+    return result
+
+def resample(data, target_fps=resampling.DEFAULT_FPS, source_fps=resampling.DEFAULT_FPS, start_frame=0.0):
+    '''resample.resample_data as a step'''
+    return resampling.resample_data(data, target_fps, source_fps, start_frame)
+
+def reduce_keys(data, tolerances=None):
+    '''reduction.reduce_action on arrays'''
+    tolerances = dict(reduction.DEFAULT_TOLERANCES, **(tolerances or {}))
+    starts, ends = bounds(data)
+    keep = np.ones(len(data['co']), dtype=bool)
+    counts = data['counts'].copy()
+    reduced = np.zeros(len(counts), dtype=bool)
+    for row, data_path in enumerate(data['data_paths']):
+        name = reduction.channel_type(data_path)
+        if name is None or tolerances.get(name) is None or counts[row] <= 2:
+            continue
+        co = data['co'][starts[row]:ends[row]]
+        kept = reduction.simplify(co[:, 0].astype(np.float64), co[:, 1].astype(np.float64), tolerances[name])
+        keep[starts[row]:ends[row]] = False
+        keep[starts[row] + kept] = True
+        reduced[row] = len(kept) < counts[row]
+        counts[row] = len(kept)
+    result = dict(data, counts=counts)
+    for attr in ARRAYS:
+        result[attr] = data[attr][keep]
+    # Handles of the remaining keys are placed again by fcurve.update(), reduced channels go
+    # linear like in reduction.reduce_fcurve
+    result['handle_left'] = result['handle_right'] = result['co']
+    result['interpolation'] = np.where(np.repeat(reduced, counts), fcurves.LINEAR, result['interpolation']).astype(np.int32)
+    return result
+
+
+def run_steps(data, steps):
+    for step in steps:
+        data = step(data)
+    return data
+
+def bone_filter(*bone_names):
+    '''Channel filter for process_actions() selecting the channels of some bones'''
+    prefixes = tuple('pose.bones["%s"].' % name for name in bone_names)
+    return lambda data_path: data_path.startswith(prefixes)
+
+def process_actions(actions, steps, workers=DEFAULT_WORKERS, channel_filter=None):
+    '''Runs steps over every action in the three phases. Returns {phase: seconds}
+
+    channel_filter (a function of the data path) limits the channels read, the steps only see
+    those and other channels are left alone.
+    '''
+    actions = list(actions)
+    timings = {}
+    start = time.perf_counter()
+    datas = [fcurves.read_action(action, channel_filter) for action in actions]
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if workers > 1 and len(datas) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mixamoroot_compute") as executor:
+            results = list(executor.map(run_steps, datas, [steps] * len(datas)))
+    else:
+        results = [run_steps(data, steps) for data in datas]
+    timings['compute'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for action, data, previous in zip(actions, results, datas):
+        fcurves.update_action(action, data, previous)
+    timings['write'] = time.perf_counter() - start
+    return timings
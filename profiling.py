@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Per stage timings of the import pipeline. The pipeline wraps its stages in stage(), which does
+# nothing unless a Profiler was started, so the functions don't need to pass one around.
+# Every stage records its wall time, the fcurves and keyframes of the actions it worked on and
+# the number of datablocks in bpy.data before and after it.
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+REPORT_NAME = "mixamoroot_profile"
+# Reports go in a sub directory of the source directory by default, the import skips directories
+DEFAULT_DIRNAME = ".mixamoroot_profile"
+
+# bpy.data collections counted before and after every stage
+DATABLOCKS = ('objects', 'meshes', 'armatures', 'actions', 'materials', 'textures', 'images')
+
+CSV_FIELDS = ('file', 'stage', 'seconds', 'fcurves', 'keyframes', 'datablocks_before', 'datablocks_after')
+
+_active = None
+
+# (stage, total seconds, share of the run) of the last finished run, shown in the panel
+last_summary = []
+
+
+def count_datablocks(data):
+    return sum(len(getattr(data, name)) for name in DATABLOCKS)
+
+def count_keys(actions):
+    '''(fcurves, keyframes) of a list of actions'''
+    curves = keys = 0
+    for action in actions:
+        if action is None:
+            continue
+        for fc in action.fcurves:
+            curves += 1
+            keys += len(fc.keyframe_points)
+    return curves, keys
+
+class Profiler:
+    '''Collects stage records per file, data is bpy.data'''
+
+    def __init__(self, data, info=None):
+        self.data = data
+        self.info = dict(info or {}, started=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self.records = []
+        self.file = ""
+
+    def begin_file(self, filepath):
+        self.file = os.path.basename(filepath)
+
+    @contextmanager
+    def stage(self, name, actions=None):
+        '''actions is a list, or a callable returning one once the stage is done (e.g. after an import)'''
+        before = count_datablocks(self.data)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if callable(actions):
+                actions = actions()
+            curves, keys = count_keys(actions or [])
+            self.records.append({'file': self.file, 'stage': name, 'seconds': seconds, 'fcurves': curves,
+                                 'keyframes': keys, 'datablocks_before': before,
+                                 'datablocks_after': count_datablocks(self.data)})
+
+    def totals(self):
+        '''stage -> total seconds, in the order stages first ran'''
+        totals = {}
+        for record in self.records:
+            totals[record['stage']] = totals.get(record['stage'], 0.0) + record['seconds']
+        return totals
+
+    def summary(self):
+        totals = self.totals()
+        overall = sum(totals.values()) or 1.0
+        return [(name, seconds, seconds / overall) for name, seconds in totals.items()]
+
+    def write_report(self, directory, name=None):
+        '''Writes name.json (run info, per file stages and totals) and name.csv (one row per stage). Returns both paths
+
+        By default name includes the start time, so earlier reports stay around to compare against.
+        '''
+        if name is None:
+            name = "%s_%s" % (REPORT_NAME, self.info['started'].replace(':', '').replace('-', ''))
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        for record in self.records:
+            files.setdefault(record['file'], []).append({k: v for k, v in record.items() if k != 'file'})
+        json_path = os.path.join(directory, name + ".json")
+        with open(json_path, 'w') as f:
+            json.dump({'info': self.info, 'totals': self.totals(), 'files': files}, f, indent=1)
+        csv_path = os.path.join(directory, name + ".csv")
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+        return json_path, csv_path
+
+def start(data, info=None):
+    global _active
+    _active = Profiler(data, info)
+    return _active
+
+def stop():
+    '''Ends the active run and keeps its summary for the panel. Returns the profiler'''
+    global _active, last_summary
+    profiler, _active = _active, None
+    if profiler is not None:
+        last_summary = profiler.summary()
+    return profiler
+
+def begin_file(filepath):
+    if _active is not None:
+        _active.begin_file(filepath)
+
+def stage(name, actions=None):
+    if _active is None:
+        return _null_stage()
+    return _active.stage(name, actions)
+
+@contextmanager
+def _null_stage():
+    yield
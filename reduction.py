@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Keyframe reduction for imported actions. Mixamo bakes a key on every frame of every channel,
+# most of which lie on a straight line between their neighbours. Each fcurve is simplified with
+# Ramer-Douglas-Peucker on (frame, value): a key is only dropped if the curve through the kept
+# keys stays within the tolerance of its value. The error is measured against linear
+# interpolation, which is what the fbx importer uses, and the keys of a reduced curve are set to
+# linear so the bound also holds for curves that came in with bezier keys.
+import logging
+
+import numpy as np
+
+try:
+    from . import fcurves
+except ImportError:
+    import fcurves
+
+
+log = logging.getLogger(__name__)
+
+CHANNEL_TYPES = ('location', 'rotation', 'scale')
+
+# In the action's units: meters (or centimeters before scaling) for location, quaternion
+# components or radians for rotation, factor for scale
+DEFAULT_TOLERANCES = {'location': 0.0005, 'rotation': 0.0005, 'scale': 0.0005}
+
+
+def channel_type(data_path):
+    '''location, rotation or scale for transform channels, None for anything else'''
+    prop = data_path.rsplit('.', 1)[-1]
+    if prop == 'location':
+        return 'location'
+    if prop.startswith('rotation_'):
+        return 'rotation'
+    if prop == 'scale':
+        return 'scale'
+    return None
+
+def simplify(frames, values, tolerance):
+    '''Indices of the keys to keep so linear interpolation stays within tolerance of every value'''
+    count = len(frames)
+    if count <= 2:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = slice(first + 1, last)
+        t = (frames[inner] - frames[first]) / (frames[last] - frames[first])
+        error = np.abs(values[inner] - (values[first] + t * (values[last] - values[first])))
+        i = int(np.argmax(error))
+        if error[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+def reduce_fcurve(fcurve, tolerance):
+    '''Simplifies one fcurve in place. Returns (keys before, keys after)'''
+    keys = fcurves.read_keys(fcurve)
+    before = len(keys['co'])
+    frames = keys['co'][:, 0].astype(np.float64)
+    values = keys['co'][:, 1].astype(np.float64)
+    kept = simplify(frames, values, tolerance)
+    if len(kept) < before:
+        # Handles of the remaining keys are placed again by fcurve.update(), bezier between them
+        # could overshoot the tolerance
+        fcurves.write_keys(fcurve, {'co': keys['co'][kept], 'interpolation': np.full(len(kept), fcurves.LINEAR, dtype=np.int32)})
+    return before, len(kept)
+
+def reduce_action(action, tolerances=None):
+    '''Simplifies every transform channel of an action.
+
+    tolerances maps 'location', 'rotation' and 'scale' to a tolerance, a missing entry takes the
+    one of DEFAULT_TOLERANCES and a None entry leaves that channel type alone.
+    Returns {channel type: [keys before, keys after]}.
+    '''
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    stats = {name: [0, 0] for name in CHANNEL_TYPES}
+    for fc in action.fcurves:
+        name = channel_type(fc.data_path)
+        if name is None or tolerances.get(name) is None:
+            continue
+        before, after = reduce_fcurve(fc, tolerances[name])
+        stats[name][0] += before
+        stats[name][1] += after
+    removed = ", ".join("%s %d/%d" % (name, b - a, b) for name, (b, a) in stats.items() if b)
+    print("[Mixamo Root] Reduced %s, keys removed: %s" % (action.name, removed or "none"))
+    return stats
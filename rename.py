@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Prefix renaming of bones, vertex groups and action channels. The old -> new name map is built
+# once per skeleton and then applied to just the data of the file that was imported, instead of
+# rewriting every action in the blend file after each import.
+
+# (name_prefix, target_prefix, bone names) -> name map
+_name_maps = {}
+
+BONE_PATH_START = 'pose.bones["'
+
+
+def rename(name, name_prefix, target_prefix=""):
+    '''Swaps name_prefix for target_prefix, names without the prefix are returned unchanged'''
+    if name_prefix and name.startswith(name_prefix):
+        return target_prefix + name[len(name_prefix):]
+    return name
+
+def name_map(bone_names, name_prefix, target_prefix=""):
+    '''old -> new for every bone name that changes, cached per skeleton'''
+    bone_names = tuple(bone_names)
+    key = (name_prefix, target_prefix, bone_names)
+    if key not in _name_maps:
+        _name_maps[key] = {name: rename(name, name_prefix, target_prefix) for name in bone_names
+                           if rename(name, name_prefix, target_prefix) != name}
+    return _name_maps[key]
+
+def rename_data_path(data_path, names):
+    '''Renames the bone of a pose.bones["..."] data path, other paths are returned unchanged'''
+    if not data_path.startswith(BONE_PATH_START):
+        return data_path
+    end = data_path.find('"]', len(BONE_PATH_START))
+    new_name = names.get(data_path[len(BONE_PATH_START):end])
+    if new_name is None:
+        return data_path
+    return BONE_PATH_START + new_name + data_path[end:]
+
+def rename_action(action, names):
+    '''Renames the bone channels and groups of one action in a single pass. Returns channels renamed'''
+    renamed = 0
+    for fc in action.fcurves:
+        data_path = rename_data_path(fc.data_path, names)
+        if data_path != fc.data_path:
+            fc.data_path = data_path
+            renamed += 1
+    for group in action.groups:
+        if group.name in names:
+            group.name = names[group.name]
+    return renamed
+
+def rig_actions(rig):
+    '''The actions used by a rig, active action and NLA strips'''
+    animation_data = rig.animation_data
+    if animation_data is None:
+        return []
+    actions = [animation_data.action] if animation_data.action else []
+    for track in animation_data.nla_tracks:
+        actions.extend(strip.action for strip in track.strips if strip.action and strip.action not in actions)
+    return actions
+
+def rename_rig(rig, name_prefix, target_prefix="", actions=None):
+    '''Renames the bones, child mesh vertex groups and actions (by default the rig's own) of a rig.
+
+    The active action is detached while the bones are renamed, otherwise blender rewrites its
+    channels bone by bone as well. Returns the name map used.
+    '''
+    names = name_map([bone.name for bone in rig.data.bones], name_prefix, target_prefix)
+    if not names:
+        return names
+    if actions is None:
+        actions = rig_actions(rig)
+    animation_data = rig.animation_data
+    active_action = animation_data.action if animation_data else None
+    if active_action is not None:
+        animation_data.action = None
+
+    for action in actions:
+        rename_action(action, names)
+    for bone in rig.data.bones:
+        if bone.name in names:
+            bone.name = names[bone.name]
+    # Bone renames already fix vertex groups of skinned children, this catches everything else
+    for child in rig.children:
+        for vg in child.vertex_groups:
+            if vg.name in names:
+                vg.name = names[vg.name]
+
+    if active_action is not None:
+        animation_data.action = active_action
+    return names
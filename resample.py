@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Frame rate resampling and start frame normalization of imported actions. Keys are read with
+# fcurves.read_action, every channel is sampled at the target rate in a single np.interp call for
+# the whole action (channels are laid out one after another on the frame axis) and written back
+# curve by curve. Samples are spaced one frame apart from start_frame, so a 60 fps clip resampled
+# to 30 fps keeps half its keys. Quaternion channels are renormalized after interpolation.
+import numpy as np
+
+try:
+    from . import fcurves
+except ImportError:
+    import fcurves
+
+
+DEFAULT_FPS = 30.0
+
+
+def sample_times(first, last, source_fps, target_fps):
+    '''Source frames of the samples of a first .. last frame range at target_fps, the last one on last'''
+    step = source_fps / target_fps
+    count = int(np.floor((last - first) / step + 1e-6)) + 1
+    frames = first + np.arange(count) * step
+    if frames[-1] < last - 1e-6:
+        frames = np.append(frames, last)
+    return frames
+
+def sample_channels(frames, values, counts, samples):
+    '''(channels, samples) values of flat per channel keys (frames sorted within each channel, no
+    empty channel) at samples, clamped to each channel's own key range. One np.interp for all.
+    '''
+    frames = np.asarray(frames, dtype=np.float64)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    # Shifting each channel well past the one before keeps the concatenated frames sorted
+    stride = 2.0 * (frames.max() - frames.min() + np.ptp(samples) + 1.0)
+    base = min(frames.min(), samples.min())
+    offsets = np.arange(len(counts)) * stride
+    shifted = frames - base + np.repeat(offsets, counts)
+    queries = np.clip(samples[None, :], frames[starts][:, None], frames[ends - 1][:, None]) - base + offsets[:, None]
+    return np.interp(queries.ravel(), shifted, values).reshape(len(counts), len(samples))
+
+def _normalize_quaternions(data_paths, array_indices, sampled):
+    # Linear interpolation of the components shortens the quaternions between keys
+    rows = {}
+    for row, (data_path, index) in enumerate(zip(data_paths, array_indices)):
+        if data_path.endswith('rotation_quaternion'):
+            rows.setdefault(data_path, {})[int(index)] = row
+    for components in rows.values():
+        if len(components) == 4:
+            quaternion = sampled[[components[i] for i in range(4)]]
+            sampled[[components[i] for i in range(4)]] = quaternion / np.maximum(np.linalg.norm(quaternion, axis=0), 1e-12)
+
+def resample_data(data, target_fps=DEFAULT_FPS, source_fps=DEFAULT_FPS, start_frame=0.0):
+    '''Resampled copy of fcurves.read_action() arrays, see resample_action'''
+    counts = data['counts']
+    if not counts.sum():
+        return data
+    frames = data['co'][:, 0].astype(np.float64)
+    values = data['co'][:, 1].astype(np.float64)
+    first = frames.min()
+
+    if not target_fps:
+        # Shift only: frames, handles and all
+        shifted = dict(data)
+        for attr in fcurves.KEY_ATTRS:
+            shifted[attr] = data[attr].copy()
+            shifted[attr][:, 0] += start_frame - first
+        return shifted
+
+    keyed = counts > 0
+    samples = sample_times(first, frames.max(), source_fps, target_fps)
+    output_frames = start_frame + (samples - first) * target_fps / source_fps
+    sampled = np.empty((len(counts), len(samples)))
+    sampled[keyed] = sample_channels(frames, values, counts[keyed], samples)
+    _normalize_quaternions(data['data_paths'], data['array_indices'], sampled)
+
+    # A channel with one key stays one key, empty channels stay empty
+    starts = np.cumsum(counts) - counts
+    new_counts = np.where(counts > 1, len(samples), counts)
+    co = np.empty((int(new_counts.sum()), 2), dtype=np.float32)
+    interpolation = np.empty(len(co), dtype=np.int32)
+    position = 0
+    for i in np.flatnonzero(keyed):
+        if counts[i] == 1:
+            co[position] = (start_frame, values[starts[i]])
+        else:
+            co[position:position + len(samples), 0] = output_frames
+            co[position:position + len(samples), 1] = sampled[i]
+        interpolation[position:position + new_counts[i]] = data['interpolation'][starts[i]]
+        position += new_counts[i]
+    resampled = dict(data, counts=new_counts.astype(np.int64), interpolation=interpolation)
+    # Handles of the new keys are placed by fcurve.update() when written
+    for attr in fcurves.KEY_ATTRS:
+        resampled[attr] = co
+    return resampled
+
+def resample_action(action, target_fps=DEFAULT_FPS, source_fps=DEFAULT_FPS, start_frame=0.0):
+    '''Resamples every channel of action from source_fps to one key per frame at target_fps,
+    starting at start_frame. target_fps 0 only moves the keys to start at start_frame.
+    Returns (keys before, keys after).
+    '''
+    data = fcurves.read_action(action)
+    before = int(data['counts'].sum())
+    if not before:
+        return 0, 0
+    resampled = resample_data(data, target_fps, source_fps, start_frame)
+    fcurves.update_action(action, resampled)
+    after = int(resampled['counts'].sum())
+    _set_frame_range(action, start_frame, resampled['co'][:, 0].max())
+    if target_fps:
+        print("[Mixamo Root] Resampled %s to %g fps, %d keys -> %d" % (action.name, target_fps, before, after))
+    return before, after
+
+def _set_frame_range(action, start, end):
+    # Only a manual frame range needs updating, otherwise it follows the keys
+    if getattr(action, 'use_frame_range', False):
+        action.frame_start = start
+        action.frame_end = end
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Retargeting of imported mixamo actions onto a control rig without operators. The bone map and
+# the rest pose corrections between the two skeletons are worked out once, after that every clip
+# is a handful of array operations per bone over its whole frame range.
+#
+# A pose basis rotation q of a source bone is carried over as the same rotation in world space:
+# with Rs, Rt the world rest rotations of the source and target bone, the target basis is
+# (Rs^-1 Rt)^-1 q (Rs^-1 Rt). Locations are converted the same way and scaled by the ratio of the
+# two objects' world scales.
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from . import fcurves
+    from . import rootmotion
+    from . import transforms
+except ImportError:
+    import fcurves
+    import rootmotion
+    import transforms
+
+
+CONTROL_PREFIX = "Ctrl_"
+
+# (source bone names, target bone names, name_prefix, control_prefix) -> bone map
+_bone_maps = {}
+
+# Per mapped bone pair: correction quaternion c = Rs^-1 Rt, location matrix Rt^-1 Rs * scale
+BonePair = namedtuple('BonePair', 'source target correction location_matrix')
+
+
+def normalize(name, name_prefix="mixamorig:", control_prefix=CONTROL_PREFIX):
+    '''Name used to match bones of both rigs: without prefixes, separators or case'''
+    for prefix in (name_prefix, control_prefix):
+        if prefix and name.startswith(prefix):
+            name = name[len(prefix):]
+    return name.replace("_", "").replace(":", "").lower()
+
+def bone_map(source_names, target_names, name_prefix="mixamorig:", control_prefix=CONTROL_PREFIX):
+    '''source -> target bone name, cached per pair of skeletons.
+
+    Control bones win over deform bones of the same name on the target, those are usually
+    constrained to the control bones anyway.
+    '''
+    key = (tuple(source_names), tuple(target_names), name_prefix, control_prefix)
+    if key not in _bone_maps:
+        targets = {}
+        for name in target_names:
+            normal = normalize(name, name_prefix, control_prefix)
+            if normal not in targets or (control_prefix and name.startswith(control_prefix)):
+                targets[normal] = name
+        _bone_maps[key] = {name: targets[normalize(name, name_prefix, control_prefix)] for name in source_names
+                           if normalize(name, name_prefix, control_prefix) in targets}
+    return _bone_maps[key]
+
+def rest_rotations(obj, bone_names):
+    '''(n, 3, 3) world space rest rotations of bones, plus the uniform world scale of obj'''
+    bones = obj.data.bones
+    matrices = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get('matrix_local', matrices)
+    # foreach_get flattens matrices column by column
+    matrices = matrices.reshape(-1, 4, 4).transpose(0, 2, 1)[:, :3, :3].astype(np.float64)
+    indices = [bones.find(name) for name in bone_names]
+    world = np.array(obj.matrix_world, dtype=np.float64)[:3, :3]
+    scale = np.cbrt(abs(np.linalg.det(world)))
+    rotation = world / scale @ matrices[indices]
+    # Bones can carry scale in their rest matrix, only the rotation is wanted
+    rotation /= np.linalg.norm(rotation, axis=1, keepdims=True)
+    return rotation, scale
+
+class Retarget:
+    '''Bone map and rest pose corrections from one source skeleton to a target rig'''
+
+    def __init__(self, source, target, name_prefix="mixamorig:", control_prefix=CONTROL_PREFIX):
+        self.target = target
+        names = bone_map([bone.name for bone in source.data.bones], [bone.name for bone in target.data.bones],
+                         name_prefix, control_prefix)
+        self.source_names = tuple(names)
+        self.source_rest, source_scale = rest_rotations(source, self.source_names)
+        target_rest, target_scale = rest_rotations(target, [names[name] for name in self.source_names])
+        correction = np.transpose(self.source_rest, (0, 2, 1)) @ target_rest
+        location = np.transpose(target_rest, (0, 2, 1)) @ self.source_rest * (source_scale / target_scale)
+        quaternions = transforms.matrices_to_quaternions(correction)
+        self.pairs = [BonePair(name, names[name], quaternions[i:i + 1], location[i])
+                      for i, name in enumerate(self.source_names)]
+
+    def matches(self, source):
+        '''True if source has the skeleton (bone names and rest pose) this was built for'''
+        if tuple(name for name in self.source_names if name in source.data.bones) != self.source_names:
+            return False
+        rest, _ = rest_rotations(source, self.source_names)
+        return np.allclose(rest, self.source_rest, atol=1e-5)
+
+    def apply(self, source_action, target_action):
+        '''Bakes source_action onto target_action for every mapped bone. Returns bones written'''
+        written = 0
+        for pair in self.pairs:
+            rotation = rootmotion.read_channels(fcurves.find_fcurves(source_action, fcurves.bone_data_path(pair.source, 'rotation_quaternion')))
+            location = rootmotion.read_channels(fcurves.find_fcurves(source_action, fcurves.bone_data_path(pair.source, 'location')))
+            # Constant location channels are the rest pose, the target keeps its own
+            location = {i: co for i, co in location.items() if np.ptp(co[:, 1]) > 1e-6}
+            if not rotation and not location:
+                continue
+            frames = np.unique(np.concatenate([co[:, 0] for co in list(rotation.values()) + list(location.values())]))
+            if rotation:
+                q = rootmotion.sample_channels(rotation, 4, (1.0, 0.0, 0.0, 0.0), frames)
+                c = np.repeat(pair.correction, len(frames), axis=0)
+                q = transforms.quaternion_multiply(transforms.quaternion_multiply(transforms.quaternion_conjugate(c), q), c)
+                self._write_rotation(target_action, pair.target, frames, transforms.make_continuous(q))
+            if location:
+                values = rootmotion.sample_channels(location, 3, (0.0, 0.0, 0.0), frames)
+                rootmotion.write_channels(target_action, pair.target, 'location', frames, values @ pair.location_matrix.T)
+            written += 1
+        return written
+
+    def _write_rotation(self, action, bone_name, frames, q):
+        mode = self.target.pose.bones[bone_name].rotation_mode
+        if mode in transforms.EULER_ORDERS:
+            euler = transforms.matrices_to_euler(transforms.quaternions_to_matrices(q), mode)
+            rootmotion.write_channels(action, bone_name, 'rotation_euler', frames, euler)
+        else:
+            rootmotion.write_channels(action, bone_name, 'rotation_quaternion', frames, q)
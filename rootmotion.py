@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Root motion extraction on whole arrays of hip keys. The root bone inserted by mixamoroot sits at
+# the origin with the same orientation as the hips, so both share one coordinate frame: bone local
+# Y is up and Z is the direction the character faces.
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from . import fcurves
+    from . import transforms
+except ImportError:
+    import fcurves
+    import transforms
+
+
+UP_AXIS = 1
+FORWARD_AXIS = 2
+
+# Options understood by extract()/apply_to_action(), as passed around in the root_motion dict
+DEFAULT_OPTIONS = {
+    'project_ground': False, # root only keeps the ground plane motion, the height stays on the hips
+    'clamp_floor': False, # root height never goes below floor_height
+    'floor_height': 0.0,
+    'use_yaw': False, # root also gets the heading (rotation around the up axis) of the hips
+    'world_space': False, # hips evaluated through their rest matrix (kinematics.root_motion), needs the skeleton
+}
+
+RootMotion = namedtuple('RootMotion', 'root_location root_rotation hip_location hip_rotation')
+
+
+def heading(rotation, up_axis=UP_AXIS, forward_axis=FORWARD_AXIS):
+    '''Continuous angle (radians) of the rotated forward axis around the up axis'''
+    forward = np.zeros((len(rotation), 3))
+    forward[:, forward_axis] = 1.0
+    v = transforms.quaternion_rotate(rotation, forward)
+    side = 3 - up_axis - forward_axis
+    # A positive rotation around up turns axis up+1 towards up+2
+    sign = 1.0 if forward_axis == (up_axis + 1) % 3 else -1.0
+    return np.unwrap(np.arctan2(sign * v[:, side], v[:, forward_axis]))
+
+def extract(hip_location, hip_rotation=None, project_ground=False, clamp_floor=False, floor_height=0.0,
+            use_yaw=False, hip_rest_head=(0.0, 0.0, 0.0), up_axis=UP_AXIS, forward_axis=FORWARD_AXIS):
+    '''Splits (n, 3) hip locations (and (n, 4) hip quaternions) into root motion and hip offsets.
+
+    The returned hip channels are compensated so the hips end up exactly where they were before.
+    hip_rest_head is the rest position of the hips relative to the root, only needed with use_yaw.
+    root_rotation/hip_rotation are None unless use_yaw is set.
+    '''
+    hip_location = np.asarray(hip_location, dtype=np.float64)
+    root_location = hip_location.copy()
+    if project_ground:
+        root_location[:, up_axis] = 0.0
+    elif clamp_floor:
+        root_location[:, up_axis] = np.maximum(root_location[:, up_axis], floor_height)
+
+    if not use_yaw or hip_rotation is None:
+        return RootMotion(root_location, None, hip_location - root_location, None)
+
+    hip_rotation = np.asarray(hip_rotation, dtype=np.float64)
+    root_rotation = transforms.axis_quaternions(heading(hip_rotation, up_axis, forward_axis), up_axis)
+    inverse = transforms.quaternion_conjugate(root_rotation)
+    # hips in root space: R_root^-1 * (rest + location - root) - rest
+    rest = np.asarray(hip_rest_head, dtype=np.float64)
+    offsets = transforms.quaternion_rotate(inverse, rest + hip_location - root_location) - rest
+    return RootMotion(root_location, root_rotation, offsets, transforms.quaternion_multiply(inverse, hip_rotation))
+
+def read_channels(curves):
+    '''Reads the key coordinates of fcurves, by array index'''
+    return {fc.array_index: fcurves.read_keys(fc)['co'] for fc in curves}
+
+def sample_channels(channels, size, defaults, frames):
+    '''Evaluates read_channels() output at frames, missing indices use defaults. Returns (n, size) values'''
+    values = np.empty((len(frames), size))
+    for i in range(size):
+        if i in channels:
+            values[:, i] = np.interp(frames, channels[i][:, 0], channels[i][:, 1])
+        else:
+            values[:, i] = defaults[i]
+    return values
+
+def write_channels(action, bone_name, prop, frames, values, interpolation=None):
+    '''Writes (n, size) values at frames onto the channels of one bone property, creating them as needed'''
+    data_path = fcurves.bone_data_path(bone_name, prop)
+    for i in range(values.shape[1]):
+        keys = {'co': np.column_stack((frames, values[:, i]))}
+        if interpolation is not None:
+            keys['interpolation'] = interpolation
+        fcurves.write_keys(fcurves.ensure_fcurve(action, data_path, i, bone_name), keys)
+
+def apply_to_action(action, hip_bone, root_bone, options=None, hip_rest_head=(0.0, 0.0, 0.0)):
+    '''Moves the root motion of hip_bone onto root_bone in an action, see extract() for options.
+
+    Without any option this is a plain move of the hip location channels onto the root.
+    Returns the number of frames processed.
+    '''
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    if not (options['project_ground'] or options['clamp_floor'] or options['use_yaw']):
+        fcurves.transfer_location(action, hip_bone, root_bone)
+        return 0
+
+    location_curves = fcurves.find_fcurves(action, fcurves.bone_data_path(hip_bone, 'location'))
+    if not location_curves:
+        return 0
+    location_channels = read_channels(location_curves)
+    rotation_channels = {}
+    if options['use_yaw']:
+        rotation_channels = read_channels(fcurves.find_fcurves(action, fcurves.bone_data_path(hip_bone, 'rotation_quaternion')))
+    # All channels are evaluated on the union of their key frames so they line up frame by frame
+    frames = np.unique(np.concatenate([co[:, 0] for co in list(location_channels.values()) + list(rotation_channels.values())]))
+    location = sample_channels(location_channels, 3, (0.0, 0.0, 0.0), frames)
+    rotation = sample_channels(rotation_channels, 4, (1.0, 0.0, 0.0, 0.0), frames) if rotation_channels else None
+
+    motion = extract(location, rotation, options['project_ground'], options['clamp_floor'], options['floor_height'],
+                     options['use_yaw'], hip_rest_head)
+
+    interpolation = None
+    source = fcurves.read_keys(location_curves[0])
+    if len(source['co']) == len(frames):
+        # Same keys as before, keep their interpolation
+        interpolation = source['interpolation']
+    write_channels(action, root_bone, 'location', frames, motion.root_location, interpolation)
+    write_channels(action, hip_bone, 'location', frames, motion.hip_location, interpolation)
+    if motion.root_rotation is not None:
+        write_channels(action, root_bone, 'rotation_quaternion', frames, motion.root_rotation, interpolation)
+        write_channels(action, hip_bone, 'rotation_quaternion', frames, motion.hip_rotation, interpolation)
+    return len(frames)
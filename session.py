@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Bounded memory batch session. Over a long import every file leaves meshes, armature data,
+# materials and images behind once its objects are deleted, and every operator call adds an undo
+# step holding a copy of the scene. A session turns global undo off for the run, after every file
+# removes the datablocks it created that nothing uses anymore, and when the process gets close to
+# a memory budget writes the finished actions to an animation library part file and removes them
+# from the blend file. Parts are merged into one library when the session closes.
+import ctypes
+import logging
+import os
+import sys
+import time
+
+try:
+    from . import animlib
+except ImportError:
+    import animlib
+
+log = logging.getLogger(__name__)
+
+# Flushed actions go in a sub directory of the source directory by default, the import skips it
+DEFAULT_DIRNAME = ".mixamoroot_session"
+# bpy.data collections checked for orphans after each file, actions are never purged
+PURGED_DATABLOCKS = ('objects', 'meshes', 'armatures', 'materials', 'textures', 'images', 'node_groups')
+# Share of the budget at which actions are flushed
+FLUSH_AT = 0.9
+MB = 1024.0 * 1024.0
+
+
+class _MemoryCounters(ctypes.Structure):
+    # PROCESS_MEMORY_COUNTERS of psapi
+    _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong)] + \
+               [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                                                     'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                                                     'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+def memory_usage():
+    '''Resident memory of this process in MB (the peak on platforms without a current value), None if unknown'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if sys.platform == 'win32':
+        counters = _MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize / MB
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return peak / MB if sys.platform == 'darwin' else peak / 1024.0
+
+class Session:
+    '''One batch run, data is bpy.data and preferences bpy.context.preferences.
+
+    memory_budget is in MB, 0 only purges and logs. Call begin_file() and end_file() around every
+    file and close() once at the end, also when the run stops early.
+    '''
+
+    def __init__(self, data, preferences, memory_budget=0, flush_directory="", purge=True):
+        self.data = data
+        self.preferences = preferences
+        self.memory_budget = memory_budget
+        self.flush_directory = flush_directory
+        self.purge = purge
+        self.parts = []
+        self.flushed = 0
+        self.purged = 0
+        self.peak = 0.0
+        self._snapshot = None
+        self.closed = False
+        self._kept_actions = set(data.actions)
+        self._undo = preferences.edit.use_global_undo
+        preferences.edit.use_global_undo = False
+        self.started = time.strftime('%Y%m%d_%H%M%S')
+        self.memory_start = memory_usage()
+
+    def begin_file(self):
+        # Datablocks from before the first file are never purged. Later ones are, also when they
+        # lose their last user in a later file (e.g. an armature deleted once the next one is in)
+        if self.purge and self._snapshot is None:
+            self._snapshot = {name: set(getattr(self.data, name)) for name in PURGED_DATABLOCKS}
+
+    def purge_orphans(self):
+        '''Removes datablocks created during the session that nothing uses anymore. Returns the count'''
+        if self._snapshot is None:
+            return 0
+        removed = 0
+        # Removing a mesh can leave its materials without users, and those their images
+        while True:
+            count = 0
+            for name in PURGED_DATABLOCKS:
+                collection = getattr(self.data, name)
+                for block in set(collection) - self._snapshot[name]:
+                    if block.users == 0:
+                        collection.remove(block)
+                        count += 1
+            if not count:
+                break
+            removed += count
+        self.purged += removed
+        return removed
+
+    def over_budget(self):
+        if not self.memory_budget or self.closed:
+            return False
+        memory = memory_usage()
+        return memory is not None and memory > self.memory_budget * FLUSH_AT
+
+    def end_file(self, file):
+        '''Purges the file's orphans, logs the memory use and flushes if over budget'''
+        if self.closed:
+            return
+        purged = self.purge_orphans()
+        memory = memory_usage()
+        if memory is None:
+            print("[Mixamo Root] %s: %d orphans purged" % (file, purged))
+            return
+        self.peak = max(self.peak, memory)
+        print("[Mixamo Root] %s: %.0f MB, %d orphans purged" % (file, memory, purged))
+        if self.memory_budget and memory > self.memory_budget * FLUSH_AT:
+            self.flush()
+
+    def flush(self):
+        '''Writes the actions imported this session that no object uses to a part file and removes them'''
+        actions = [action for action in self.data.actions
+                   if action not in self._kept_actions and action.users - action.use_fake_user == 0]
+        if not actions:
+            log.warning("[Mixamo Root] Over the memory budget with no actions to flush")
+            return 0
+        os.makedirs(self.flush_directory, exist_ok=True)
+        path = os.path.join(self.flush_directory, "part_%s_%04d%s" % (self.started, len(self.parts), animlib.EXTENSION))
+        count = animlib.write_library(path, actions)
+        for action in actions:
+            self.data.actions.remove(action)
+        self.parts.append(path)
+        self.flushed += count
+        print("[Mixamo Root] Flushed %d actions to %s" % (count, path))
+        return count
+
+    def close(self):
+        '''Restores undo and merges the part files. Returns the library path of the flushed actions or None'''
+        if self.closed:
+            return None
+        self.closed = True
+        self.preferences.edit.use_global_undo = self._undo
+        if self.peak:
+            print("[Mixamo Root] Memory: %.0f MB at start, %.0f MB peak, %d orphans purged" % (self.memory_start or 0.0, self.peak, self.purged))
+        if not self.parts:
+            return None
+        path = os.path.join(self.flush_directory, "session_%s%s" % (self.started, animlib.EXTENSION))
+        animlib.merge_libraries(path, self.parts)
+        for part in self.parts:
+            os.remove(part)
+        self.parts = []
+        print("[Mixamo Root] %d actions were flushed to %s, use Load Library to bring them back" % (self.flushed, path))
+        return path
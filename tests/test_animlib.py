@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# animlib: clips written to a library file come back as they were read, also once it is closed.
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import animlib
+import fcurves
+from benchmarks import fakebpy
+from benchmarks import synthetic
+
+
+class AnimationLibraryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data = fakebpy.BlendData()
+        self.actions = [synthetic.make_clip(self.data, name, frames=10, seed=seed) for seed, name in enumerate(("Walk", "Run"))]
+        self.path = os.path.join(self.directory, "clips" + animlib.EXTENSION)
+        animlib.write_library(self.path, self.actions)
+
+    def assertSameData(self, a, b):
+        self.assertEqual(sorted(a), sorted(b))
+        for attr in a:
+            np.testing.assert_array_equal(a[attr], b[attr])
+
+    def test_round_trip(self):
+        with animlib.AnimationLibrary(self.path) as library:
+            self.assertEqual(library.names(), ["Walk", "Run"])
+            self.assertEqual(library.clips["Run"]['frame_range'], [1.0, 10.0])
+            loaded = library.load("Run", fakebpy.BlendData().actions)
+        self.assertTrue(loaded.use_fake_user)
+        self.assertSameData(fcurves.read_action(loaded), fcurves.read_action(self.actions[1]))
+
+    def test_clip_data_after_close(self):
+        with animlib.AnimationLibrary(self.path) as library:
+            data = library.clip_data("Walk")
+        self.assertSameData(data, fcurves.read_action(self.actions[0]))
+
+    def test_close_with_view(self):
+        library = animlib.AnimationLibrary(self.path)
+        view = np.frombuffer(library._map, dtype=np.uint8)
+        library.close()
+        self.assertTrue(library._file.closed)
+        self.assertEqual(bytes(view[:len(animlib.MAGIC)]), animlib.MAGIC)
+
+    def test_merge(self):
+        later = os.path.join(self.directory, "later" + animlib.EXTENSION)
+        run = synthetic.make_clip(fakebpy.BlendData(), "Run", frames=5, seed=7)
+        animlib.write_library(later, [run])
+        merged = os.path.join(self.directory, "merged" + animlib.EXTENSION)
+        self.assertEqual(animlib.merge_libraries(merged, [self.path, later]), 2)
+        with animlib.AnimationLibrary(merged) as library:
+            self.assertSameData(library.clip_data("Run"), fcurves.read_action(run))
+            self.assertSameData(library.clip_data("Walk"), fcurves.read_action(self.actions[0]))
+
+    def test_not_a_library(self):
+        empty = os.path.join(self.directory, "empty" + animlib.EXTENSION)
+        open(empty, 'wb').close()
+        with self.assertRaises(ValueError):
+            animlib.AnimationLibrary(empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
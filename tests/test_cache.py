@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# cache: processed clips come back unchanged, keyed on the file and the settings.
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cache
+import fcurves
+from benchmarks import fakebpy
+from benchmarks import synthetic
+
+
+class ClipCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, "Walk.fbx")
+        with open(self.source, 'wb') as f:
+            f.write(b"fbx")
+        self.clip_cache = cache.ClipCache(os.path.join(self.directory, cache.DEFAULT_DIRNAME))
+
+    def test_key(self):
+        key = self.clip_cache.key(self.source, {'unit_scale': 0.01})
+        self.assertEqual(key, self.clip_cache.key(None, {'unit_scale': 0.01}, b"fbx"))
+        self.assertNotEqual(key, self.clip_cache.key(self.source, {'unit_scale': 0.01, 'animation_only': True}))
+        self.assertNotEqual(key, self.clip_cache.key(None, {'unit_scale': 0.01}, b"fbx2"))
+
+    def test_store_restore(self):
+        data = fakebpy.BlendData()
+        action = synthetic.make_clip(data, "Walk", frames=10)
+        key = self.clip_cache.key(self.source, {})
+        self.assertIsNone(self.clip_cache.restore(key, data.actions, "Walk"))
+        self.clip_cache.store(key, action)
+        restored = self.clip_cache.restore(key, fakebpy.BlendData().actions, "Walk")
+        self.assertTrue(restored.use_fake_user)
+        self.assertEqual((self.clip_cache.hits, self.clip_cache.misses), (1, 1))
+        expected = fcurves.read_action(action)
+        for attr, values in fcurves.read_action(restored).items():
+            np.testing.assert_array_equal(values, expected[attr])
+
+    def test_broken_entry(self):
+        key = self.clip_cache.key(self.source, {})
+        with open(self.clip_cache.path(key), 'wb') as f:
+            f.write(b"not an npz")
+        self.assertIsNone(self.clip_cache.restore(key, fakebpy.BlendData().actions, "Walk"))
+        self.assertFalse(os.path.exists(self.clip_cache.path(key)))
+
+    def test_evict(self):
+        data = fakebpy.BlendData()
+        for i in range(3):
+            self.clip_cache.store("entry%d" % i, synthetic.make_clip(data, "Clip", frames=30, seed=i))
+            os.utime(self.clip_cache.path("entry%d" % i), (i, i))
+        size = os.path.getsize(self.clip_cache.path("entry2"))
+        self.clip_cache.max_bytes = size + size // 2
+        self.clip_cache.evict()
+        # Least recently used first
+        self.assertEqual(sorted(os.listdir(self.clip_cache.directory)), ["entry2.npz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# fbxanim against a minimal binary FBX written here: two bones, Hips with translation keys and
+# Spine with rotation keys on one axis, one animation stack, a bind pose for Spine and its parent.
+# Runs in plain python, only numpy is needed:
+#   python -m unittest discover tests
+import os
+import struct
+import sys
+import unittest
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fbxanim
+
+
+HIPS, SPINE, STACK, LAYER = 10, 11, 20, 21
+HIPS_T, SPINE_R = 30, 31
+CURVE_X, CURVE_Y, CURVE_Z, CURVE_RZ = 40, 41, 42, 43
+
+FRAME = fbxanim.FBX_KTIME // 30
+
+
+class _Writer:
+    '''Binary fbx node records, the version picks 32 or 64 bit record headers'''
+
+    def __init__(self, version):
+        self.version = version
+        self.header = struct.Struct('<QQQ' if version >= 7500 else '<III')
+
+    def prop(self, value):
+        if isinstance(value, bool):
+            return b'C' + struct.pack('<?', value)
+        if isinstance(value, int):
+            return b'L' + struct.pack('<q', value)
+        if isinstance(value, float):
+            return b'D' + struct.pack('<d', value)
+        if isinstance(value, str):
+            raw = value.encode('utf-8')
+            return b'S' + struct.pack('<I', len(raw)) + raw
+        if isinstance(value, tuple):
+            # ('I', 6): a property of an explicit scalar type
+            return value[0].encode('ascii') + struct.pack('<' + value[0].lower(), value[1])
+        # numpy array, compressed from 4 values on
+        code = {'<f4': b'f', '<f8': b'd', '<i8': b'l', '<i4': b'i'}[value.dtype.str]
+        raw = value.tobytes()
+        encoding = 1 if len(value) >= 4 else 0
+        stored = zlib.compress(raw) if encoding else raw
+        return code + struct.pack('<III', len(value), encoding, len(stored)) + stored
+
+    def node(self, offset, name, props=(), children=()):
+        '''Record of a node starting at offset in the file'''
+        props_raw = b''.join(self.prop(p) for p in props)
+        head_size = self.header.size + 1 + len(name) + len(props_raw)
+        body = b''
+        if children:
+            for child in children:
+                body += self.node(offset + head_size + len(body), *child)
+            body += b'\0' * self.header.size
+        end = offset + head_size + len(body)
+        return (self.header.pack(end, len(props), len(props_raw)) + bytes([len(name)]) + name.encode('ascii')
+                + props_raw + body)
+
+    def file(self, nodes):
+        data = fbxanim.FBX_MAGIC + b'\x1a\x00' + struct.pack('<I', self.version)
+        for node in nodes:
+            data += self.node(len(data), *node)
+        return data + b'\0' * self.header.size
+
+
+def _p(name, *values):
+    return ('P', (name, name, "", "A") + values)
+
+def _properties70(*props):
+    return ('Properties70', (), props)
+
+def _model(uid, name, translation):
+    return ('Model', (uid, name + "\x00\x01Model", "LimbNode"),
+            [_properties70(_p('Lcl Translation', *translation))])
+
+def _curve(uid, values):
+    times = np.arange(len(values), dtype='<i8') * FRAME
+    return ('AnimationCurve', (uid, "\x00\x01AnimCurve", ""),
+            [('KeyTime', (times,)), ('KeyValueFloat', (np.array(values, dtype='<f4'),))])
+
+def _curve_node(uid, name, defaults):
+    return ('AnimationCurveNode', (uid, name + "\x00\x01AnimCurveNode", ""),
+            [_properties70(*(_p('d|' + axis, value) for axis, value in zip('XYZ', defaults)))])
+
+def _translation(x, y, z):
+    m = np.eye(4)
+    m[:3, 3] = x, y, z
+    # Column major, like the fbx stores it
+    return m.T.reshape(-1).astype('<f8')
+
+def _pose_node(uid, matrix):
+    return ('PoseNode', (), [('Node', (uid,)), ('Matrix', (matrix,))])
+
+def sample_fbx(version=7400):
+    '''A mixamo like file: Hips moving along X over 3 frames, Spine turning 90 degrees around Z'''
+    objects = [
+        _model(HIPS, "mixamorig:Hips", (0.0, 100.0, 0.0)),
+        # The bind pose puts Spine 10 above Hips, its static translation 12 is what the keys move from
+        _model(SPINE, "mixamorig:Spine", (0.0, 12.0, 0.0)),
+        ('AnimationStack', (STACK, "mixamo.com\x00\x01AnimStack", "")),
+        ('AnimationLayer', (LAYER, "BaseLayer\x00\x01AnimLayer", "")),
+        _curve_node(HIPS_T, "T", (0.0, 100.0, 0.0)),
+        _curve_node(SPINE_R, "R", (0.0, 0.0, 0.0)),
+        _curve(CURVE_X, [0.0, 5.0, 10.0]),
+        _curve(CURVE_Y, [100.0, 100.0, 100.0]),
+        _curve(CURVE_Z, [0.0, 0.0, 0.0]),
+        # Four keys, stored zlib compressed
+        _curve(CURVE_RZ, [0.0, 30.0, 60.0, 90.0]),
+        ('Pose', (50, "BindPose\x00\x01Pose", "BindPose"),
+         [_pose_node(HIPS, _translation(0.0, 100.0, 0.0)), _pose_node(SPINE, _translation(0.0, 110.0, 0.0))]),
+        # Skipped by the reader
+        ('Geometry', (60, "Body\x00\x01Geometry", "Mesh"), [('Vertices', (np.zeros(9, dtype='<f8'),))]),
+    ]
+    connections = [
+        ('OO', HIPS, 0), ('OO', SPINE, HIPS), ('OO', LAYER, STACK),
+        ('OO', HIPS_T, LAYER), ('OO', SPINE_R, LAYER),
+        ('OP', HIPS_T, HIPS, 'Lcl Translation'), ('OP', SPINE_R, SPINE, 'Lcl Rotation'),
+        ('OP', CURVE_X, HIPS_T, 'd|X'), ('OP', CURVE_Y, HIPS_T, 'd|Y'), ('OP', CURVE_Z, HIPS_T, 'd|Z'),
+        ('OP', CURVE_RZ, SPINE_R, 'd|Z'),
+    ]
+    return _Writer(version).file([
+        ('FBXHeaderExtension', (), [('FBXVersion', (('I', version),))]),
+        ('GlobalSettings', (), [_properties70(_p('TimeMode', ('I', 6)))]),
+        ('Objects', (), objects),
+        ('Connections', (), [('C', c) for c in connections]),
+    ])
+
+
+class ReadAnimationsTest(unittest.TestCase):
+
+    def read(self, version=7400):
+        animations = fbxanim.read_animations(sample_fbx(version))
+        self.assertEqual(len(animations), 1)
+        return animations[0]
+
+    def test_stack(self):
+        animation = self.read()
+        self.assertEqual(animation.name, "mixamo.com")
+        self.assertEqual(animation.fps, 30.0)
+        self.assertEqual(sorted(track.bone for track in animation.tracks), ["mixamorig:Hips", "mixamorig:Spine"])
+
+    def test_translation(self):
+        for version in (7400, 7500):
+            hips = {track.bone: track for track in self.read(version).tracks}["mixamorig:Hips"]
+            # First key on frame 1 like blender's importer
+            np.testing.assert_allclose(hips.frames, [1.0, 2.0, 3.0])
+            np.testing.assert_allclose(hips.location, [[0, 0, 0], [5, 0, 0], [10, 0, 0]], atol=1e-5)
+            np.testing.assert_allclose(hips.rotation_quaternion, [[1, 0, 0, 0]] * 3, atol=1e-6)
+            np.testing.assert_allclose(hips.scale, np.ones((3, 3)), atol=1e-6)
+
+    def test_rotation_and_bind_pose(self):
+        spine = {track.bone: track for track in self.read().tracks}["mixamorig:Spine"]
+        np.testing.assert_allclose(spine.frames, [1.0, 2.0, 3.0, 4.0])
+        # Relative to the bind pose, not to the static translation
+        np.testing.assert_allclose(spine.location, [[0, 2, 0]] * 4, atol=1e-5)
+        half = np.radians([0.0, 30.0, 60.0, 90.0]) / 2
+        expected = np.stack((np.cos(half), np.zeros(4), np.zeros(4), np.sin(half)), axis=1)
+        np.testing.assert_allclose(spine.rotation_quaternion, expected, atol=1e-6)
+
+    def test_not_fbx(self):
+        with self.assertRaises(ValueError):
+            fbxanim.read_animations(b"; FBX 7.4.0 project file\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
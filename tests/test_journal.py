@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# journal: records survive a reload, changed and missing files are not taken as completed.
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import journal
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.write("Walk.fbx", b"fbx")
+
+    def write(self, name, data):
+        with open(os.path.join(self.source, name), 'wb') as f:
+            f.write(data)
+
+    def test_resume(self):
+        batch_journal = journal.Journal(self.source)
+        batch_journal.record("Walk.fbx", journal.DONE, "Walk")
+        # A line cut off by a crash
+        with open(batch_journal.path, 'a') as f:
+            f.write('{"file": "Run.fbx", "sta')
+        resumed = journal.Journal(self.source, resume=True)
+        self.assertEqual(list(resumed.records), ["Walk.fbx"])
+        self.assertEqual(resumed.completed("Walk.fbx")['action'], "Walk")
+
+    def test_changed_file(self):
+        batch_journal = journal.Journal(self.source)
+        batch_journal.record("Walk.fbx", journal.DONE, "Walk")
+        self.write("Walk.fbx", b"a longer fbx")
+        self.assertIsNone(batch_journal.completed("Walk.fbx"))
+
+    def test_failed_file(self):
+        batch_journal = journal.Journal(self.source)
+        batch_journal.record("Walk.fbx", journal.FAILED, error="broken")
+        self.assertIsNone(batch_journal.completed("Walk.fbx"))
+
+    def test_record_missing_file(self):
+        batch_journal = journal.Journal(self.source)
+        os.remove(os.path.join(self.source, "Walk.fbx"))
+        record = batch_journal.record("Walk.fbx", journal.FAILED, error="removed while importing")
+        self.assertEqual((record['size'], record['mtime']), (None, None))
+        self.assertEqual(journal.Journal.load(batch_journal.path)["Walk.fbx"]['error'], "removed while importing")
+        self.assertEqual(batch_journal.counts[journal.FAILED], 1)
+        # Back with the same name it is imported again
+        self.write("Walk.fbx", b"fbx")
+        self.assertIsNone(batch_journal.completed("Walk.fbx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
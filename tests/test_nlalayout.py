@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# nlalayout: where clips are placed, and that appending to a long track does not walk its strips.
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nlalayout
+
+
+class CountingList(list):
+    '''List counting the reads by index, bisect and the placing loop both go through __getitem__'''
+
+    reads = 0
+
+    def __getitem__(self, i):
+        CountingList.reads += 1
+        return list.__getitem__(self, i)
+
+
+class LayoutTest(unittest.TestCase):
+
+    def test_pack(self):
+        layout = nlalayout.Layout('pack', max_tracks=2, gap=10)
+        self.assertEqual(layout.place("Walk", 30), ("Clips 1", 0))
+        self.assertEqual(layout.place("Run", 20), ("Clips 2", 0))
+        # Clips 2 ends first
+        self.assertEqual(layout.place("Jump", 5), ("Clips 2", 30))
+        self.assertEqual(layout.place("Idle", 5), ("Clips 1", 40))
+
+    def test_category(self):
+        layout = nlalayout.Layout('category', gap=5, name_prefix="ctrl_")
+        self.assertEqual(layout.place("ctrl_Walk_02", 10), ("Walk", 0))
+        self.assertEqual(layout.place("ctrl_Walk (3)", 10), ("Walk", 15))
+        self.assertEqual(layout.place("ctrl_Jump.001", 10), ("Jump", 0))
+
+    def test_reserve(self):
+        layout = nlalayout.Layout('pack', max_tracks=1, gap=10)
+        layout.reserve("Clips 1", 0, 100, "Existing")
+        self.assertEqual(layout.place("Walk", 30), ("Clips 1", 110))
+        # An explicit start fills a free range before the last strip
+        layout.reserve("Clips 1", 300, 400, "Later")
+        self.assertEqual(layout.place("Jump", 20, frame_start=0), ("Clips 1", 150))
+        with self.assertRaises(ValueError):
+            layout.reserve("Clips 1", 390, 420, "Overlapping")
+
+    def test_manifest(self):
+        layout = nlalayout.Layout('pack', max_tracks=1, gap=0, start_frame=1)
+        layout.place("Walk", 30)
+        self.assertEqual(layout.manifest(), {"Walk": {'track': "Clips 1", 'frame_start': 1, 'frame_end': 31}})
+
+    def test_append_is_logarithmic(self):
+        layout = nlalayout.Layout('pack', max_tracks=1, gap=10)
+        for i in range(20000):
+            layout.place("Clip %d" % i, 30)
+        index = layout.tracks["Clips 1"]
+        index.starts = CountingList(index.starts)
+        CountingList.reads = 0
+        self.assertEqual(layout.place("Last", 30), ("Clips 1", 20000 * 40))
+        # A few binary searches over 20000 strips, not a walk past them
+        self.assertLess(CountingList.reads, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# reduction: reduced curves stay within the tolerance under linear interpolation.
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fcurves
+import reduction
+from benchmarks import fakebpy
+
+
+def make_action(data, channels):
+    '''Action with a bezier key per frame of each {data path: values}'''
+    action = data.actions.new("Clip")
+    for data_path, values in channels.items():
+        frames = np.arange(1, len(values) + 1, dtype=np.float64)
+        fc = action.fcurves.new(data_path, 0, "Hips")
+        fc.keyframe_points._assign(np.column_stack((frames, values)), np.full(len(values), 2, dtype=np.int32))
+    return action
+
+
+class ReductionTest(unittest.TestCase):
+
+    def test_simplify(self):
+        frames = np.arange(100, dtype=np.float64)
+        values = np.sin(frames / 10.0)
+        kept = reduction.simplify(frames, values, 0.01)
+        self.assertEqual((kept[0], kept[-1]), (0, 99))
+        self.assertLess(len(kept), 50)
+        error = np.abs(np.interp(frames, frames[kept], values[kept]) - values)
+        self.assertLessEqual(error.max(), 0.01)
+
+    def test_reduce_action(self):
+        data = fakebpy.BlendData()
+        action = make_action(data, {'pose.bones["Hips"].location': np.linspace(0.0, 10.0, 50),
+                                    'pose.bones["Hips"].scale': np.ones(50)})
+        stats = reduction.reduce_action(action)
+        self.assertEqual(stats['location'], [50, 2])
+        self.assertEqual(stats['scale'], [50, 2])
+        keys = fcurves.read_keys(action.fcurves.find('pose.bones["Hips"].location'))
+        np.testing.assert_array_equal(keys['co'], [[1.0, 0.0], [50.0, 10.0]])
+        # Linear between the kept keys, like the error was measured
+        np.testing.assert_array_equal(keys['interpolation'], [fcurves.LINEAR] * 2)
+
+    def test_skipped_channel_type(self):
+        data = fakebpy.BlendData()
+        action = make_action(data, {'pose.bones["Hips"].location': np.linspace(0.0, 10.0, 50),
+                                    'pose.bones["Hips"].scale': np.ones(50)})
+        stats = reduction.reduce_action(action, {'scale': None})
+        self.assertEqual(stats['scale'], [0, 0])
+        self.assertEqual(len(action.fcurves.find('pose.bones["Hips"].scale').keyframe_points), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# resample: frame rate changes keep the curve values, quaternions stay unit length.
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fcurves
+import resample
+from benchmarks import fakebpy
+from benchmarks import synthetic
+
+
+class ResampleTest(unittest.TestCase):
+
+    def test_sample_times(self):
+        np.testing.assert_allclose(resample.sample_times(1.0, 10.0, 60.0, 30.0), [1, 3, 5, 7, 9, 10])
+        np.testing.assert_allclose(resample.sample_times(0.0, 2.0, 30.0, 60.0), [0, 0.5, 1, 1.5, 2])
+
+    def test_sample_channels(self):
+        # Two channels of different key ranges, each clamped to its own
+        frames = np.array([0.0, 10.0, 5.0, 6.0])
+        values = np.array([0.0, 10.0, 1.0, 2.0])
+        sampled = resample.sample_channels(frames, values, np.array([2, 2]), np.array([0.0, 5.5, 10.0]))
+        np.testing.assert_allclose(sampled, [[0.0, 5.5, 10.0], [1.0, 1.5, 2.0]])
+
+    def test_resample_action(self):
+        data = fakebpy.BlendData()
+        action = synthetic.make_clip(data, "Walk", frames=61)
+        channels = len(action.fcurves)
+        before, after = resample.resample_action(action, target_fps=30.0, source_fps=60.0, start_frame=1.0)
+        self.assertEqual((before, after), (channels * 61, channels * 31))
+        self.assertEqual(action.frame_range, (1.0, 31.0))
+        resampled = fcurves.read_action(action)
+        rotation = [i for i, path in enumerate(resampled['data_paths']) if path == 'pose.bones["mixamorig:Hips"].rotation_quaternion']
+        starts = np.cumsum(resampled['counts']) - resampled['counts']
+        quaternions = np.stack([resampled['co'][starts[i]:starts[i] + 31, 1] for i in rotation], axis=1)
+        np.testing.assert_allclose(np.linalg.norm(quaternions, axis=1), 1.0, atol=1e-5)
+
+    def test_shift_only(self):
+        data = fakebpy.BlendData()
+        action = synthetic.make_clip(data, "Walk", frames=10)
+        original = fcurves.read_action(action)
+        resample.resample_action(action, target_fps=0, start_frame=0.0)
+        shifted = fcurves.read_action(action)
+        np.testing.assert_array_equal(shifted['co'][:, 1], original['co'][:, 1])
+        np.testing.assert_array_equal(shifted['co'][:, 0], original['co'][:, 0] - 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
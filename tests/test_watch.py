@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# watch.import_batch on the fakebpy stand-in: files only count as done in the journal once the
+# target was saved, so a crash before the save imports them again.
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import journal
+import watch
+from benchmarks import fakebpy
+
+
+class FakeMixamoRoot:
+    '''import_armature creates an action named after the file, or raises for names in failing'''
+
+    def __init__(self, data, failing=()):
+        self.data = data
+        self.failing = failing
+
+    def import_armature(self, filepath, *args):
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        if name in self.failing:
+            raise RuntimeError("broken file")
+        return self.data.actions.new(name)
+
+class FakeSession:
+    def begin_file(self):
+        pass
+
+    def end_file(self, name):
+        pass
+
+
+class ImportBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        for name in ("Walk.fbx", "Run.fbx"):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(b"fbx")
+        self.args = watch.parse_args(['--source', self.source, '--output', "library.blend"])
+        self.saved = []
+        data = fakebpy.BlendData()
+        bpy = types.SimpleNamespace(data=data, context=types.SimpleNamespace(scene=types.SimpleNamespace(objects=[])),
+                                    ops=types.SimpleNamespace(wm=types.SimpleNamespace(save_as_mainfile=self.save)))
+        self.bpy_before = watch.bpy
+        watch.bpy = bpy
+        self.addCleanup(setattr, watch, 'bpy', self.bpy_before)
+        self.journal = journal.Journal(self.source, resume=True)
+        self.save_error = None
+
+    def save(self, filepath):
+        if self.save_error:
+            raise self.save_error
+        # Nothing is recorded done before the target is on disk
+        self.saved.append(dict(self.journal.records))
+
+    def import_batch(self, failing=()):
+        return watch.import_batch(FakeMixamoRoot(watch.bpy.data, failing), self.args, ["Run.fbx", "Walk.fbx"],
+                                  self.journal, FakeSession(), "library.blend")
+
+    def test_done_after_save(self):
+        self.assertEqual(self.import_batch(), 2)
+        self.assertEqual(self.saved, [{}])
+        records = journal.Journal.load(self.journal.path)
+        self.assertEqual({file: record['status'] for file, record in records.items()},
+                         {"Run.fbx": journal.DONE, "Walk.fbx": journal.DONE})
+        self.assertEqual(records["Walk.fbx"]['action'], "Walk")
+
+    def test_crash_before_save(self):
+        self.save_error = RuntimeError("blender crashed")
+        with self.assertRaises(RuntimeError):
+            self.import_batch()
+        # A restarted watcher finds nothing done and imports both files again
+        self.assertEqual(journal.Journal.load(self.journal.path), {})
+
+    def test_failed_file(self):
+        self.assertEqual(self.import_batch(failing=("Run",)), 1)
+        records = journal.Journal.load(self.journal.path)
+        self.assertEqual(records["Run.fbx"]['status'], journal.FAILED)
+        self.assertEqual(records["Walk.fbx"]['status'], journal.DONE)
+        self.assertEqual(self.saved, [{"Run.fbx": records["Run.fbx"]}])
+
+
+if __name__ == "__main__":
+    unittest.main()
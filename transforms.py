@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Batched rotation math on numpy arrays, one row per frame. Quaternions are (n, 4) w, x, y, z like
+# blender's rotation_quaternion, matrices (n, 3, 3) for column vectors like mathutils.
+import numpy as np
+
+
+EULER_ORDERS = ('XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX')
+
+
+def quaternion_multiply(a, b):
+    '''Hamilton product of (n, 4) quaternions'''
+    aw, ax, ay, az = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bw, bx, by, bz = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw), axis=1)
+
+def quaternion_conjugate(q):
+    return q * np.array((1.0, -1.0, -1.0, -1.0))
+
+def quaternion_rotate(q, v):
+    '''Rotates (n, 3) vectors by (n, 4) unit quaternions'''
+    w = q[:, :1]
+    u = q[:, 1:]
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+def axis_quaternions(angles, axis):
+    '''Rotations of angles (radians) around coordinate axis 0, 1 or 2'''
+    q = np.zeros((len(angles), 4))
+    q[:, 0] = np.cos(angles / 2.0)
+    q[:, 1 + axis] = np.sin(angles / 2.0)
+    return q
+
+def make_continuous(q):
+    '''Flips quaternions into the hemisphere of their predecessor so interpolation takes the short way'''
+    q = np.array(q, dtype=np.float64)
+    if len(q) > 1:
+        flips = np.where(np.einsum('ij,ij->i', q[1:], q[:-1]) < 0.0, -1.0, 1.0)
+        q[1:] *= np.cumprod(flips)[:, None]
+    return q
+
+def matrices_to_quaternions(m):
+    '''(n, 3, 3) rotation matrices -> (n, 4) continuous quaternions'''
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+    w = np.sqrt(np.maximum(0.0, 1.0 + m00 + m11 + m22)) / 2.0
+    x = np.copysign(np.sqrt(np.maximum(0.0, 1.0 + m00 - m11 - m22)) / 2.0, m[:, 2, 1] - m[:, 1, 2])
+    y = np.copysign(np.sqrt(np.maximum(0.0, 1.0 - m00 + m11 - m22)) / 2.0, m[:, 0, 2] - m[:, 2, 0])
+    z = np.copysign(np.sqrt(np.maximum(0.0, 1.0 - m00 - m11 + m22)) / 2.0, m[:, 1, 0] - m[:, 0, 1])
+    q = np.stack((w, x, y, z), axis=1)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return make_continuous(q)
+
+def quaternions_to_matrices(q):
+    '''(n, 4) quaternions -> (n, 3, 3) rotation matrices'''
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    m = np.empty((len(q), 3, 3))
+    m[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    m[:, 0, 1] = 2.0 * (x * y - w * z)
+    m[:, 0, 2] = 2.0 * (x * z + w * y)
+    m[:, 1, 0] = 2.0 * (x * y + w * z)
+    m[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    m[:, 1, 2] = 2.0 * (y * z - w * x)
+    m[:, 2, 0] = 2.0 * (x * z - w * y)
+    m[:, 2, 1] = 2.0 * (y * z + w * x)
+    m[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return m
+
+def euler_matrices(angles, order='XYZ'):
+    '''(n, 3) euler angles in radians -> (n, 3, 3) matrices, the first axis of order is applied first'''
+    angles = np.asarray(angles, dtype=np.float64)
+    n = len(angles)
+    rotation = np.broadcast_to(np.eye(3), (n, 3, 3)).copy()
+    for axis in order:
+        i = 'XYZ'.index(axis)
+        j, k = (i + 1) % 3, (i + 2) % 3
+        c = np.cos(angles[:, i])
+        s = np.sin(angles[:, i])
+        m = np.zeros((n, 3, 3))
+        m[:, i, i] = 1.0
+        m[:, j, j] = c
+        m[:, k, k] = c
+        m[:, j, k] = -s
+        m[:, k, j] = s
+        rotation = m @ rotation
+    return rotation
+
+def matrices_to_euler(m, order='XYZ'):
+    '''(n, 3, 3) rotation matrices -> (n, 3) continuous euler angles in radians'''
+    i, j, k = ('XYZ'.index(axis) for axis in order)
+    # +1 for cyclic orders (XYZ, YZX, ZXY)
+    parity = 1.0 if (j - i) % 3 == 1 else -1.0
+    angles = np.empty((len(m), 3))
+    angles[:, j] = np.arcsin(np.clip(-parity * m[:, k, i], -1.0, 1.0))
+    angles[:, i] = np.arctan2(parity * m[:, k, j], m[:, k, k])
+    angles[:, k] = np.arctan2(parity * m[:, j, i], m[:, i, i])
+    return np.unwrap(angles, axis=0)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+'''
+    Copyright (C) 2022  Richard Perry
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Watch folder importer. Keeps one headless blender running with the import code loaded and the
+# target .blend open, polls the source directory and imports every file that arrives (or changes)
+# through import_armature as soon as it has stopped growing for --settle seconds, then saves the
+# target. Startup is paid once, so a dropped file is in the library a few seconds later.
+# Imported files are recorded in the source directory's journal (see journal.py) once the target
+# is saved, a restarted watcher only picks up what arrived while it was down or never made it into
+# the saved target; a file that failed is retried once it changes.
+#
+# Usage, from a shell:
+#   blender --background --python watch.py -- --source ./drop --output library.blend --insert-root
+#   python watch.py --blender /path/to/blender --source ./drop --output library.blend --insert-root
+# Run from plain python, blender is started as a child and started again if it exits with an error.
+# Stop with Ctrl+C (or SIGTERM), --once imports what is there and exits.
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+try:
+    from . import batch
+    from . import discovery
+    from . import journal
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import batch
+    import discovery
+    import journal
+
+
+log = logging.getLogger(__name__)
+
+# Seconds between two scans of the source directory
+DEFAULT_INTERVAL = 1.0
+# Seconds a file's size and modification time must stay the same before it is imported
+DEFAULT_SETTLE = 2.0
+# Seconds before a blender that exited with an error is started again
+RESTART_DELAY = 5.0
+
+
+class FolderWatcher:
+    '''Files of a source directory that are new or changed and have not changed for settle seconds.
+
+    handled(file, (size, mtime)) tells files that were already imported in that state.
+    '''
+
+    def __init__(self, source_dir, recursive=False, pattern=discovery.DEFAULT_PATTERN, settle=DEFAULT_SETTLE, handled=None):
+        self.source_dir = source_dir
+        self.recursive = recursive
+        self.pattern = pattern
+        self.settle = settle
+        self.handled = handled or (lambda file, stat: False)
+        # file -> ((size, mtime), time it was first seen like that)
+        self.pending = {}
+
+    def poll(self, now=None):
+        '''Files ready to import, by name'''
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        for file, _ in discovery.scan(self.source_dir, self.recursive, self.pattern):
+            try:
+                stat = journal.file_stat(os.path.join(self.source_dir, file))
+            except OSError:
+                # Removed or renamed since the scan
+                continue
+            seen.add(file)
+            if self.handled(file, stat):
+                self.pending.pop(file, None)
+                continue
+            previous = self.pending.get(file)
+            if previous is None or previous[0] != stat:
+                self.pending[file] = previous = (stat, now)
+            if now - previous[1] >= self.settle:
+                ready.append(file)
+        for file in set(self.pending) - seen:
+            del self.pending[file]
+        return sorted(ready)
+
+
+# Set by SIGTERM, the watcher stops after the current batch of files
+_stop_requested = []
+
+def _stop(signum, frame):
+    _stop_requested.append(signum)
+
+def import_files(mixamoroot, args, files, batch_journal, batch_session):
+    '''Imports files (names in args.source) into the open blend file. Returns [(file, action name)]
+    of the files imported, failed files are recorded in the journal right away
+    '''
+    imported = []
+    has_armature = any(obj.type == 'ARMATURE' for obj in bpy.context.scene.objects)
+    for file in files:
+        filepath = os.path.join(args.source, file)
+        previous = batch_journal.records.get(file)
+        # A changed file: its new action replaces the one imported before, once it is in
+        replaced = bpy.data.actions.get(previous['action']) if previous and previous.get('action') else None
+        batch_session.begin_file()
+        old_objs = set(bpy.context.scene.objects)
+        try:
+            action = mixamoroot.import_armature(filepath, args.root_name, args.hip_name, args.remove_prefix,
+                                                args.name_prefix, args.insert_root, args.delete_armatures, args.unit_scale,
+                                                batch.root_motion_options(args), batch.key_reduction_options(args),
+                                                args.target_prefix, batch.resampling_options(args))
+        except Exception as e:
+            log.error("[Mixamo Root] ERROR watch raised %s when processing %s" % (str(e), filepath))
+            batch_journal.record(file, journal.FAILED, error=str(e))
+            batch_session.end_file(file)
+            continue
+        action.use_fake_user = True
+        if replaced is not None:
+            name = replaced.name
+            bpy.data.actions.remove(replaced)
+            action.name = name
+        imported_objects = set(bpy.context.scene.objects) - old_objs
+        if not has_armature:
+            # The first armature stays, the library needs a rig to play the actions on
+            has_armature = True
+        elif args.delete_armatures:
+            for obj in imported_objects:
+                bpy.data.objects.remove(obj, do_unlink=True)
+        batch_session.end_file(file)
+        imported.append((file, action.name))
+    return imported
+
+def import_batch(mixamoroot, args, files, batch_journal, batch_session, output):
+    '''Imports files and saves the target. Returns the number imported.
+
+    Files are recorded done only once the target is saved, after a crash in between the restarted
+    watcher imports them again instead of taking them for being in the saved file.
+    '''
+    imported = import_files(mixamoroot, args, files, batch_journal, batch_session)
+    if imported:
+        bpy.ops.wm.save_as_mainfile(filepath=output)
+        for file, action_name in imported:
+            batch_journal.record(file, journal.DONE, action_name)
+    return len(imported)
+
+def run_watch(args):
+    '''Imports files as they arrive in args.source into args.output until stopped'''
+    mixamoroot = batch._mixamoroot()
+    output = os.path.abspath(args.output)
+    if os.path.exists(output):
+        bpy.ops.wm.open_mainfile(filepath=output)
+    else:
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+    if args.fps:
+        render = bpy.context.scene.render
+        render.fps = max(1, int(round(args.fps)))
+        render.fps_base = render.fps / args.fps
+
+    batch_journal = journal.Journal(args.source, resume=True)
+    def handled(file, stat):
+        record = batch_journal.records.get(file)
+        return record is not None and (record.get('size'), record.get('mtime')) == stat
+    watcher = FolderWatcher(args.source, args.recursive, args.pattern, 0.0 if args.once else args.settle, handled)
+    # Purge and undo off only: flushed actions would be missing from the saved target, and the
+    # journal would keep them from being imported again
+    if args.memory_budget:
+        log.warning("[Mixamo Root] watch: --memory-budget is ignored, every action stays in the target")
+    batch_session = mixamoroot.session.Session(bpy.data, bpy.context.preferences)
+    signal.signal(signal.SIGTERM, _stop)
+    print("[Mixamo Root] watch: %s -> %s, Ctrl+C to stop" % (args.source, output))
+    try:
+        while True:
+            files = watcher.poll()
+            if files:
+                imported = import_batch(mixamoroot, args, files, batch_journal, batch_session, output)
+                if imported:
+                    # Drop to saved: time since the newest of the files was last written
+                    newest = max(batch_journal.records[file]['mtime'] for file in files)
+                    print("[Mixamo Root] watch: %d of %d files imported, saved %.1fs after the last arrived (%s)" %
+                          (imported, len(files), time.time() - newest, batch_journal.summary()))
+            if args.once or _stop_requested:
+                break
+            time.sleep(args.interval)
+        print("[Mixamo Root] watch: stopped")
+    except KeyboardInterrupt:
+        print("[Mixamo Root] watch: stopped")
+    finally:
+        batch_session.close()
+    return 0
+
+def run_supervisor(args, argv):
+    '''Runs the watcher in a background blender, starting it again when it exits with an error'''
+    cmd = [args.blender, '--background', '--factory-startup', '--python', os.path.abspath(__file__), '--'] + argv
+    while True:
+        process = subprocess.Popen(cmd)
+        try:
+            code = process.wait()
+        except KeyboardInterrupt:
+            # Ctrl+C reached blender too, let it save and stop
+            return process.wait()
+        if code == 0 or args.once:
+            return code
+        log.warning("[Mixamo Root] watch: blender exited with code %d, starting again in %.0fs" % (code, RESTART_DELAY))
+        time.sleep(RESTART_DELAY)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Imports mixamo animations into a .blend as they arrive in a folder")
+    parser.add_argument('--source', required=True, help="Directory watched for mixamo animation files (.fbx)")
+    parser.add_argument('--output', required=True, help="Target .blend, created if it does not exist")
+    parser.add_argument('--blender', default=bpy.app.binary_path if bpy else "blender",
+                        help="Blender executable, when started from plain python")
+    parser.add_argument('--recursive', action='store_true', help="Also watch sub directories of --source")
+    parser.add_argument('--pattern', default=discovery.DEFAULT_PATTERN, help="File name pattern of the files to import")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between two scans of --source")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help="Seconds a file must stay unchanged before it is imported, so files still being copied are left alone")
+    parser.add_argument('--once', action='store_true', help="Import the files there now and exit")
+    batch.add_settings_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        # Blender passes script arguments after '--'
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if bpy is None:
+        return run_supervisor(args, argv)
+    return run_watch(args)
+
+
+if __name__ == "__main__":
+    code = main()
+    if bpy is None or bpy.app.background:
+        sys.exit(code)